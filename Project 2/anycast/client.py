@@ -1,27 +1,299 @@
 """
 Task 1: Anycast (TCP)
 Description: This client connects to the service name "server" within the Docker Compose network. Each connection may reach a different server instance, demonstrating load-balanced "Anycast" behavior.
+
+Server selection (--strategy):
+    random  pick any server and open a new connection every time (the original behaviour)
+    p2c     power-of-two-choices: sample two healthy servers and use the one with the lower
+            EWMA latency (weighted by requests in flight). Connections are kept alive and reused,
+            new ones are opened happy-eyeballs style (a second server is tried if the first has
+            not answered within --stagger seconds), and a background health check takes
+            failing servers out of rotation until they accept connections again.
+Per-server success/latency stats are printed at the end, so both strategies can be compared
+under the same load (--requests, --concurrency).
 """
 
 import socket
 import random
 import time
+import os
+import argparse
+import selectors
+import errno
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 SERVERS = ["172.19.0.2", "172.19.0.3", "172.19.0.4"]
 PORT = 5000
+SERVICE_NAME = os.getenv("ANYCAST_SERVICE", "server") # Docker Compose DNS name of the server replicas
 
-def main():
-    for attempt in range(3):
-        server_ip = random.choice(SERVERS)
-        print(f"[client] attempting connection to anycast -> {server_ip}:{PORT}")
+def discover_servers():
+    """Servers from ANYCAST_SERVERS, else every address the service name resolves to, else SERVERS."""
+    configured = os.getenv("ANYCAST_SERVERS")
+    if configured:
+        return [s.strip() for s in configured.split(",") if s.strip()]
+    try:
+        infos = socket.getaddrinfo(SERVICE_NAME, PORT, socket.AF_INET, socket.SOCK_STREAM)
+        resolved = sorted({info[4][0] for info in infos})
+        if resolved:
+            return resolved
+    except socket.gaierror:
+        pass
+    return SERVERS
+
+class ServerState: # What the client knows about one server: health, latency, idle connections.
+    def __init__(self, address, alpha):
+        self.address = address
+        self.alpha = alpha
+        self.ewma = None # seconds
+        self.healthy = True
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.reused = 0
+        self.latencies = []
+        self.idle = [] # (sock, reader) connections kept alive for reuse
+
+    def score(self):
+        # Unmeasured servers score 0 so every server gets tried at least once.
+        return (self.ewma or 0.0) * (self.in_flight + 1)
+
+    def observe(self, seconds):
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+class AnycastClient:
+    def __init__(self, servers, port=PORT, strategy="p2c", timeout=3.0, stagger=0.25,
+                 alpha=0.3, max_idle=8, health_interval=2.0):
+        self.port = port
+        self.strategy = strategy
+        self.timeout = timeout
+        self.stagger = stagger
+        self.max_idle = max_idle
+        self.states = [ServerState(s, alpha) for s in servers]
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        if strategy == "p2c" and health_interval > 0:
+            threading.Thread(target=self.health_loop, args=(health_interval,), daemon=True).start()
+
+    # --- selection ---
+
+    def ranked(self):
+        """Servers in the order to try them: the power-of-two-choices winner first."""
+        with self.lock:
+            healthy = [s for s in self.states if s.healthy] or list(self.states)
+            if self.strategy == "random":
+                return [random.choice(self.states)]
+            pair = random.sample(healthy, min(2, len(healthy)))
+            pair.sort(key=ServerState.score)
+            rest = sorted((s for s in healthy if s not in pair), key=ServerState.score)
+            return pair + rest
+
+    # --- connections ---
+
+    def connect_any(self, candidates):
+        """
+        Happy-eyeballs connect: start with the first candidate and start the next
+        one every `stagger` seconds until one connects. Returns (state, sock) or (None, None).
+        """
+        sel = selectors.DefaultSelector()
+        pending = {}
+        queue = list(candidates)
+        deadline = time.monotonic() + self.timeout
+        next_start = time.monotonic()
         try:
-            with socket.create_connection((server_ip, PORT), timeout=3) as sock:
-                data = sock.recv(1024)
-                print(f"[client] received: {data.decode()}")
-        except Exception as e:
-            print(f"[client] connection failed: {e}")
-        time.sleep(1)
+            while time.monotonic() < deadline and (queue or pending):
+                now = time.monotonic()
+                if queue and (now >= next_start or not pending):
+                    state = queue.pop(0)
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    err = sock.connect_ex((state.address, self.port))
+                    if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        sock.close()
+                        self.failed(state)
+                        continue
+                    pending[sock] = state
+                    sel.register(sock, selectors.EVENT_WRITE)
+                    next_start = now + self.stagger
+                wait = min(deadline, next_start if queue else deadline) - time.monotonic()
+                for key, _ in sel.select(max(0.0, wait)):
+                    sock = key.fileobj
+                    state = pending.pop(sock)
+                    sel.unregister(sock)
+                    if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                        sock.setblocking(True)
+                        sock.settimeout(self.timeout)
+                        return state, sock
+                    sock.close()
+                    self.failed(state)
+            for state in pending.values():
+                self.failed(state)
+            return None, None
+        finally:
+            for sock in pending:
+                sock.close()
+            sel.close()
+
+    def failed(self, state):
+        with self.lock:
+            state.failures += 1
+            state.healthy = False
+        self.drop_idle(state)
+
+    def drop_idle(self, state):
+        """Close every kept-alive connection to a server."""
+        with self.lock:
+            idle, state.idle = state.idle, []
+        for sock, _ in idle:
+            sock.close()
+
+    def checkout(self, reuse=True):
+        """An idle kept-alive connection to the best server (if `reuse`), or a freshly connected one."""
+        candidates = self.ranked()
+        if self.strategy == "p2c" and reuse:
+            with self.lock:
+                for state in candidates[:2]:
+                    if state.idle:
+                        sock, reader = state.idle.pop()
+                        state.in_flight += 1
+                        return state, sock, reader, True
+        state, sock = self.connect_any(candidates)
+        if sock is None:
+            return None, None, None, False
+        with self.lock:
+            state.in_flight += 1
+        return state, sock, sock.makefile("rb"), False
+
+    def checkin(self, state, sock, reader, ok):
+        with self.lock:
+            state.in_flight -= 1
+            if ok and self.strategy == "p2c" and len(state.idle) < self.max_idle and not self.stop.is_set():
+                state.idle.append((sock, reader))
+                return
+        sock.close()
+
+    # --- requests ---
+
+    def request(self):
+        """One greeting from some server. Returns (server, reply) or (None, error message)."""
+        reuse = True
+        while True:
+            start = time.perf_counter()
+            state, sock, reader, reused = self.checkout(reuse)
+            if state is None:
+                return None, "no server reachable"
+            try:
+                if reused:
+                    sock.sendall(b"hello\n")
+                reply = reader.readline()
+                if not reply:
+                    raise ConnectionError("connection closed")
+            except OSError as e:
+                self.checkin(state, sock, reader, ok=False)
+                if reused:
+                    # The server closed this idle connection, most likely
+                    # with the others it kept (--idle-timeout, a restart):
+                    # drop them all and retry once on a new connection.
+                    self.drop_idle(state)
+                    reuse = False
+                    continue
+                self.failed(state)
+                return None, f"{state.address}: {e}"
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                state.successes += 1
+                state.reused += reused
+                state.healthy = True
+                state.observe(elapsed)
+                state.latencies.append(elapsed)
+            self.checkin(state, sock, reader, ok=True)
+            return state.address, reply.decode().strip()
+
+    def health_loop(self, interval): # Probe every server with a plain connect; brings failed servers back.
+        while not self.stop.wait(interval):
+            for state in self.states:
+                start = time.perf_counter()
+                try:
+                    with socket.create_connection((state.address, self.port), timeout=self.timeout):
+                        pass
+                except OSError:
+                    self.failed(state)
+                    continue
+                with self.lock:
+                    state.healthy = True
+                    if state.ewma is None:
+                        state.observe(time.perf_counter() - start)
+
+    def close(self):
+        self.stop.set()
+        with self.lock:
+            for state in self.states:
+                for sock, _ in state.idle:
+                    sock.close()
+                state.idle.clear()
+
+    def stats(self):
+        rows = []
+        with self.lock:
+            for s in self.states:
+                lat = sorted(s.latencies)
+                pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 3) if lat else None
+                rows.append({
+                    "server": s.address,
+                    "healthy": s.healthy,
+                    "ok": s.successes,
+                    "failed": s.failures,
+                    "reused": s.reused,
+                    "ewma_ms": round(s.ewma * 1000, 3) if s.ewma is not None else None,
+                    "p50_ms": pick(0.5),
+                    "p99_ms": pick(0.99),
+                })
+        return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Anycast TCP client")
+    parser.add_argument("--servers", help="Comma-separated server addresses (default: resolve the service name)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--strategy", choices=["random", "p2c"], default=os.getenv("CLIENT_STRATEGY", "p2c"))
+    parser.add_argument("--requests", type=int, default=3, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once")
+    parser.add_argument("--interval", type=float, default=1.0, help="Pause after each request (per worker)")
+    parser.add_argument("--timeout", type=float, default=3.0, help="Connect/read timeout in seconds")
+    parser.add_argument("--stagger", type=float, default=0.25, help="Happy-eyeballs delay before trying the next server")
+    parser.add_argument("--health-interval", type=float, default=2.0, help="Seconds between health checks (0 = off)")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    servers = args.servers.split(",") if args.servers else discover_servers()
+    client = AnycastClient(servers, args.port, args.strategy, args.timeout, args.stagger,
+                           health_interval=args.health_interval)
+    print(f"[client] {args.strategy} over {len(servers)} servers: {', '.join(servers)}")
+
+    def run(n):
+        for _ in range(n):
+            server, reply = client.request()
+            if not args.quiet:
+                if server is None:
+                    print(f"[client] connection failed: {reply}")
+                else:
+                    print(f"[client] received from {server}: {reply}")
+            if args.interval:
+                time.sleep(args.interval)
+
+    shares = [args.requests // args.concurrency + (i < args.requests % args.concurrency) for i in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, shares))
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    rows = client.stats()
+    ok = sum(r["ok"] for r in rows)
+    print(f"[client] {ok}/{args.requests} requests ok in {elapsed:.2f}s ({ok / elapsed:.0f} req/s)")
+    ms = lambda v: "-" if v is None else f"{v}ms"
+    for r in rows:
+        print(f"[client]   {r['server']}: ok {r['ok']}, failed {r['failed']}, reused {r['reused']}, "
+              f"ewma {ms(r['ewma_ms'])}, p50 {ms(r['p50_ms'])}, p99 {ms(r['p99_ms'])}, healthy {r['healthy']}")
 
 if __name__ == "__main__":
     main()
-
@@ -3,37 +3,195 @@ Task 1: Anycast (TCP)
 Description: This server runs inside a Docker container and listens for incoming TCP client connections on port 5000. Multiple copies of this same container are launched (3 in total), each responding with its own unique message. When a client connects, Docker's internal DNS/load-balancer randomly routes the connection to one server instance,
 simulating an "Anycast" setup.
 
+Protocol: on connect the server sends one greeting line ("Hello from <name>\n"). In the async and threads
+modes a client that keeps the connection open may send more lines; each one is answered with another
+greeting line. A kept-alive connection that sends nothing for --idle-timeout seconds is closed.
+
+Serving modes (--mode):
+    serial   one connection at a time, closed right after the greeting (the original behaviour)
+    async    asyncio event loop: many connections at once, none blocks another
+    threads  a pool of --workers threads, one connection per thread while it is open
+--processes N starts N worker processes that each bind the port with SO_REUSEPORT, so the kernel
+spreads new connections across cores. Every process prints connection-rate and latency stats.
+
 Citation(s):
 1) DigitalOcean. (2025, February 21). Python Socket Programming: Server and Client Example Guide. Retrieved from https://www.digitalocean.com/community/tutorials/python-socket-programming-server-client#https://www.geeksforgeeks.org/python/how-to-capture-udp-packets-in-python/#
 2) GeeksforGeeks — “How to Capture UDP Packets in Python” GeeksforGeeks. (2025, July 23). How to Capture UDP Packets in Python. Retrieved from https://www.geeksforgeeks.org/python/how-to-capture-udp-packets-in-python/
+3) Python Software Foundation. (n.d.). asyncio — Streams. Retrieved from https://docs.python.org/3/library/asyncio-stream.html
 """
 
 # Host and Port Configuration
 import socket
 import os
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 HOST = "0.0.0.0"
 PORT = 5000
 
-def main():
-    server_name = os.getenv("HOSTNAME", "unknown-server")
-    print(f"[{server_name}] starting server on port {PORT}")
+class ServerStats: # Connection and request counters, printed every stats interval.
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.active = 0
+        self.requests = 0
+        self.latencies = [] # seconds from receiving a request (or accepting) to sending the reply
+
+    def record(self, seconds):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(seconds)
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen()
+    def opened(self):
+        with self.lock:
+            self.connections += 1
+            self.active += 1
 
+    def closed(self):
+        with self.lock:
+            self.active -= 1
+
+    def report_loop(self, interval):
+        last_conn = last_req = 0
         while True:
-            conn, addr = s.accept()
-            with conn:
+            time.sleep(interval)
+            with self.lock:
+                conns, reqs, active = self.connections, self.requests, self.active
+                lat, self.latencies = sorted(self.latencies), []
+            if conns == last_conn and reqs == last_req:
+                continue
+            p50 = lat[len(lat) // 2] * 1000 if lat else 0.0
+            p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000 if lat else 0.0
+            print(f"[{self.name}] {(conns - last_conn) / interval:.0f} conn/s, {(reqs - last_req) / interval:.0f} req/s, "
+                  f"{active} open, latency p50 {p50:.2f}ms p99 {p99:.2f}ms", flush=True)
+            last_conn, last_req = conns, reqs
+
+def make_listener(backlog, reuseport=False):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((HOST, PORT))
+    s.listen(backlog)
+    return s
+
+def serve_connection(conn, addr, server_name, stats, work, verbose, idle_timeout=None):
+    # Blocking handler (serial and thread modes). Without idle_timeout the connection is closed after
+    # the greeting, so one client can never hold up a serial server.
+    start = time.perf_counter()
+    stats.opened()
+    try:
+        with conn:
+            if verbose:
                 print(f"[{server_name}] connection from {addr}")
-                message = f"Hello from {server_name}"
-                conn.sendall(message.encode())
-                print(f"[{server_name}] sent: {message}")
+            message = f"Hello from {server_name}\n".encode()
+            if work:
+                time.sleep(work)
+            conn.sendall(message)
+            stats.record(time.perf_counter() - start)
+            if verbose:
+                print(f"[{server_name}] sent: {message.decode().strip()}")
+            if not idle_timeout:
+                return
+            conn.settimeout(idle_timeout) # an idle client gives its worker thread back
+            reader = conn.makefile("rb")
+            for _ in reader: # keep-alive: one greeting per request line
+                start = time.perf_counter()
+                if work:
+                    time.sleep(work)
+                conn.sendall(message)
+                stats.record(time.perf_counter() - start)
+    except OSError:
+        pass
+    finally:
+        stats.closed()
 
-if __name__ == "__main__":
-    main()
+def run_blocking(sock, server_name, stats, work, verbose, workers=None, idle_timeout=None):
+    pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+    while True:
+        conn, addr = sock.accept()
+        if pool is None:
+            serve_connection(conn, addr, server_name, stats, work, verbose)
+        else:
+            pool.submit(serve_connection, conn, addr, server_name, stats, work, verbose, idle_timeout)
 
+def run_async(sock, server_name, stats, work, verbose, idle_timeout=None):
+    message = f"Hello from {server_name}\n".encode()
 
+    async def handle(reader, writer):
+        start = time.perf_counter()
+        stats.opened()
+        try:
+            if verbose:
+                print(f"[{server_name}] connection from {writer.get_extra_info('peername')}")
+            while True:
+                if work:
+                    await asyncio.sleep(work)
+                writer.write(message)
+                await writer.drain()
+                stats.record(time.perf_counter() - start)
+                line = await asyncio.wait_for(reader.readline(), idle_timeout)
+                if not line:
+                    break
+                start = time.perf_counter()
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            stats.closed()
+            writer.close()
 
+    async def serve():
+        server = await asyncio.start_server(handle, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+def worker(args, name, reuseport):
+    sock = make_listener(args.backlog, reuseport)
+    stats = ServerStats(name)
+    threading.Thread(target=stats.report_loop, args=(args.stats_interval,), daemon=True).start()
+    print(f"[{name}] {args.mode} server listening on {HOST}:{PORT} (backlog {args.backlog})", flush=True)
+    work = args.work_ms / 1000.0
+    idle_timeout = args.idle_timeout or None
+    if args.mode == "async":
+        run_async(sock, name, stats, work, args.verbose, idle_timeout)
+    elif args.mode == "threads":
+        run_blocking(sock, name, stats, work, args.verbose, args.workers, idle_timeout)
+    else:
+        run_blocking(sock, name, stats, work, args.verbose)
+
+def main():
+    parser = argparse.ArgumentParser(description="Anycast TCP server")
+    parser.add_argument("--mode", choices=["serial", "async", "threads"], default=os.getenv("SERVER_MODE", "serial"))
+    parser.add_argument("--workers", type=int, default=64, help="Threads in --mode threads")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--idle-timeout", type=float, default=10.0,
+                        help="Seconds a kept-alive connection may stay idle (async/threads modes, 0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=128, help="listen() backlog (pending connections)")
+    parser.add_argument("--work-ms", type=float, default=0.0, help="Simulated work per request in milliseconds")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="Seconds between stats lines")
+    parser.add_argument("--quiet", dest="verbose", action="store_false", help="Don't log every connection")
+    args = parser.parse_args()
+
+    server_name = os.getenv("HOSTNAME", "unknown-server")
+    print(f"[{server_name}] starting server on port {PORT}")
+    if args.processes <= 1:
+        worker(args, server_name, reuseport=False)
+        return
+    procs = [
+        multiprocessing.Process(target=worker, args=(args, f"{server_name}/{i}", True), daemon=True)
+        for i in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()
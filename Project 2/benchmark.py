@@ -0,0 +1,281 @@
+"""
+Benchmark: Multicast (UDP) and Anycast (TCP) on loopback
+Description: Runs the multicast sender/receiver and the anycast server together on this machine and sweeps the
+parameters that matter for each, so a change to the receive loop or the server can be compared against a baseline.
+
+Multicast: for every payload size x send rate x number of receivers, `multicast_sender.send_stream` sends a
+sequenced stream (no NACKs, nothing dropped on purpose) to receivers running `multicast_receiver.receive_fast`
+in their own processes. Reported: sent and received packets/s, loss %, one-way latency and CPU microseconds
+per packet on the sender and on each receiver.
+
+Anycast: for every server mode x concurrency, `anycast/server.py` is started as its own process and
+`concurrency` client threads first open, read and close connections as fast as they can (connection setup
+time = connect + greeting), then hold one kept-alive connection each and send requests on it (skipped for
+the serial mode, which closes every connection after the greeting).
+Reported: connections/s, setup time p50/p99, requests/s, request latency p50/p99 and server CPU
+microseconds per connection and per request.
+
+Results can be saved as JSON (--out) and checked against an earlier run (--compare).
+
+Citation(s):
+1) Python Software Foundation. (n.d.). resource — Resource usage information. Retrieved from https://docs.python.org/3/library/resource.html
+2) Python Software Foundation. (n.d.). multiprocessing — Process-based parallelism. Retrieved from https://docs.python.org/3/library/multiprocessing.html
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "multicast"))
+
+from multicast_receiver import receive_fast
+from multicast_sender import send_stream
+
+ANYCAST_SERVER = os.path.join(HERE, "anycast", "server.py")
+ANYCAST_PORT = 5000
+
+def percentile_ms(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+# --- multicast ---
+
+def _receiver_process(duration, results): # Runs in a child process so it gets its own CPU time and GIL.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        cpu = time.process_time()
+        stats = receive_fast(duration=duration, interval=3600, nack=False)
+        cpu = time.process_time() - cpu
+    results.put({"frames": stats.tracker.received, "packets": stats.packets, "cpu": cpu,
+                 "latency_ms": stats.tracker.latency_ms()})
+
+def _sender_process(rate, count, size, results):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        cpu = time.process_time()
+        sent = send_stream(rate=rate, count=count, size=size, linger=0.0)
+        cpu = time.process_time() - cpu
+    sent.pop("per_second")
+    results.put({**sent, "cpu": cpu})
+
+def bench_multicast(size, rate, receivers, duration):
+    results = multiprocessing.Queue()
+    count = int(rate * duration)
+    listen = duration + 3.0 # receivers stop on their own, after the sender is done
+    procs = [multiprocessing.Process(target=_receiver_process, args=(listen, results)) for _ in range(receivers)]
+    for p in procs:
+        p.start()
+    time.sleep(0.5) # let every receiver join the group
+    sender = multiprocessing.Process(target=_sender_process, args=(rate, count, size, results))
+    sender.start()
+    reports = [results.get(timeout=listen + 30) for _ in range(receivers + 1)]
+    for p in procs + [sender]:
+        p.join()
+    sent = next(r for r in reports if "sent" in r)
+    recv = [r for r in reports if "frames" in r]
+    seconds = sent["seconds"]
+    return {
+        "size": size,
+        "rate": rate,
+        "receivers": receivers,
+        "sent": sent["sent"],
+        "send_pps": round(sent["pps"]),
+        "recv_pps": round(min(r["frames"] for r in recv) / seconds),
+        "loss_pct": round(max(100.0 * (sent["sent"] - r["frames"]) / sent["sent"] for r in recv), 3) if sent["sent"] else 0.0,
+        "latency_p50_ms": max((r["latency_ms"][0] for r in recv if r["latency_ms"]), default=None),
+        "latency_p99_ms": max((r["latency_ms"][1] for r in recv if r["latency_ms"]), default=None),
+        "send_cpu_us_per_pkt": round(sent["cpu"] / sent["sent"] * 1e6, 3) if sent["sent"] else None,
+        "recv_cpu_us_per_pkt": round(max(r["cpu"] / r["frames"] for r in recv) * 1e6, 3) if all(r["frames"] for r in recv) else None,
+    }
+
+# --- anycast ---
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5) as s:
+                s.recv(1024)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+def run_threads(concurrency, target):
+    threads = [threading.Thread(target=target) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def connection_phase(concurrency, duration): # New connection per request: connect, read the greeting, close.
+    samples, errors = [], [0]
+    lock = threading.Lock()
+    end = time.perf_counter() + duration
+
+    def worker():
+        local, failed = [], 0
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                with socket.create_connection(("127.0.0.1", ANYCAST_PORT), timeout=5) as s:
+                    if not s.recv(1024):
+                        raise ConnectionError("closed before greeting")
+                local.append(time.perf_counter() - start)
+            except OSError:
+                failed += 1
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    run_threads(concurrency, worker)
+    return samples, errors[0]
+
+def keepalive_phase(concurrency, duration): # One connection per thread, many requests on it.
+    samples, errors = [], [0]
+    lock = threading.Lock()
+    end = time.perf_counter() + duration
+
+    def worker():
+        local, failed = [], 0
+        try:
+            start = time.perf_counter()
+            with socket.create_connection(("127.0.0.1", ANYCAST_PORT), timeout=duration + 5) as s:
+                reader = s.makefile("rb")
+                reader.readline() # the greeting counts as the first request: a serial server makes it wait
+                local.append(time.perf_counter() - start)
+                while time.perf_counter() < end:
+                    start = time.perf_counter()
+                    s.sendall(b"hello\n")
+                    if not reader.readline():
+                        raise ConnectionError("connection closed")
+                    local.append(time.perf_counter() - start)
+        except OSError:
+            failed += 1
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    run_threads(concurrency, worker)
+    return samples, errors[0]
+
+def bench_anycast(mode, concurrency, duration, work_ms=0.0):
+    server = subprocess.Popen(
+        [sys.executable, ANYCAST_SERVER, "--mode", mode, "--quiet", "--stats-interval", "3600",
+         "--backlog", "1024", "--workers", str(max(concurrency, 1)), "--work-ms", str(work_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, "HOSTNAME": "bench"})
+    try:
+        wait_for_port(ANYCAST_PORT)
+        conn_samples, conn_errors = connection_phase(concurrency, duration)
+        req_samples, req_errors = keepalive_phase(concurrency, duration) if mode != "serial" else ([], 0)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        _, _, usage = os.wait4(server.pid, 0) # CPU time used by the server process
+    cpu = usage.ru_utime + usage.ru_stime
+    connections, requests = len(conn_samples), len(req_samples)
+    handled = connections + requests
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "conn_per_s": round(connections / duration),
+        "setup_p50_ms": percentile_ms(conn_samples, 0.5),
+        "setup_p99_ms": percentile_ms(conn_samples, 0.99),
+        "req_per_s": round(requests / duration),
+        "req_p50_ms": percentile_ms(req_samples, 0.5),
+        "req_p99_ms": percentile_ms(req_samples, 0.99),
+        "errors": conn_errors + req_errors,
+        "server_cpu_us_per_op": round(cpu / handled * 1e6, 3) if handled else None,
+    }
+
+# --- baseline comparison ---
+
+HIGHER_IS_BETTER = ("send_pps", "recv_pps", "conn_per_s", "req_per_s")
+LOWER_IS_BETTER = ("loss_pct", "setup_p99_ms", "req_p99_ms", "recv_cpu_us_per_pkt", "server_cpu_us_per_op")
+
+def compare(current, baseline, tolerance):
+    """Rows whose metrics got worse than the baseline's by more than `tolerance` (0.1 = 10%)."""
+    regressions = []
+    for section, keys in (("multicast", ("size", "rate", "receivers")), ("anycast", ("mode", "concurrency"))):
+        before = {tuple(row[k] for k in keys): row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            old = before.get(tuple(row[k] for k in keys))
+            if old is None:
+                continue
+            label = ", ".join(f"{k}={row[k]}" for k in keys)
+            for metric in HIGHER_IS_BETTER:
+                if old.get(metric) and row.get(metric) is not None and row[metric] < old[metric] * (1 - tolerance):
+                    regressions.append(f"{section} {label}: {metric} {old[metric]} -> {row[metric]}")
+            for metric in LOWER_IS_BETTER:
+                if old.get(metric) is not None and row.get(metric) is not None and row[metric] > old[metric] * (1 + tolerance) \
+                        and row[metric] - old[metric] > 0.01: # ignore noise around zero
+                    regressions.append(f"{section} {label}: {metric} {old[metric]} -> {row[metric]}")
+    return regressions
+
+def parse_list(text, cast):
+    return [cast(x) for x in text.split(",") if x.strip()]
+
+def print_rows(title, rows):
+    print(f"\n{title}")
+    if not rows:
+        return
+    keys = list(rows[0])
+    widths = [max(len(k), *(len(str(r[k])) for r in rows)) for k in keys]
+    print("  ".join(k.rjust(w) for k, w in zip(keys, widths)))
+    for r in rows:
+        print("  ".join(str(r[k]).rjust(w) for k, w in zip(keys, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmark for the multicast and anycast demos")
+    parser.add_argument("--sizes", default="64,512,1400", help="Multicast payload sizes in bytes")
+    parser.add_argument("--rates", default="10000,50000", help="Multicast send rates in packets/s")
+    parser.add_argument("--receivers", default="1,2", help="Numbers of multicast receivers")
+    parser.add_argument("--modes", default="serial,async,threads", help="Anycast server modes")
+    parser.add_argument("--concurrency", default="1,8,32", help="Anycast client threads")
+    parser.add_argument("--work-ms", type=float, default=0.0, help="Simulated server work per request")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per measurement")
+    parser.add_argument("--skip-multicast", action="store_true")
+    parser.add_argument("--skip-anycast", action="store_true")
+    parser.add_argument("--out", help="Write results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --out")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "multicast": [], "anycast": []}
+    if not args.skip_multicast:
+        for size in parse_list(args.sizes, int):
+            for rate in parse_list(args.rates, float):
+                for receivers in parse_list(args.receivers, int):
+                    print(f"[BENCH] multicast size={size} rate={rate:g} receivers={receivers}", flush=True)
+                    report["multicast"].append(bench_multicast(size, rate, receivers, args.duration))
+        print_rows("Multicast", report["multicast"])
+    if not args.skip_anycast:
+        for mode in parse_list(args.modes, str):
+            for concurrency in parse_list(args.concurrency, int):
+                print(f"[BENCH] anycast mode={mode} concurrency={concurrency}", flush=True)
+                report["anycast"].append(bench_anycast(mode, concurrency, args.duration, args.work_ms))
+        print_rows("Anycast", report["anycast"])
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[BENCH] Results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[BENCH] REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"[BENCH] No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Task 2: Multicast (UDP) – sequenced stream framing
+Description: Frame format shared by multicast_sender.py (--stream) and multicast_receiver.py (--fast).
+Every data frame carries the sender ID, a sequence number and the send time, so receivers can detect gaps,
+reordering and latency. A receiver that sees a gap sends a unicast NACK back to the sender, which
+retransmits the missing frames from a bounded ring buffer.
+
+Data frame (network byte order, 24-byte header + payload):
+    magic "MC" | version (1 byte) | flags (1 byte) | sender ID (u32) | seq (u64) | send time ns (u64) | payload
+NACK (receiver -> sender, unicast):
+    magic "NK" | version | 0 | sender ID (u32) | range count (u16) | (first seq u64, last seq u64) * count
+"""
+
+import itertools
+import struct
+import time
+
+VERSION = 1
+DATA_MAGIC = b'MC'
+NACK_MAGIC = b'NK'
+FLAG_RETRANSMIT = 0x01
+
+HEADER = struct.Struct('!2sBBIQQ')
+NACK_HEADER = struct.Struct('!2sBBIH')
+NACK_RANGE = struct.Struct('!QQ')
+MAX_NACK_RANGES = 64 # keeps a NACK well inside one datagram
+
+def pack_frame(sender_id, seq, payload, flags=0, sent_ns=None):
+    return HEADER.pack(DATA_MAGIC, VERSION, flags, sender_id, seq,
+                       time.time_ns() if sent_ns is None else sent_ns) + payload
+
+def unpack_frame(data):
+    """Return (flags, sender_id, seq, sent_ns, payload), or None if this is not a data frame."""
+    if len(data) < HEADER.size or data[:2] != DATA_MAGIC:
+        return None
+    _, version, flags, sender_id, seq, sent_ns = HEADER.unpack_from(data)
+    if version != VERSION:
+        return None
+    return flags, sender_id, seq, sent_ns, data[HEADER.size:]
+
+def pack_nack(sender_id, ranges):
+    ranges = ranges[:MAX_NACK_RANGES]
+    return NACK_HEADER.pack(NACK_MAGIC, VERSION, 0, sender_id, len(ranges)) + b''.join(
+        NACK_RANGE.pack(first, last) for first, last in ranges)
+
+def unpack_nack(data):
+    """Return (sender_id, [(first, last), ...]), or None if this is not a NACK."""
+    if len(data) < NACK_HEADER.size or data[:2] != NACK_MAGIC:
+        return None
+    _, version, _, sender_id, count = NACK_HEADER.unpack_from(data)
+    if version != VERSION or len(data) < NACK_HEADER.size + count * NACK_RANGE.size:
+        return None
+    return sender_id, [NACK_RANGE.unpack_from(data, NACK_HEADER.size + i * NACK_RANGE.size) for i in range(count)]
+
+def to_ranges(seqs):
+    """Collapse sorted sequence numbers into (first, last) ranges."""
+    ranges = []
+    for seq in seqs:
+        if ranges and seq == ranges[-1][1] + 1:
+            ranges[-1][1] = seq
+        else:
+            ranges.append([seq, seq])
+    return [tuple(r) for r in ranges]
+
+
+class RetransmitRing:
+    """The last `size` frames a sender sent, by sequence number, for answering NACKs."""
+
+    def __init__(self, size):
+        self.size = size
+        self.frames = [None] * size
+
+    def add(self, seq, frame):
+        self.frames[seq % self.size] = (seq, frame)
+
+    def get(self, seq):
+        entry = self.frames[seq % self.size]
+        return entry[1] if entry is not None and entry[0] == seq else None
+
+
+class StreamTracker:
+    """
+    Receiver-side state of every sender's stream: gaps, reordering, NACKs and latency.
+
+    `send_nack(addr, data)` is called to send a NACK datagram to a sender.
+    A missing frame is NACKed after `nack_delay` seconds (it may just be
+    reordered), then again with a growing delay until `max_nacks` attempts,
+    after which it counts as lost.
+    At most `max_gap` missing frames are tracked per stream (a sender keeps
+    only its last --ring frames anyway); older ones count as lost at once,
+    so a jump in sequence numbers costs no more than that.
+    """
+
+    def __init__(self, send_nack=None, nack_delay=0.05, max_nacks=5, latency_samples=100000, max_gap=65536):
+        self.send_nack = send_nack
+        self.nack_delay = nack_delay
+        self.max_nacks = max_nacks
+        self.max_gap = max_gap
+        self.streams = {} # (addr, sender_id) -> {"next": seq, "missing": {seq: [due, attempts]}}
+        self.received = 0
+        self.recovered = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.nacks_sent = 0
+        self.latencies = [] # one-way latency in seconds (needs synchronized clocks across hosts)
+        self.latency_samples = latency_samples
+
+    def on_frame(self, addr, frame, now=None):
+        flags, sender_id, seq, sent_ns, _ = frame
+        now = time.time() if now is None else now
+        if len(self.latencies) < self.latency_samples and not flags & FLAG_RETRANSMIT:
+            self.latencies.append(now - sent_ns / 1e9)
+        key = (addr, sender_id)
+        stream = self.streams.get(key)
+        if stream is None:
+            self.streams[key] = {"next": seq + 1, "missing": {}, "addr": addr, "sender_id": sender_id}
+            self.received += 1
+            return
+        if seq >= stream["next"]:
+            missing = stream["missing"]
+            first = max(stream["next"], seq - self.max_gap)
+            self.lost += first - stream["next"]
+            for gap in range(first, seq):
+                missing[gap] = [now + self.nack_delay, 0]
+            # Gaps are added in seq order, so the oldest entries come first.
+            for gap in list(itertools.islice(missing, max(0, len(missing) - self.max_gap))):
+                del missing[gap]
+                self.lost += 1
+            stream["next"] = seq + 1
+            self.received += 1
+        elif seq in stream["missing"]:
+            del stream["missing"][seq]
+            self.received += 1
+            if flags & FLAG_RETRANSMIT:
+                self.recovered += 1
+            else:
+                self.reordered += 1
+        else:
+            self.duplicates += 1
+
+    def tick(self, now=None):
+        """Send due NACKs and give up on frames NACKed too often. Call periodically."""
+        now = time.time() if now is None else now
+        for stream in self.streams.values():
+            due = []
+            for seq, state in list(stream["missing"].items()):
+                if state[0] > now:
+                    continue
+                if state[1] >= self.max_nacks:
+                    del stream["missing"][seq]
+                    self.lost += 1
+                    continue
+                state[0] = now + self.nack_delay * (state[1] + 2) # back off between attempts
+                state[1] += 1
+                due.append(seq)
+            if due and self.send_nack is not None:
+                ranges = to_ranges(sorted(due))
+                for i in range(0, len(ranges), MAX_NACK_RANGES):
+                    self.send_nack(stream["addr"], pack_nack(stream["sender_id"], ranges[i:i + MAX_NACK_RANGES]))
+                    self.nacks_sent += 1
+
+    def pending(self):
+        return sum(len(s["missing"]) for s in self.streams.values())
+
+    def latency_ms(self):
+        """(p50, p99, max) one-way latency in milliseconds, or None without samples."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+        return round(pick(0.5), 3), round(pick(0.99), 3), round(ordered[-1] * 1000, 3)
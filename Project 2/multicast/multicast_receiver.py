@@ -1,6 +1,8 @@
 """
 Task 2: Multicast (UDP)
 Decription: This receiver joins a multicast group (224.1.1.1:5007), listens for messages for a specified duration, and prints them. It supports both UTF-8 JSON and binary messages.
+With --fast it runs a high-rate mode instead: packets are read into preallocated buffers in batches, decoded on a separate thread, and only periodic throughput/loss stats are printed.
+In --fast mode, sequenced frames from `multicast_sender.py --stream` are tracked per sender: gaps are NACKed back to the sender (unless --no-nack), and loss, reordering, recovery and one-way latency are reported.
 """
 
 import socket
@@ -8,22 +10,34 @@ import struct
 import argparse
 import time
 import json
+import queue
+import threading
+from multicast_protocol import StreamTracker, unpack_frame
 
 # Multicast group and port
 GROUP = '224.1.1.1'
 PORT = 5007
 
-def receive(duration=10): # Joins a multicast group and receives messages for a fixed duration.
+def join_group(rcvbuf=None): # Creates a UDP socket bound to PORT and joined to GROUP.
     # Create UDP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
 
     # Allow multiple receivers to bind the same address/port
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    # A large kernel receive buffer absorbs bursts while Python is busy
+    # (Linux caps it at net.core.rmem_max and reports double the value).
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
     sock.bind(('', PORT))
 
     # Join multicast group
     mreq = struct.pack('4sL', socket.inet_aton(GROUP), socket.INADDR_ANY)
     sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+def receive(duration=10): # Joins a multicast group and receives messages for a fixed duration.
+    sock = join_group()
     print(f"[RECEIVER] Joined multicast group {GROUP}:{PORT} for {duration} seconds.")
 
     sock.settimeout(1.0)
@@ -52,8 +66,165 @@ def receive(duration=10): # Joins a multicast group and receives messages for a
     print("[RECEIVER] Leaving multicast group.")
     sock.close()
 
+class Stats: # Counters shared by the receive and decode threads, printed every stats interval.
+    def __init__(self, tracker):
+        self.lock = threading.Lock()
+        self.tracker = tracker # sequenced frames (multicast_protocol)
+        self.packets = 0
+        self.bytes = 0
+        self.json = 0
+        self.text = 0
+        self.binary = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.sources = {} # sender address -> [first seq, highest seq, packets with a seq]
+
+    def lost(self):
+        json_lost = sum(max(0, high - first + 1 - count) for first, high, count in self.sources.values())
+        return json_lost + self.tracker.lost
+
+    def seq(self, addr, seq): # Track sequence numbers ("seq" in JSON messages) to estimate loss.
+        src = self.sources.get(addr)
+        if src is None:
+            self.sources[addr] = [seq, seq, 1]
+        elif seq > src[1]:
+            src[1] = seq
+            src[2] += 1
+        elif seq < src[0]:
+            src[0] = seq
+            src[2] += 1
+            self.reordered += 1
+        elif seq == src[1]:
+            self.duplicates += 1
+        else:
+            src[2] += 1 # arrived late (or is a duplicate, which we cannot tell apart cheaply)
+            self.reordered += 1
+
+def decode_loop(buffers, ready, free, stats, tick=0.01): # Runs on its own thread so decoding never slows down recv.
+    while True:
+        try:
+            item = ready.get(timeout=tick)
+        except queue.Empty:
+            item = (None, [])
+        if item is None:
+            return
+        received_at, batch = item # latency is measured from when the batch was read, not decoded
+        for slot, nbytes, addr in batch:
+            data = bytes(buffers[slot][:nbytes])
+            free.put(slot) # the buffer can be reused as soon as it is copied
+            with stats.lock:
+                frame = unpack_frame(data)
+                if frame is not None:
+                    stats.tracker.on_frame(addr, frame, received_at)
+                    continue
+                if data[:1] == b'{':
+                    try:
+                        obj = json.loads(data)
+                        stats.json += 1
+                        if isinstance(obj, dict) and isinstance(obj.get("seq"), int):
+                            stats.seq(addr, obj["seq"])
+                        continue
+                    except ValueError:
+                        pass
+                try:
+                    data.decode()
+                    stats.text += 1
+                except UnicodeDecodeError:
+                    stats.binary += 1
+        with stats.lock:
+            stats.tracker.tick() # NACK gaps that are now due
+
+def receive_fast(duration=10, slots=8192, slot_size=2048, batch_size=64, rcvbuf=8 << 20, interval=1.0, nack=True,
+                 max_gap=65536):
+    """
+    High-rate receive loop.
+    Datagrams are read with recvfrom_into into a ring of preallocated buffers.
+    After each blocking read, the socket is drained without blocking (up to
+    batch_size packets), recvmmsg-style, and the whole batch is handed to the
+    decode thread at once. Prints packets/s, MB/s and loss every `interval`.
+    With `nack`, gaps in sequenced streams are NACKed to their sender; at
+    most `max_gap` missing frames are tracked per stream.
+    """
+    sock = join_group(rcvbuf)
+    actual = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    print(f"[RECEIVER] Fast mode on {GROUP}:{PORT} for {duration}s, SO_RCVBUF={actual} bytes")
+
+    buffers = [bytearray(slot_size) for _ in range(slots)]
+    views = [memoryview(b) for b in buffers]
+    free = queue.SimpleQueue()
+    for slot in range(slots):
+        free.put(slot)
+    ready = queue.SimpleQueue()
+    tracker = StreamTracker(send_nack=(lambda addr, data: sock.sendto(data, addr)) if nack else None, max_gap=max_gap)
+    stats = Stats(tracker)
+    decoder = threading.Thread(target=decode_loop, args=(buffers, ready, free, stats), daemon=True)
+    decoder.start()
+
+    sock.settimeout(0.2)
+    start = last = time.time()
+    end_time = start + duration
+    last_packets = last_bytes = 0
+    packets = nbytes_total = 0
+    while True:
+        now = time.time()
+        if now >= end_time:
+            break
+        if now - last >= interval:
+            with stats.lock:
+                lost, reordered = stats.lost(), stats.reordered + tracker.reordered
+            rate = (packets - last_packets) / (now - last)
+            mbps = (nbytes_total - last_bytes) / (now - last) / 1e6
+            print(f"[RECEIVER] {rate:10.0f} pkt/s {mbps:8.2f} MB/s  total {packets}  lost {lost}  reordered {reordered}", flush=True)
+            last, last_packets, last_bytes = now, packets, nbytes_total
+        batch = []
+        slot = free.get()
+        try:
+            n, addr = sock.recvfrom_into(views[slot])
+        except socket.timeout:
+            free.put(slot)
+            continue
+        batch.append((slot, n, addr))
+        while len(batch) < batch_size:
+            slot = free.get()
+            try:
+                n, addr = sock.recvfrom_into(views[slot], 0, socket.MSG_DONTWAIT)
+            except (BlockingIOError, socket.timeout): # nothing more queued in the kernel
+                free.put(slot)
+                break
+            batch.append((slot, n, addr))
+        packets += len(batch)
+        nbytes_total += sum(b[1] for b in batch)
+        ready.put((time.time(), batch))
+
+    ready.put(None)
+    decoder.join()
+    elapsed = time.time() - start
+    with stats.lock:
+        stats.packets, stats.bytes = packets, nbytes_total # final totals for callers
+        print(f"[RECEIVER] {packets} packets ({nbytes_total} bytes) in {elapsed:.1f}s = {packets / elapsed:.0f} pkt/s; "
+              f"json {stats.json}, text {stats.text}, binary {stats.binary}, lost {stats.lost()}, "
+              f"reordered {stats.reordered + tracker.reordered}, duplicates {stats.duplicates + tracker.duplicates}")
+        if tracker.streams:
+            print(f"[RECEIVER] Streams: {len(tracker.streams)}, frames {tracker.received}, NACKs sent {tracker.nacks_sent}, "
+                  f"recovered {tracker.recovered}, lost {tracker.lost}, still missing {tracker.pending()}, "
+                  f"latency p50/p99/max ms {tracker.latency_ms()}")
+    print("[RECEIVER] Leaving multicast group.")
+    sock.close()
+    return stats
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Multicast Receiver")
     parser.add_argument('--duration', type=int, default=10, help="Listening duration in seconds")
+    parser.add_argument('--fast', action='store_true', help="High-rate mode: batched receive, periodic stats instead of per-packet output")
+    parser.add_argument('--rcvbuf', type=int, default=8 << 20, help="SO_RCVBUF in bytes for --fast")
+    parser.add_argument('--batch', type=int, default=64, help="Max packets read per batch in --fast mode")
+    parser.add_argument('--stats-interval', type=float, default=1.0, help="Seconds between stats lines in --fast mode")
+    parser.add_argument('--no-nack', action='store_true', help="Only measure gaps in sequenced streams, don't request retransmits")
+    parser.add_argument('--max-gap', type=int, default=65536,
+                        help="Missing frames tracked per stream in --fast mode (match the sender's --ring)")
     args = parser.parse_args()
-    receive(duration=args.duration)
+    if args.fast:
+        receive_fast(duration=args.duration, batch_size=args.batch, rcvbuf=args.rcvbuf, interval=args.stats_interval,
+                     nack=not args.no_nack, max_gap=args.max_gap)
+    else:
+        receive(duration=args.duration)
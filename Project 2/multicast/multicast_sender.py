@@ -1,6 +1,7 @@
 """
 Task 2: Multicast (UDP)
 Description: This sender transmits both JSON and binary data to a multicast group. Receivers that have joined the group (224.1.1.1:5007) will receive these packets.
+With --stream it sends a sequenced stream instead (see multicast_protocol.py) at a set rate, and retransmits frames that receivers NACK.
 """
 
 import socket
@@ -8,6 +9,11 @@ import time
 import json
 import struct
 import argparse
+import os
+import random
+import select
+import threading
+from multicast_protocol import FLAG_RETRANSMIT, RetransmitRing, pack_frame, unpack_nack
 
 # Multicast group IP and port (must be within 224.0.0.0 – 239.255.255.255 range)
 MULTICAST_GROUP = '224.1.1.1'
@@ -25,7 +31,7 @@ def send_messages(interval=1, count=5): #Sends JSON and binary packets to the mu
 
     for i in range(count):
         # Example JSON data (like a sensor reading)
-        msg = json.dumps({"sensor": "temp", "value": 20 + i}).encode()
+        msg = json.dumps({"seq": i, "sensor": "temp", "value": 20 + i}).encode()
         sock.sendto(msg, (MULTICAST_GROUP, PORT))
         print("[SENDER] Sent JSON:", msg.decode())
         time.sleep(interval)
@@ -38,9 +44,161 @@ def send_messages(interval=1, count=5): #Sends JSON and binary packets to the mu
     sock.close()
     print("[SENDER] Finished sending messages.")
 
+def serve_nacks(sock, sender_id, ring, stats, stop): # Answers NACKs (unicast to our socket) from the ring buffer.
+    # select() instead of a socket timeout: a timeout would make every sendto on the main thread poll first.
+    while not stop.is_set():
+        try:
+            if not select.select([sock], [], [], 0.1)[0]:
+                continue
+            data, addr = sock.recvfrom(65536)
+        except OSError:
+            return
+        nack = unpack_nack(data)
+        if nack is None or nack[0] != sender_id:
+            continue
+        stats["nacks"] += 1
+        for first, last in nack[1]:
+            for seq in range(first, min(last, first + 10000) + 1):
+                frame = ring.get(seq)
+                if frame is None:
+                    stats["too_old"] += 1 # already overwritten in the ring
+                    continue
+                # Mark it as a retransmit so receivers can tell recovery from reordering.
+                sock.sendto(frame[:3] + bytes([frame[3] | FLAG_RETRANSMIT]) + frame[4:], addr)
+                stats["retransmits"] += 1
+
+class TokenBucket:
+    """
+    Paces sends at `rate` packets/s. Tokens accumulate with time up to `burst`;
+    each packet costs one. take() waits for at least one token and returns how
+    many packets may go out now, so packets leave in small batches without a
+    sleep between them (Python has no sendmmsg, so a batch is a tight sendto loop).
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = 1.0
+        self.last = time.perf_counter()
+
+    def take(self, max_n):
+        while True:
+            now = time.perf_counter()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                n = min(int(self.tokens), max_n)
+                self.tokens -= n
+                return n
+            wait = (1 - self.tokens) / self.rate
+            if wait > 0.0005:
+                time.sleep(wait) # short waits spin instead: sleep() overshoots by ~50-100us
+
+def payload_encoder(fmt, size, sender_id):
+    """
+    Return encode(seq) -> datagram, with everything except the sequence number encoded once up front.
+    fmt "frame": multicast_protocol frame (NACK-capable) with `size` payload bytes;
+    "json": {"seq": n, ...} padded to about `size` bytes; "raw": 8-byte seq + zero padding.
+    """
+    if fmt == "frame":
+        payload = b'x' * size
+        return lambda seq: pack_frame(sender_id, seq, payload)
+    if fmt == "json":
+        prefix = b'{"seq":'
+        suffix_base = b',"sensor":"temp","pad":""}'
+        pad = max(0, size - len(prefix) - len(suffix_base) - 6)
+        suffix = b',"sensor":"temp","pad":"' + b'x' * pad + b'"}'
+        return lambda seq: prefix + str(seq).encode() + suffix
+    if fmt == "raw":
+        seq_struct = struct.Struct('!Q')
+        padding = bytes(max(0, size - seq_struct.size))
+        return lambda seq: seq_struct.pack(seq) + padding
+    raise ValueError(f"unknown format {fmt!r}")
+
+def send_stream(rate=1000, count=10000, size=64, ring_size=65536, drop=0.0, linger=1.0, fmt="frame", burst=32,
+                sndbuf=4 << 20):
+    """
+    Send `count` packets of about `size` bytes at a steady `rate` packets/s (token-bucket paced).
+
+    With fmt "frame" the packets form a sequenced stream: the last
+    `ring_size` frames are kept for retransmission, and NACKs are answered
+    for `linger` seconds after the last frame. `drop` skips that fraction of
+    first transmissions on purpose (they stay in the ring), to test NACK
+    recovery on a loss-free loopback. Prints the packet and byte rate
+    achieved every second and overall.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', 1))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    sock.bind(('', 0)) # fixed unicast port for NACKs from receivers
+    sender_id = int.from_bytes(os.urandom(4), 'big')
+    encode = payload_encoder(fmt, size, sender_id)
+    sequenced = fmt == "frame"
+    ring = RetransmitRing(ring_size)
+    stats = {"nacks": 0, "retransmits": 0, "too_old": 0}
+    stop = threading.Event()
+    nack_thread = threading.Thread(target=serve_nacks, args=(sock, sender_id, ring, stats, stop), daemon=True)
+    if sequenced:
+        nack_thread.start()
+
+    print(f"[SENDER] Streaming {count} {fmt} packets of ~{size} bytes at {rate:g}/s to {MULTICAST_GROUP}:{PORT} "
+          f"(sender {sender_id:08x})")
+    dest = (MULTICAST_GROUP, PORT)
+    sendto = sock.sendto
+    pacer = TokenBucket(rate, burst)
+    start = last_report = time.perf_counter()
+    sent = sent_bytes = dropped = 0
+    report_sent = report_bytes = 0
+    per_second = []
+    seq = 0
+    while seq < count:
+        for _ in range(pacer.take(count - seq)):
+            data = encode(seq)
+            if sequenced:
+                ring.add(seq, data)
+            seq += 1
+            if drop and random.random() < drop:
+                dropped += 1
+                continue
+            sendto(data, dest)
+            sent += 1
+            sent_bytes += len(data)
+        now = time.perf_counter()
+        if now - last_report >= 1.0:
+            pps = (sent - report_sent) / (now - last_report)
+            per_second.append(pps)
+            print(f"[SENDER] {pps:10.0f} pkt/s {(sent_bytes - report_bytes) / (now - last_report) / 1e6:8.2f} MB/s", flush=True)
+            last_report, report_sent, report_bytes = now, sent, sent_bytes
+    elapsed = time.perf_counter() - start
+    if sequenced:
+        time.sleep(linger)
+    stop.set()
+    if sequenced:
+        nack_thread.join()
+    sock.close()
+    steadiness = f", per-second min/max {min(per_second):.0f}/{max(per_second):.0f} pkt/s" if per_second else ""
+    print(f"[SENDER] Sent {sent} packets ({sent_bytes} bytes) in {elapsed:.2f}s: {sent / elapsed:.0f} pkt/s, "
+          f"{sent_bytes / elapsed / 1e6:.2f} MB/s (target {rate:g} pkt/s){steadiness}; dropped on purpose {dropped}")
+    if sequenced:
+        print(f"[SENDER] NACKs {stats['nacks']}, retransmits {stats['retransmits']}, too old {stats['too_old']}")
+    return {"sent": sent, "bytes": sent_bytes, "seconds": elapsed, "pps": sent / elapsed, "per_second": per_second}
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Multicast Sender")
     parser.add_argument('--interval', type=float, default=1.0, help="Interval between messages (sec)")
     parser.add_argument('--count', type=int, default=5, help="Number of messages to send")
+    parser.add_argument('--stream', action='store_true', help="Send a rate-paced stream (sequenced, with NACK-based retransmission for --format frame)")
+    parser.add_argument('--rate', type=float, default=1000, help="Packets per second in --stream mode")
+    parser.add_argument('--duration', type=float, help="Seconds to stream for (sets --count to rate x duration)")
+    parser.add_argument('--size', type=int, default=64, help="Payload bytes per packet in --stream mode")
+    parser.add_argument('--format', choices=["frame", "json", "raw"], default="frame", help="Packet format in --stream mode")
+    parser.add_argument('--burst', type=int, default=32, help="Max packets sent back to back by the pacer")
+    parser.add_argument('--ring', type=int, default=65536, help="Frames kept for retransmission in --stream mode")
+    parser.add_argument('--drop', type=float, default=0.0, help="Fraction of frames to skip on purpose in --stream mode")
     args = parser.parse_args()
-    send_messages(interval=args.interval, count=args.count)
+    if args.stream:
+        count = int(args.rate * args.duration) if args.duration else args.count
+        send_stream(rate=args.rate, count=count, size=args.size, ring_size=args.ring, drop=args.drop,
+                    fmt=args.format, burst=args.burst)
+    else:
+        send_messages(interval=args.interval, count=args.count)
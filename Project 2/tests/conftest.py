@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules are imported as top-level modules (run from multicast/ or anycast/).
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "multicast"))
+sys.path.insert(0, os.path.join(ROOT, "anycast"))
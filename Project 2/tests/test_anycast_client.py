@@ -0,0 +1,109 @@
+import socket
+import threading
+
+import pytest
+
+from client import AnycastClient
+
+
+class GreetingServer:
+    """Greets on connect and answers every line sent on a kept-alive connection, like server.py."""
+
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.conns = []
+        self.accepted = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.accepted += 1
+            self.conns.append(conn)
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        try:
+            conn.sendall(b"Hello from test\n")
+            with conn.makefile("rb") as lines:
+                for _ in lines:
+                    conn.sendall(b"Hello from test\n")
+        except OSError:
+            pass
+
+    def close_connections(self):
+        """Close every open connection, as the server does on --idle-timeout."""
+        for conn in self.conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.conns.clear()
+
+    def close(self):
+        self.close_connections()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # wakes the accept() in serve()
+        except OSError:
+            pass
+        self.sock.close()
+
+
+@pytest.fixture
+def server():
+    server = GreetingServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    client = AnycastClient(["127.0.0.1"], port=server.port, timeout=2.0, health_interval=0)
+    yield client
+    client.close()
+
+
+def keep_idle(client, n):
+    """Open n connections and leave them idle in the client's pool."""
+    held = []
+    for _ in range(n):
+        state, sock, reader, _ = client.checkout(reuse=False)
+        assert reader.readline() == b"Hello from test\n"
+        held.append((state, sock, reader))
+    for state, sock, reader in held:
+        client.checkin(state, sock, reader, ok=True)
+    return state
+
+
+def test_connections_are_reused(server, client):
+    for _ in range(5):
+        assert client.request() == ("127.0.0.1", "Hello from test")
+    assert server.accepted == 1
+    assert client.stats()[0]["reused"] == 4
+
+
+def test_stale_idle_connections_fall_back_to_a_new_one(server, client):
+    state = keep_idle(client, 3)
+    server.close_connections()
+
+    assert client.request() == ("127.0.0.1", "Hello from test")
+    assert server.accepted == 4
+    # The other stale connections were dropped, not tried one by one.
+    assert len(state.idle) == 1
+    assert state.healthy and state.failures == 0
+    assert client.request() == ("127.0.0.1", "Hello from test")
+    assert server.accepted == 4
+
+
+def test_unreachable_server():
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+    client = AnycastClient(["127.0.0.1"], port=port, timeout=1.0, health_interval=0)
+    assert client.request() == (None, "no server reachable")
+    assert not client.states[0].healthy
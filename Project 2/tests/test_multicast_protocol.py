@@ -0,0 +1,117 @@
+from multicast_protocol import (
+    FLAG_RETRANSMIT, MAX_NACK_RANGES, RetransmitRing, StreamTracker,
+    pack_frame, pack_nack, to_ranges, unpack_frame, unpack_nack,
+)
+
+ADDR = ("10.0.0.1", 5007)
+
+
+def frame(seq, flags=0):
+    return unpack_frame(pack_frame(7, seq, b"x", flags=flags, sent_ns=0))
+
+
+def tracker():
+    sent = []
+    t = StreamTracker(send_nack=lambda addr, data: sent.append((addr, unpack_nack(data))),
+                      nack_delay=0.05, max_nacks=3)
+    return t, sent
+
+
+def test_frame_round_trip():
+    assert unpack_frame(pack_frame(7, 2 ** 40, b"payload", FLAG_RETRANSMIT, 123)) == (
+        FLAG_RETRANSMIT, 7, 2 ** 40, 123, b"payload")
+    assert unpack_frame(b"MC") is None
+    assert unpack_frame(b'{"seq": 1}' + b" " * 30) is None
+
+
+def test_nack_round_trip():
+    ranges = [(i * 10, i * 10 + 2) for i in range(MAX_NACK_RANGES + 5)]
+    sender_id, decoded = unpack_nack(pack_nack(9, ranges))
+    assert sender_id == 9
+    assert decoded == ranges[:MAX_NACK_RANGES]
+    assert unpack_nack(pack_nack(9, ranges)[:-1]) is None
+    assert unpack_nack(pack_frame(9, 1, b"")) is None
+
+
+def test_to_ranges():
+    assert to_ranges([]) == []
+    assert to_ranges([1, 2, 3, 5, 7, 8]) == [(1, 3), (5, 5), (7, 8)]
+
+
+def test_retransmit_ring():
+    ring = RetransmitRing(4)
+    for seq in range(6):
+        ring.add(seq, f"f{seq}")
+    assert ring.get(5) == "f5"
+    assert ring.get(1) is None  # overwritten by seq 5
+
+
+def test_gap_is_nacked_after_delay():
+    t, sent = tracker()
+    t.on_frame(ADDR, frame(10), now=0.0)
+    t.on_frame(ADDR, frame(14), now=0.0)
+    assert t.pending() == 3
+    t.tick(now=0.01)
+    assert sent == []  # may only be reordered
+    t.tick(now=0.05)
+    assert sent == [(ADDR, (7, [(11, 13)]))]
+    assert t.nacks_sent == 1
+
+
+def test_reordered_and_recovered_frames():
+    t, sent = tracker()
+    for seq in (0, 3):
+        t.on_frame(ADDR, frame(seq), now=0.0)
+    t.on_frame(ADDR, frame(1), now=0.01)
+    t.on_frame(ADDR, frame(2, FLAG_RETRANSMIT), now=0.02)
+    t.on_frame(ADDR, frame(2), now=0.03)
+    assert (t.received, t.reordered, t.recovered, t.duplicates) == (4, 1, 1, 1)
+    assert t.pending() == 0
+    t.tick(now=1.0)
+    assert sent == []
+
+
+def test_nacks_back_off_then_give_up():
+    t, sent = tracker()
+    t.on_frame(ADDR, frame(0), now=0.0)
+    t.on_frame(ADDR, frame(2), now=0.0)
+    t.tick(now=0.05)
+    t.tick(now=0.149)
+    assert len(sent) == 1
+    t.tick(now=0.151)  # retried after nack_delay * 2
+    t.tick(now=0.302)  # then after nack_delay * 3
+    assert len(sent) == 3
+    t.tick(now=0.51)  # max_nacks reached: the frame counts as lost
+    assert len(sent) == 3 and t.pending() == 0
+    assert t.lost == 1
+
+
+def test_streams_are_tracked_per_sender():
+    t, sent = tracker()
+    t.on_frame(ADDR, frame(0), now=0.0)
+    t.on_frame(("10.0.0.2", 5007), frame(5), now=0.0)
+    t.on_frame(ADDR, frame(1), now=0.0)
+    assert t.pending() == 0
+    assert len(t.streams) == 2
+
+
+def test_gap_is_capped():
+    t = StreamTracker(max_gap=100)
+    t.on_frame(ADDR, frame(0), now=0.0)
+    t.on_frame(ADDR, frame(5_000_001), now=0.0)
+    # Only the newest max_gap missing frames can still be recovered.
+    assert t.pending() == 100 and t.lost == 4_999_900
+    assert min(t.streams[(ADDR, 7)]["missing"]) == 4_999_901
+
+    # Smaller jumps that add up past the cap drop the oldest gaps first.
+    t.on_frame(ADDR, frame(5_000_052), now=0.0)
+    assert t.pending() == 100 and t.lost == 4_999_900 + 50
+    assert min(t.streams[(ADDR, 7)]["missing"]) == 4_999_951
+
+
+def test_latency_percentiles():
+    t = StreamTracker()
+    assert t.latency_ms() is None
+    for i in range(100):
+        t.on_frame(ADDR, unpack_frame(pack_frame(1, i, b"", sent_ns=0)), now=(i + 1) / 1000)
+    assert t.latency_ms() == (51.0, 100.0, 100.0)
@@ -1,8 +1,80 @@
 # Imports Flask for web server functionality, request for incoming POST data, and jsonify for formatting JSON responses.
 from flask import Flask, request, jsonify
+import os
+import threading # one lock around the registry, Flask serves requests on several threads.
+import time # registration expiry.
+from collections import deque # bounded log of registry changes for ?since= deltas.
 
 app = Flask(__name__) # Initializes the Flask app.
-registered_peers = set() # registered_peers is a Python set() to store unique peer URLs (avoiding duplicates).
+
+PEER_TTL = float(os.getenv("PEER_TTL", "60")) # seconds a registration lasts unless the peer registers again.
+CHANGE_LOG_SIZE = int(os.getenv("CHANGE_LOG_SIZE", "10000")) # changes kept for delta requests.
+
+# Versioned peer registry.
+# registered_peers maps each peer URL to the time its registration expires.
+# Every add or removal bumps `version` and is appended to `changes`, so a
+# client that already has version v only needs the changes after v.
+# Versions are only meaningful within one run of this process: clients see
+# them as "<epoch>.<version>", and a token from an earlier run (a different
+# EPOCH) always gets the full list, never a delta or a 304.
+EPOCH = os.urandom(4).hex()
+registered_peers = {}
+version = 0
+changes = deque(maxlen=CHANGE_LOG_SIZE) # (version, "add" | "remove", peer)
+registry_lock = threading.Lock()
+
+def _record(action, peer):
+    global version
+    version += 1
+    changes.append((version, action, peer))
+
+def expire_peers():
+    """Remove peers whose registration ran out (call with registry_lock held)."""
+    now = time.time()
+    for peer, expires in list(registered_peers.items()):
+        if expires <= now:
+            del registered_peers[peer]
+            _record("remove", peer)
+
+def version_token():
+    return f"{EPOCH}.{version}"
+
+def parse_since(token):
+    """Registry version from a client's "<epoch>.<version>" token, or None if it is from another run."""
+    if not isinstance(token, str):
+        return None
+    epoch, _, number = token.partition(".")
+    if epoch != EPOCH or not number.isdigit():
+        return None
+    return int(number)
+
+def peers_since(since):
+    """
+    Changes after version `since` as {"added": [...], "removed": [...]}, or
+    None if the change log no longer reaches back that far (call with registry_lock held).
+    """
+    if since > version:
+        return None
+    if since < version and (not changes or changes[0][0] > since + 1):
+        return None
+    latest = {}
+    for v, action, peer in changes:
+        if v > since:
+            latest[peer] = action # only the last change of each peer matters.
+    return {
+        "added": [p for p, a in latest.items() if a == "add"],
+        "removed": [p for p, a in latest.items() if a == "remove"],
+    }
+
+def peer_list_response(since):
+    """Full list, or only the changes when the client sent a version we can still diff against."""
+    delta = peers_since(since) if since is not None else None
+    if delta is not None:
+        return {"version": version_token(), "full": False, **delta}
+    return {"version": version_token(), "full": True, "peers": list(registered_peers)}
+
+def etag():
+    return f'"{version_token()}"'
 
 # Root endpoint to confirm the bootstrap node is running.
 @app.route('/')
@@ -10,18 +82,38 @@ def index():
     return jsonify({"message": "Bootstrap node is running!"}) # Returns JSON text message.
 
 # Handles registration of peers.
+# A peer registers again before PEER_TTL runs out to stay listed. It may send
+# "since" (the last version token it saw) to get only the changes instead of the whole list.
 @app.route('/register', methods=['POST'])
 def register():
-    peer = request.json.get("peer") 
-    if peer:
-        registered_peers.add(peer) # Adds valid peers to the registered_peers set.
-        return jsonify({"status": "registered", "peer": list(registered_peers)}) # Returns a success JSON if added
-    return jsonify({"error": "No peer provided"}), 400 # or return error code 400 if "peer" missing.
-
-# Converts set → list because JSON doesn’t support sets.
-@app.route('/peers', methods=['GET']) #GET info from reg. peers 
+    data = request.get_json(silent=True) or {}
+    peer = data.get("peer")
+    if not peer:
+        return jsonify({"error": "No peer provided"}), 400 # or return error code 400 if "peer" missing.
+    since = data.get("since")
+    with registry_lock:
+        expire_peers()
+        if peer not in registered_peers:
+            _record("add", peer)
+        registered_peers[peer] = time.time() + PEER_TTL # Adds the peer or extends its registration.
+        body = peer_list_response(parse_since(since))
+    return jsonify({"status": "registered", "peer": peer, "ttl": PEER_TTL, **body}) # Returns a success JSON if added
+
+# GET info from reg. peers.
+# Supports If-None-Match (304 when the list has not changed since the
+# client's ETag) and ?since=<version token> for only the changes after that version.
+@app.route('/peers', methods=['GET'])
 def get_peers():
-    return jsonify({"peers": list(registered_peers)}) # Returns the list of all registered peers.
+    since = parse_since(request.args.get("since"))
+    with registry_lock:
+        expire_peers()
+        tag = etag()
+        if request.headers.get("If-None-Match") == tag:
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(peer_list_response(since))
+    response.headers["ETag"] = tag
+    return response
 
 if __name__ == '__main__': # Runs the Flask app, listening on port 5000 and all network interfaces.
-    app.run(host='0.0.0.0', port=5000) # In Docker, 0.0.0.0 is necessary so the service is reachable from other containers.
+    app.run(host='0.0.0.0', port=5000, threaded=True) # In Docker, 0.0.0.0 is necessary so the service is reachable from other containers.
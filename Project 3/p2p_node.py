@@ -6,11 +6,18 @@ Citation(s):
 '''
 
 import sys # read command-line arguments (port).
-import threading # used later for periodic peer refreshes (you prepared for future use).
-import time # used later for periodic peer refreshes (you prepared for future use).
+import threading # background gossip rounds.
+import time # gossip interval and suspicion timeouts.
 import requests # to send HTTP requests to bootstrap or peers.
 import uuid # to generate a unique node ID.
 import os
+import json # measuring gossip message sizes.
+import math # retransmission limit grows with log(cluster size).
+import random # picking gossip targets.
+import struct # binary message framing.
+from collections import deque # recently seen message ids.
+from concurrent.futures import ThreadPoolExecutor # parallel broadcast.
+from requests.adapters import HTTPAdapter # keep-alive connection pool per peer.
 from flask import Flask, request, jsonify # to create a lightweight web API.
 
 app = Flask(__name__)
@@ -18,89 +25,677 @@ node_id = str(uuid.uuid4()) # uniquely identifies the node.
 peers = set() # stores known peer URLs.
 
 bootstrap_url = os.getenv("BOOTSTRAP_URL", "http://host.docker.internal:5000")  # points to the bootstrap node on the host machine (important for Docker).
-port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000 # can be overridden via command-line, defaulting to 5000.
+port = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 5000 # can be overridden via command-line, defaulting to 5000.
 my_url = os.getenv("NODE_URL", f"http://host.docker.internal:{port}")
 
+# broadcast settings
+BROADCAST_MODE = os.getenv("BROADCAST_MODE", "direct") # "direct" (send to every peer) or "tree" (peers relay).
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16")) # messages in flight at once.
+BROADCAST_TIMEOUT = float(os.getenv("BROADCAST_TIMEOUT", "2")) # per-peer timeout in seconds.
+BROADCAST_FANOUT = int(os.getenv("BROADCAST_FANOUT", "4")) # children per node in tree mode.
+if BROADCAST_FANOUT < 2:
+    raise SystemExit(f"BROADCAST_FANOUT must be at least 2, got {BROADCAST_FANOUT}")
+
+broadcast_pool = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS)
+session = requests.Session() # reuses connections to peers between messages.
+session.mount("http://", HTTPAdapter(pool_connections=64, pool_maxsize=BROADCAST_WORKERS))
+
+# batched messaging settings: /send queues messages per peer, and a peer's
+# queue is flushed as one request once it holds BATCH_MAX_MESSAGES messages or
+# BATCH_MAX_BYTES bytes, or its oldest message waited BATCH_DELAY_MS.
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "256"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(256 * 1024)))
+BATCH_DELAY_MS = float(os.getenv("BATCH_DELAY_MS", "10"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "3")) # sends of a failed batch before it is dropped (delivery is best-effort).
+MESSAGE_FORMAT = os.getenv("MESSAGE_FORMAT", "binary") # "binary" when the peer supports it, else "json".
+
+# gossip membership settings
+GOSSIP_INTERVAL = float(os.getenv("GOSSIP_INTERVAL", "1")) # seconds between gossip rounds.
+GOSSIP_FANOUT = int(os.getenv("GOSSIP_FANOUT", "3")) # random members contacted per round.
+GOSSIP_INDIRECT = int(os.getenv("GOSSIP_INDIRECT", "2")) # members asked to probe a peer that did not answer.
+GOSSIP_TIMEOUT = float(os.getenv("GOSSIP_TIMEOUT", "0.5")) # per-request timeout in seconds.
+GOSSIP_MAX_UPDATES = int(os.getenv("GOSSIP_MAX_UPDATES", "20")) # membership updates piggybacked per message.
+SUSPECT_TIMEOUT = float(os.getenv("SUSPECT_TIMEOUT", "5")) # seconds a suspected peer has to refute before it is dead.
+
+STATUS_RANK = {"alive": 0, "suspect": 1, "dead": 2}
+
+class Membership:
+    """
+    SWIM-style gossip membership.
+
+    Every member has a status (alive / suspect / dead) and an incarnation
+    number. An update wins if its (incarnation, status) is newer than what
+    we have, so a suspected node refutes by gossiping "alive" with a higher
+    incarnation, and a restarted node (new incarnation from the clock)
+    overrides its own "dead" entry.
+
+    Each round we exchange updates with GOSSIP_FANOUT random members
+    (push-pull): we send our recent changes and they reply with theirs.
+    A change is piggybacked on about 3*log2(n) messages and then dropped,
+    so messages stay small no matter how large the cluster is. A member
+    that does not answer is probed through GOSSIP_INDIRECT others before it
+    is suspected, and declared dead after SUSPECT_TIMEOUT.
+    """
+
+    def __init__(self, self_url):
+        self.self_url = self_url
+        self.incarnation = int(time.time()) # a restart always comes back newer.
+        self.members = {} # url -> {"status", "incarnation", "since"}
+        self.pending = {} # url -> remaining retransmissions of its latest update.
+        self.lock = threading.Lock()
+        self.rounds = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0 # gossip messages other members sent us.
+        self.round_bytes = [] # bytes of the exchanges we started in each of the last 60 rounds.
+        self.last_change = time.time()
+        self._set(self_url, "alive", self.incarnation)
+
+    def _set(self, url, status, incarnation):
+        self.members[url] = {"status": status, "incarnation": incarnation, "since": time.time()}
+        self.pending[url] = self._retransmit_limit()
+        self.last_change = time.time()
+
+    def _retransmit_limit(self):
+        return 3 * max(1, math.ceil(math.log2(len(self.members) + 1)))
+
+    def seed(self, urls):
+        """Add peers learned from the bootstrap node (incarnation 0, so any gossip overrides them)."""
+        with self.lock:
+            for url in urls:
+                if url not in self.members:
+                    self.members[url] = {"status": "alive", "incarnation": 0, "since": time.time()}
+
+    def apply(self, updates):
+        """Merge updates received from another member. Returns how many changed our view."""
+        changed = 0
+        with self.lock:
+            for u in updates:
+                url, status, inc = u.get("url"), u.get("status"), u.get("incarnation", 0)
+                if not url or status not in STATUS_RANK:
+                    continue
+                if url == self.self_url:
+                    # someone suspects us (or thinks we are dead): refute with a newer incarnation.
+                    if status != "alive" and inc >= self.incarnation:
+                        self.incarnation = inc + 1
+                        self._set(url, "alive", self.incarnation)
+                    continue
+                cur = self.members.get(url)
+                if cur is None or (inc, STATUS_RANK[status]) > (cur["incarnation"], STATUS_RANK[cur["status"]]):
+                    self._set(url, status, inc)
+                    changed += 1
+        return changed
+
+    def updates_to_send(self):
+        """Pick the changes still being spread (least sent first) for one message."""
+        with self.lock:
+            picked = sorted(self.pending, key=self.pending.get, reverse=True)[:GOSSIP_MAX_UPDATES]
+            updates = []
+            for url in picked:
+                m = self.members[url]
+                updates.append({"url": url, "status": m["status"], "incarnation": m["incarnation"]})
+                self.pending[url] -= 1
+                if self.pending[url] <= 0:
+                    del self.pending[url]
+            return updates
+
+    def full_state(self):
+        with self.lock:
+            return [{"url": u, "status": m["status"], "incarnation": m["incarnation"]} for u, m in self.members.items()]
+
+    def suspect(self, url):
+        with self.lock:
+            m = self.members.get(url)
+            if m is not None and m["status"] == "alive":
+                self._set(url, "suspect", m["incarnation"])
+
+    def expire_suspects(self):
+        now = time.time()
+        with self.lock:
+            for url, m in list(self.members.items()):
+                if m["status"] == "suspect" and now - m["since"] > SUSPECT_TIMEOUT:
+                    self._set(url, "dead", m["incarnation"])
+                    print(f"[GOSSIP] {url} is dead", flush=True)
+
+    def is_dead(self, url):
+        with self.lock:
+            m = self.members.get(url)
+            return m is not None and m["status"] == "dead"
+
+    def live_peers(self):
+        """Members other than us that are not dead (suspects may still be alive)."""
+        with self.lock:
+            return [u for u, m in self.members.items() if u != self.self_url and m["status"] != "dead"]
+
+    def handle_gossip(self, body):
+        """Answer a gossip message: merge its updates and reply with ours."""
+        sender = body.get("from")
+        known = sender in self.members
+        self.apply(body.get("updates", []))
+        # a sender we did not know (new or returning) gets our whole view once.
+        updates = self.full_state() if not known else self.updates_to_send()
+        return {"from": self.self_url, "updates": updates}
+
+    def gossip_round(self, send):
+        """
+        Run one round. `send(url, path, body)` returns the reply dict, or None
+        if the member could not be reached.
+        """
+        round_bytes = 0
+        targets = self.live_peers()
+        for target in random.sample(targets, min(GOSSIP_FANOUT, len(targets))):
+            body = {"from": self.self_url, "updates": self.updates_to_send()}
+            reply = send(target, "/gossip", body)
+            round_bytes += len(json.dumps(body))
+            if reply is not None:
+                round_bytes += len(json.dumps(reply))
+                self.apply(reply.get("updates", []))
+                continue
+            # no answer: ask a few others to probe it before suspecting it.
+            helpers = [u for u in targets if u != target]
+            reached = False
+            for helper in random.sample(helpers, min(GOSSIP_INDIRECT, len(helpers))):
+                ack = send(helper, "/gossip/ping-req", {"target": target})
+                if ack is not None and ack.get("ok"):
+                    reached = True
+                    break
+            if not reached:
+                self.suspect(target)
+        self.expire_suspects()
+        with self.lock:
+            self.rounds += 1
+            self.bytes_sent += round_bytes
+            self.round_bytes = (self.round_bytes + [round_bytes])[-60:]
+
+    def stats(self):
+        with self.lock:
+            counts = {s: 0 for s in STATUS_RANK}
+            for m in self.members.values():
+                counts[m["status"]] += 1
+            return {
+                "incarnation": self.incarnation,
+                "members": counts,
+                "rounds": self.rounds,
+                "bytes_per_round": round(sum(self.round_bytes) / len(self.round_bytes), 1) if self.round_bytes else 0,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "pending_updates": len(self.pending),
+                "seconds_since_change": round(time.time() - self.last_change, 3),
+            }
+
+membership = Membership(my_url)
+
+def http_send(url, path, body):
+    try:
+        res = session.post(f"{url}{path}", json=body, timeout=GOSSIP_TIMEOUT)
+        if res.ok:
+            return res.json()
+    except requests.RequestException:
+        pass
+    return None
+
+def sync_peers():
+    """Keep the `peers` set in line with the gossip view."""
+    live = set(membership.live_peers())
+    peers.intersection_update(live)
+    peers.update(live)
+
+# bootstrap registry sync: registrations expire on the bootstrap node, so we
+# register again every REGISTER_INTERVAL seconds. We send the last registry
+# version we saw and get back only the changes since then.
+# Once a node is in the gossip view, newcomers only need a few listed nodes
+# to find the cluster: only the BOOTSTRAP_ANCHORS lowest live URLs keep
+# renewing (plus any node that knows no live peer), so the bootstrap node
+# sees the same load however large the cluster grows. The other entries
+# expire after PEER_TTL; when an anchor dies, gossip marks it dead and the
+# next node in order takes its place.
+REGISTER_INTERVAL = float(os.getenv("REGISTER_INTERVAL", "20"))
+BOOTSTRAP_ANCHORS = int(os.getenv("BOOTSTRAP_ANCHORS", "3"))
+bootstrap_version = None # last registry version token seen ("<epoch>.<n>"), None = need the full list.
+bootstrap_etag = None # ETag of the last /peers response.
+
+def apply_bootstrap_peers(data):
+    """Seed membership from a bootstrap reply: a full "peers" list or an "added" delta."""
+    global bootstrap_version
+    new_peers = data.get("peers", []) if data.get("full", True) else data.get("added", [])
+    membership.seed(p for p in new_peers if p != my_url)
+    if isinstance(data.get("version"), str):
+        bootstrap_version = data["version"]
+    sync_peers()
+
 # register with bootstrap node
 def register_with_bootstrap(port):
     """
     Builds the node’s own address (e.g., http://localhost:5001).
     Sends a POST request to bootstrap’s /register.
+    The returned peer list seeds the gossip membership; after this first
+    join, membership changes come from gossip, not from the bootstrap node.
     Logs success or failure.
     flush=True ensures immediate console output (important inside Docker).
     """
+    body = {"peer": my_url}
+    if bootstrap_version is not None:
+        body["since"] = bootstrap_version
     try:
-        res = requests.post(f"{bootstrap_url}/register", json={"peer": my_url})
+        res = requests.post(f"{bootstrap_url}/register", json=body, timeout=GOSSIP_TIMEOUT * 4)
         if res.ok:
-            data = res.json()
-            peers.update(data.get("peers", []))
-            print(f"[OK] Registered as {my_url}, peers: {peers}", flush=True)
+            first = bootstrap_version is None
+            apply_bootstrap_peers(res.json())
+            if first:
+                print(f"[OK] Registered as {my_url}, peers: {peers}", flush=True)
         else:
             print(f"[ERR] Bootstrap returned {res.status_code}", flush=True)
     except Exception as e:
         print(f"[ERR] Registration failed: {e}", flush=True)
 
+def should_renew(live):
+    """True if this node keeps its bootstrap registration alive (see BOOTSTRAP_ANCHORS)."""
+    return not live or my_url in sorted([*live, my_url])[:BOOTSTRAP_ANCHORS]
+
+def keep_registered():
+    """Renew our registration before it expires on the bootstrap node, while we are an anchor."""
+    while True:
+        time.sleep(REGISTER_INTERVAL)
+        if should_renew(membership.live_peers()):
+            register_with_bootstrap(port)
+
 #discover peers from bootstrap
 def discover_peers():
     """
     Gets the /peers list from the bootstrap node.
-    Adds all peers except itself to the local peers set.
+    Only used when gossip knows no live peer (e.g. this node started first
+    or was cut off), to find the cluster again.
+    Sends If-None-Match and ?since= so an unchanged list costs a 304.
     Logs the list of peers found.
     """
+    global bootstrap_etag
+    headers = {"If-None-Match": bootstrap_etag} if bootstrap_etag else {}
+    params = {"since": bootstrap_version} if bootstrap_version is not None else {}
     try:
-        res = requests.get(f"{bootstrap_url}/peers")
+        res = requests.get(f"{bootstrap_url}/peers", headers=headers, params=params, timeout=GOSSIP_TIMEOUT * 4)
+        if res.status_code == 304:
+            return
         if res.ok:
-            peer_list = res.json().get("peers", [])
-            for peer in peer_list:
-                if peer != my_url:
-                    peers.add(peer)
+            bootstrap_etag = res.headers.get("ETag")
+            apply_bootstrap_peers(res.json())
             print(f"[INFO] Discovered peers: {peers}", flush=True)
     except Exception as e:
         print(f"[ERR] Discovery failed: {e}", flush=True)
 
-def continuous_discovery(interval=10):
+def gossip_loop(discover_every=10):
+    """Run gossip rounds; fall back to the bootstrap node only while no peer is known."""
     while True:
-        discover_peers()
-        time.sleep(interval)
+        if not membership.live_peers() and membership.rounds % discover_every == 0:
+            discover_peers()
+        membership.gossip_round(http_send)
+        sync_peers()
+        time.sleep(GOSSIP_INTERVAL)
 
 # receive and send message 
 @app.route('/')
 def index(): # Health check endpoint showing node’s unique ID.
     return jsonify({"message": f"Node {node_id} is running!"})
 
+seen_ids = set() # ids of recently received broadcasts, so a message is logged once.
+seen_order = deque()
+
+def first_time_seen(msg_id):
+    if msg_id is None:
+        return True
+    if msg_id in seen_ids:
+        return False
+    seen_ids.add(msg_id)
+    seen_order.append(msg_id)
+    if len(seen_order) > 10000:
+        seen_ids.discard(seen_order.popleft())
+    return True
+
+# binary batch format (Content-Type BINARY_TYPE), all integers big-endian:
+#   count (u32), then per message: sender length (u16) | id length (u16) |
+#   msg length (u32) | sender | id | msg (JSON-encoded)
+BINARY_TYPE = "application/x-p2p-batch"
+FORMATS_HEADER = "X-Message-Formats" # formats a node accepts, sent on every /message reply.
+_COUNT = struct.Struct("!I")
+_FRAME = struct.Struct("!HHI")
+
+def encode_batch(messages):
+    parts = [_COUNT.pack(len(messages))]
+    for m in messages:
+        sender = (m.get("sender") or "").encode()
+        msg_id = (m.get("id") or "").encode()
+        msg = json.dumps(m.get("msg"), separators=(",", ":")).encode()
+        parts += [_FRAME.pack(len(sender), len(msg_id), len(msg)), sender, msg_id, msg]
+    return b"".join(parts)
+
+def decode_batch(data):
+    """Inverse of encode_batch. Raises struct.error or ValueError for a truncated or malformed batch."""
+    (count,), pos = _COUNT.unpack_from(data), _COUNT.size
+    messages = []
+    for _ in range(count):
+        slen, ilen, mlen = _FRAME.unpack_from(data, pos)
+        pos += _FRAME.size
+        if pos + slen + ilen + mlen > len(data):
+            raise ValueError("truncated batch")
+        sender = data[pos:pos + slen].decode()
+        msg_id = data[pos + slen:pos + slen + ilen].decode() or None
+        pos += slen + ilen
+        msg = json.loads(data[pos:pos + mlen])
+        pos += mlen
+        messages.append({"sender": sender, "id": msg_id, "msg": msg})
+    return messages
+
+def received(m):
+    if first_time_seen(m.get("id")):
+        print(f"Received message from {m.get('sender')}: {m.get('msg')}", flush=True)
+
 @app.route('/message', methods=['POST'])
 def message():
     """
     receives messages from other nodes and logs them
     logs the message sender and contents 
+    accepts one message, a JSON batch { "messages": [...] }, or a binary batch.
+    in tree mode, "relay" lists peers this node passes the message on to;
+    their delivery results are returned in "results". Relay targets that are
+    not live members of our gossip view are not contacted.
     returns confirmation JSON { "status": "received" }.
     """
-    data = request.json
-    sender = data.get("sender")
+    if request.mimetype == BINARY_TYPE:
+        try:
+            batch = decode_batch(request.get_data())
+        except (struct.error, ValueError):
+            return jsonify({"error": "Malformed binary batch"}), 400
+        for m in batch:
+            received(m)
+        response = jsonify({"status": "received", "count": len(batch)})
+    else:
+        data = request.json
+        if isinstance(data.get("messages"), list):
+            for m in data["messages"]:
+                received(m)
+            response = jsonify({"status": "received", "count": len(data["messages"])})
+        else:
+            received(data)
+            relay = data.get("relay") if isinstance(data.get("relay"), list) else []
+            live = set(membership.live_peers())
+            if relay:
+                body = {"sender": data.get("sender"), "msg": data.get("msg"), "id": data.get("id")}
+                results = {u: "error: not a member" for u in relay if u not in live}
+                results.update(broadcast([u for u in relay if u in live], body))
+                response = jsonify({"status": "received", "results": results})
+            else:
+                response = jsonify({"status": "received"})
+    response.headers[FORMATS_HEADER] = "json, binary"
+    return response
+
+class PeerQueue:
+    """Messages waiting to go to one peer, and whether that peer accepts binary batches."""
+
+    def __init__(self):
+        self.messages = []
+        self.bytes = 0
+        self.since = None # when the oldest queued message arrived.
+        self.binary = False # learned from the peer's X-Message-Formats header.
+        self.sending = False # a batch is in flight; the next one waits so order is kept.
+        self.failures = 0 # failed sends of the batch at the head of the queue.
+        self.retry_at = 0.0 # monotonic time before which a failed batch is not resent.
+
+    def due(self, delay):
+        """When this queue should be sent next (a full queue is due now, unless it is backing off)."""
+        if len(self.messages) >= BATCH_MAX_MESSAGES or self.bytes >= BATCH_MAX_BYTES:
+            return self.retry_at
+        return max(self.since + delay, self.retry_at)
+
+send_queues = {} # peer URL -> PeerQueue
+queue_cond = threading.Condition()
+def queued_size(m):
+    """Approximate bytes a queued message adds to a batch (frame header + sender + id + msg)."""
+    return _FRAME.size + len(m["sender"]) + len(m["id"]) + len(json.dumps(m["msg"]))
+
+send_stats = {"queued": 0, "batches": 0, "messages": 0, "bytes": 0, "binary_batches": 0, "failed": 0, "retried": 0, "dropped": 0}
+
+def queue_message(peer, msg):
+    """Queue a message for a peer; it is sent with the next batch for that peer."""
+    m = {"sender": my_url, "id": str(uuid.uuid4()), "msg": msg}
+    with queue_cond:
+        q = send_queues.setdefault(peer, PeerQueue())
+        if q.since is None:
+            q.since = time.monotonic()
+        q.messages.append(m)
+        q.bytes += queued_size(m)
+        send_stats["queued"] += 1
+        if len(q.messages) == 1 or len(q.messages) >= BATCH_MAX_MESSAGES or q.bytes >= BATCH_MAX_BYTES:
+            queue_cond.notify() # a new earliest due time, or a full queue.
+
+def send_batch(peer, q, batch):
+    if q.binary:
+        data, headers = encode_batch(batch), {"Content-Type": BINARY_TYPE}
+    else:
+        data, headers = json.dumps({"messages": batch}).encode(), {"Content-Type": "application/json"}
+    try:
+        res = session.post(f"{peer}/message", data=data, headers=headers, timeout=BROADCAST_TIMEOUT)
+        ok = res.ok
+        if MESSAGE_FORMAT == "binary" and "binary" in res.headers.get(FORMATS_HEADER, ""):
+            q.binary = True
+    except requests.RequestException as e:
+        print(f"[WARN] Could not send batch to {peer}: {e}", flush=True)
+        ok = False
+    with queue_cond:
+        q.sending = False
+        send_stats["batches"] += 1
+        send_stats["messages"] += len(batch)
+        send_stats["bytes"] += len(data)
+        send_stats["binary_batches"] += headers["Content-Type"] == BINARY_TYPE
+        if ok:
+            q.failures, q.retry_at = 0, 0.0
+        else:
+            q.failures += 1
+            if q.failures < BATCH_RETRIES:
+                # put the batch back in front so order is kept, and back off before resending it.
+                q.messages = batch + q.messages
+                q.bytes += sum(queued_size(m) for m in batch)
+                q.since = time.monotonic()
+                q.retry_at = q.since + BROADCAST_TIMEOUT * 2 ** (q.failures - 1)
+                send_stats["retried"] += len(batch)
+            else:
+                q.failures, q.retry_at = 0, 0.0
+                send_stats["failed"] += len(batch)
+        queue_cond.notify()
+
+def flush_queues():
+    """
+    Send each peer's queue once it is full or its oldest message waited BATCH_DELAY_MS.
+    Sleeps until the earliest queue is due (or until queue_message/send_batch
+    notify). Queues for peers that gossip reports dead are dropped. A failed
+    batch is resent up to BATCH_RETRIES times with backoff, then dropped.
+    """
+    delay = BATCH_DELAY_MS / 1000.0
+    with queue_cond:
+        while True:
+            now = time.monotonic()
+            timeout = None
+            for peer, q in list(send_queues.items()):
+                if q.sending:
+                    continue
+                if membership.is_dead(peer):
+                    send_stats["dropped"] += len(q.messages)
+                    del send_queues[peer]
+                    continue
+                if not q.messages:
+                    continue
+                due = q.due(delay)
+                if due > now:
+                    timeout = due - now if timeout is None else min(timeout, due - now)
+                    continue
+                batch, q.messages, q.bytes, q.since = q.messages[:BATCH_MAX_MESSAGES], q.messages[BATCH_MAX_MESSAGES:], 0, None
+                if q.messages:
+                    q.since = now
+                    q.bytes = sum(queued_size(m) for m in q.messages)
+                q.sending = True
+                broadcast_pool.submit(send_batch, peer, q, batch)
+            # the lock is only released while waiting, so no notify is missed.
+            queue_cond.wait(timeout=timeout)
+
+@app.route('/send', methods=['POST'])
+def send():
+    """
+    Queue { "msg": ..., "peer": url } for one peer, or for every peer when
+    "peer" is left out. Messages are delivered in batches (see flush_queues).
+    """
+    data = request.get_json(silent=True) or {}
     msg = data.get("msg")
-    print(f"Received message from {sender}: {msg}", flush=True)
-    return jsonify({"status": "received"})
+    if msg is None:
+        return jsonify({"error": "JSON must contain 'msg'"}), 400
+    targets = [data["peer"]] if data.get("peer") else sorted(peers)
+    for peer in targets:
+        queue_message(peer, msg)
+    return jsonify({"status": "queued", "peers": len(targets)})
+
+@app.route('/send/stats', methods=['GET'])
+def send_stats_route():
+    """Batches, messages and bytes sent through the per-peer queues."""
+    with queue_cond:
+        stats = dict(send_stats)
+        stats["waiting"] = sum(len(q.messages) for q in send_queues.values())
+        stats["binary_peers"] = sum(1 for q in send_queues.values() if q.binary)
+    stats["messages_per_batch"] = round(stats["messages"] / stats["batches"], 1) if stats["batches"] else 0
+    return jsonify(stats)
 
 #get peer list when requested 
 @app.route('/peers', methods=['GET'])
 def get_peers():
     return jsonify({"peers": list(peers)}) # Converts set → list for JSON serialization.
 
+# gossip membership
+@app.route('/gossip', methods=['POST'])
+def gossip():
+    """Push-pull exchange: merge the sender's membership updates and reply with ours."""
+    data = request.get_json(silent=True) or {}
+    membership.bytes_received += request.content_length or 0
+    reply = membership.handle_gossip(data)
+    sync_peers()
+    return jsonify(reply)
+
+@app.route('/gossip/ping-req', methods=['POST'])
+def gossip_ping_req():
+    """Indirect probe: check a member on behalf of a node that could not reach it."""
+    target = (request.get_json(silent=True) or {}).get("target")
+    ok = bool(target) and http_send(target, "/gossip", {"from": my_url, "updates": []}) is not None
+    return jsonify({"ok": ok})
+
+@app.route('/membership', methods=['GET'])
+def get_membership():
+    """Gossip view of every member plus round count and bytes per round."""
+    with membership.lock:
+        members = {u: dict(m) for u, m in membership.members.items()}
+    return jsonify({"self": my_url, "members": members, "stats": membership.stats()})
+
+@app.route('/broadcast', methods=['POST'])
+def broadcast_message():
+    """Send { "msg": ... } to every peer; returns per-peer delivery results and the total time."""
+    msg = (request.get_json(silent=True) or {}).get("msg")
+    if msg is None:
+        return jsonify({"error": "JSON must contain 'msg'"}), 400
+    return jsonify(send_message_to_peers(msg))
+
+def deliver(peer, body, relay):
+    """
+    POST one message to a peer, asking it to relay to `relay`.
+    Returns {peer: "ok" or error, ...} for the peer and, in tree mode, the
+    peers in its subtree that it reported on.
+    """
+    # a relay answers after its own subtree, so it gets one timeout per tree level.
+    levels = 1 + (math.ceil(math.log(len(relay) + 1, BROADCAST_FANOUT)) if relay else 0)
+    try:
+        res = session.post(f"{peer}/message", json={**body, "relay": relay}, timeout=BROADCAST_TIMEOUT * levels)
+        if not res.ok:
+            return {peer: f"HTTP {res.status_code}"}
+        results = {peer: "ok"}
+        results.update((res.json() or {}).get("results") or {})
+        return results
+    except (requests.RequestException, ValueError) as e:
+        print(f"[WARN] Could not send to {peer}: {e}", flush=True)
+        return {peer: f"error: {type(e).__name__}"}
+
+def broadcast(targets, body):
+    """
+    Deliver `body` to every target in parallel (at most BROADCAST_WORKERS at once).
+
+    In tree mode with more than BROADCAST_FANOUT targets, the targets are split
+    into BROADCAST_FANOUT groups: we send to the first peer of each group and it
+    relays to the rest, so no node sends more than BROADCAST_FANOUT messages.
+    If a relay can't be reached, we deliver to its group ourselves.
+    """
+    if BROADCAST_MODE == "tree" and len(targets) > BROADCAST_FANOUT:
+        size = math.ceil(len(targets) / BROADCAST_FANOUT)
+        groups = [targets[i:i + size] for i in range(0, len(targets), size)]
+    else:
+        groups = [[t] for t in targets]
+    futures = [(g, broadcast_pool.submit(deliver, g[0], body, g[1:])) for g in groups]
+    results = {}
+    for group, future in futures:
+        res = future.result()
+        results.update(res)
+        if res.get(group[0]) != "ok" and len(group) > 1:
+            results.update(broadcast(group[1:], body))
+    return results
+
 def send_message_to_peers(msg):
-    for peer in list(peers):
-        try:
-            requests.post(f"{peer}/message", json={"sender": my_url, "msg": msg})
-        except Exception as e:
-            print(f"[WARN] Could not send to {peer}: {e}", flush=True)
+    """
+    Broadcast a message to every known peer.
+    Returns the per-peer results ("ok" or the error), how many were delivered
+    and the total broadcast time.
+    """
+    start = time.perf_counter()
+    body = {"sender": my_url, "msg": msg, "id": str(uuid.uuid4())}
+    results = broadcast(sorted(peers), body)
+    return {
+        "mode": BROADCAST_MODE,
+        "delivered": sum(1 for r in results.values() if r == "ok"),
+        "peers": len(results),
+        "seconds": round(time.perf_counter() - start, 4),
+        "results": results,
+    }
+
+def simulate_gossip(n, max_rounds=100):
+    """
+    Measure convergence in memory: n nodes start knowing only the first
+    node, then gossip until every node sees all n. Prints rounds needed and
+    bytes per node per round.
+    """
+    nodes = {f"http://sim{i}:5000": Membership(f"http://sim{i}:5000") for i in range(n)}
+    urls = list(nodes)
+    for url in urls[1:]:
+        nodes[url].seed([urls[0]])
+
+    def send(url, path, body):
+        if path == "/gossip":
+            return nodes[url].handle_gossip(body)
+        return {"ok": True}
+
+    for rnd in range(1, max_rounds + 1):
+        for m in nodes.values():
+            m.gossip_round(send)
+        known = min(len(m.live_peers()) for m in nodes.values())
+        per_node = sum(m.round_bytes[-1] for m in nodes.values()) / n
+        print(f"round {rnd}: every node knows >= {known}/{n - 1} peers, {per_node:.0f} bytes/node")
+        if known == n - 1:
+            print(f"converged after {rnd} rounds ({rnd * GOSSIP_INTERVAL:g}s at GOSSIP_INTERVAL={GOSSIP_INTERVAL:g})")
+            return
+    print(f"not converged after {max_rounds} rounds")
 
 if __name__ == '__main__':
     """
     First registers with the bootstrap node.
-    Then fetches the current peer list.
+    Then keeps membership up to date by gossip.
     Starts Flask server accessible externally on port 5000 (inside the container).
+    `python p2p_node.py --simulate 200` measures gossip convergence instead.
     """
+    if len(sys.argv) > 2 and sys.argv[1] == "--simulate":
+        simulate_gossip(int(sys.argv[2]))
+        sys.exit(0)
     register_with_bootstrap(port)
-    threading.Thread(target=continuous_discovery, daemon=True).start()
+    threading.Thread(target=gossip_loop, daemon=True).start()
+    threading.Thread(target=keep_registered, daemon=True).start()
+    threading.Thread(target=flush_queues, daemon=True).start()
     app.run(host='0.0.0.0', port=port)
     #start flask on all interfaces 0.0.0.0 
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# bootstrap.py and p2p_node.py are imported as top-level modules (run from Project 3/).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,64 @@
+from collections import deque
+
+import pytest
+
+pytest.importorskip("flask")
+import bootstrap  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(bootstrap, "registered_peers", {})
+    monkeypatch.setattr(bootstrap, "version", 0)
+    monkeypatch.setattr(bootstrap, "changes", deque(maxlen=4))
+
+
+def test_peers_since_reports_last_change_per_peer():
+    bootstrap._record("add", "a")
+    bootstrap._record("add", "b")
+    bootstrap._record("remove", "a")
+    bootstrap._record("add", "c")
+    assert bootstrap.peers_since(0) == {"added": ["b", "c"], "removed": ["a"]}
+    assert bootstrap.peers_since(2) == {"added": ["c"], "removed": ["a"]}
+    assert bootstrap.peers_since(4) == {"added": [], "removed": []}
+
+
+def test_peers_since_outside_the_change_log():
+    for i in range(6):
+        bootstrap._record("add", f"p{i}")  # p0..p5 get versions 1..6; the log keeps 3..6
+    assert bootstrap.peers_since(1) is None
+    assert bootstrap.peers_since(2) == {"added": ["p2", "p3", "p4", "p5"], "removed": []}
+    assert bootstrap.peers_since(7) is None  # newer than anything we issued
+
+
+def test_parse_since():
+    bootstrap._record("add", "a")
+    assert bootstrap.parse_since(bootstrap.version_token()) == 1
+    assert bootstrap.parse_since("other.1") is None
+    assert bootstrap.parse_since(f"{bootstrap.EPOCH}.x") is None
+    assert bootstrap.parse_since(None) is None
+
+
+def test_expired_peers_are_removed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bootstrap.time, "time", lambda: now[0])
+    client = bootstrap.app.test_client()
+    first = client.post("/register", json={"peer": "a"}).get_json()
+    assert first["full"] and first["peers"] == ["a"]
+    now[0] += bootstrap.PEER_TTL
+    delta = client.post("/register", json={"peer": "b", "since": first["version"]}).get_json()
+    assert not delta["full"]
+    assert delta["added"] == ["b"] and delta["removed"] == ["a"]
+
+
+def test_get_peers_etag_and_delta():
+    client = bootstrap.app.test_client()
+    client.post("/register", json={"peer": "a"})
+    res = client.get("/peers")
+    tag, token = res.headers["ETag"], res.get_json()["version"]
+    assert client.get("/peers", headers={"If-None-Match": tag}).status_code == 304
+    client.post("/register", json={"peer": "b"})
+    assert client.get("/peers", headers={"If-None-Match": tag}).status_code == 200
+    delta = client.get("/peers", query_string={"since": token}).get_json()
+    assert delta["full"] is False and delta["added"] == ["b"]
+    assert client.post("/register", json={}).status_code == 400
@@ -0,0 +1,95 @@
+import struct
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("requests")
+import p2p_node  # noqa: E402
+from p2p_node import Membership, PeerQueue, decode_batch, encode_batch  # noqa: E402
+
+
+def test_batch_round_trip():
+    batch = [
+        {"sender": "http://a:5000", "id": "1", "msg": "hello"},
+        {"sender": "http://b:5000", "id": "2", "msg": {"n": [1, 2.5, None], "s": "ünïcode"}},
+        {"sender": "", "id": "3", "msg": ""},
+    ]
+    assert decode_batch(encode_batch(batch)) == batch
+    assert decode_batch(encode_batch([])) == []
+
+
+def test_batch_without_id():
+    assert decode_batch(encode_batch([{"sender": "s", "msg": 1}])) == [{"sender": "s", "id": None, "msg": 1}]
+
+
+@pytest.mark.parametrize("cut", [2, 6, 12, 15, -1])
+def test_truncated_batch_is_rejected(cut):
+    data = encode_batch([{"sender": "s", "id": "1", "msg": 12345}])
+    with pytest.raises((struct.error, ValueError)):
+        decode_batch(data[:cut])
+
+
+def test_queue_due(monkeypatch):
+    monkeypatch.setattr(p2p_node, "BATCH_MAX_MESSAGES", 2)
+    q = PeerQueue()
+    q.messages, q.since = ["m"], 10.0
+    assert q.due(0.01) == 10.01
+    q.retry_at = 12.0
+    assert q.due(0.01) == 12.0
+    q.messages.append("m")
+    q.retry_at = 0.0
+    assert q.due(0.01) == 0.0  # a full queue is due now
+
+
+def test_refute_suspicion_with_newer_incarnation():
+    m = Membership("http://me")
+    inc = m.incarnation
+    m.apply([{"url": "http://me", "status": "suspect", "incarnation": inc}])
+    assert m.incarnation == inc + 1
+    assert m.members["http://me"]["status"] == "alive"
+
+
+def test_newer_update_wins():
+    m = Membership("http://me")
+    m.apply([{"url": "http://p", "status": "alive", "incarnation": 3}])
+    assert m.apply([{"url": "http://p", "status": "alive", "incarnation": 2}]) == 0
+    assert m.apply([{"url": "http://p", "status": "suspect", "incarnation": 3}]) == 1
+    assert m.apply([{"url": "http://p", "status": "alive", "incarnation": 3}]) == 0
+    assert m.apply([{"url": "http://p", "status": "alive", "incarnation": 4}]) == 1
+    assert m.live_peers() == ["http://p"]
+
+
+def test_suspect_expires_to_dead(monkeypatch):
+    m = Membership("http://me")
+    m.apply([{"url": "http://p", "status": "alive", "incarnation": 1}])
+    m.suspect("http://p")
+    assert m.live_peers() == ["http://p"] and not m.is_dead("http://p")
+    m.members["http://p"]["since"] -= p2p_node.SUSPECT_TIMEOUT + 1
+    m.expire_suspects()
+    assert m.is_dead("http://p")
+    assert m.live_peers() == []
+
+
+def test_gossip_converges():
+    nodes = {f"http://n{i}": Membership(f"http://n{i}") for i in range(30)}
+    urls = list(nodes)
+    for url in urls[1:]:
+        nodes[url].seed([urls[0]])
+
+    def send(url, path, body):
+        return nodes[url].handle_gossip(body) if path == "/gossip" else {"ok": True}
+
+    for _ in range(30):
+        for m in nodes.values():
+            m.gossip_round(send)
+        if all(len(m.live_peers()) == len(urls) - 1 for m in nodes.values()):
+            break
+    assert all(len(m.live_peers()) == len(urls) - 1 for m in nodes.values())
+
+
+def test_only_anchors_renew_registration(monkeypatch):
+    monkeypatch.setattr(p2p_node, "BOOTSTRAP_ANCHORS", 2)
+    monkeypatch.setattr(p2p_node, "my_url", "http://b")
+    assert p2p_node.should_renew([])  # not in the cluster yet
+    assert p2p_node.should_renew(["http://c", "http://a"])
+    assert not p2p_node.should_renew(["http://a", "http://a2", "http://c"])
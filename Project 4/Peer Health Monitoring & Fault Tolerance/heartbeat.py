@@ -1,5 +1,7 @@
 from flask import Flask, request, jsonify, send_from_directory
-import os, requests, threading, time, sys
+import os, requests, threading, time, sys, math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 STORAGE_DIR = "./storage"
@@ -8,13 +10,73 @@ os.makedirs(STORAGE_DIR, exist_ok=True)
 #key-value store
 kv_store = {}
 
-# peer list
-peers = [
+# all known peers; they stay known while down so they can be re-admitted
+known_peers = [
     "http://localhost:5001",
     "http://localhost:5002",
     "http://localhost:5003"
 ]
 
+# peers currently considered alive (suspicion below PHI_THRESHOLD)
+peers = list(known_peers)
+
+#failure detection settings
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "5"))  # seconds between probe rounds
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "2"))  # per-probe timeout
+PHI_THRESHOLD = float(os.getenv("PHI_THRESHOLD", "8"))  # suspicion above which a peer is dropped
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", "16"))  # probes run at the same time
+
+probe_pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+session = requests.Session()  # keep-alive connections reused between rounds
+state_lock = threading.Lock()
+
+
+class PeerState:
+    """Heartbeat history of one peer and its phi-accrual suspicion level."""
+
+    def __init__(self):
+        self.intervals = deque(maxlen=100)  # seconds between consecutive successful heartbeats
+        self.last_heartbeat = time.time()  # start as if just heard, so new peers are not suspected
+        self.streak = False  # the previous probe succeeded
+        self.rtt = None  # smoothed round-trip time in seconds
+        self.probes = 0
+        self.failures = 0
+
+    def heard(self, now, rtt):
+        # Only gaps between two successful probes in a row are samples of the normal
+        # heartbeat rhythm; the first beat after an outage would otherwise add the
+        # whole outage as one interval and make the peer look "slow but fine" for a long time.
+        if self.streak:
+            self.intervals.append(now - self.last_heartbeat)
+        self.streak = True
+        self.last_heartbeat = now
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+
+    def missed(self):
+        self.failures += 1
+        self.streak = False
+
+    def phi(self, now):
+        """
+        Suspicion that the peer has failed, from how late its heartbeat is
+        compared with the usual gap between heartbeats (phi = -log10 of the
+        probability it is still alive: 1 = 10% chance of a mistake, 8 = 1e-8).
+        """
+        if self.intervals:
+            mean = sum(self.intervals) / len(self.intervals)
+            var = sum((x - mean) ** 2 for x in self.intervals) / len(self.intervals)
+        else:
+            mean, var = PROBE_INTERVAL, 0.0
+        std = max(math.sqrt(var), mean / 4, 0.1)  # floor, so a perfectly regular peer isn't suspected instantly
+        y = (now - self.last_heartbeat - mean) / std
+        # logistic approximation of the normal CDF
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        p_later = e / (1 + e) if y > 0 else 1 - 1 / (1 + e)
+        return -math.log10(max(p_later, 1e-300))
+
+
+peer_states = {peer: PeerState() for peer in known_peers}
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     file = request.files['file']
@@ -33,26 +95,74 @@ def heartbeat():
     return jsonify({"status": "alive"}), 200
 
 
+#per-peer round-trip time and suspicion level
+@app.route('/heartbeat/stats', methods=['GET'])
+def heartbeat_stats():
+    now = time.time()
+    with state_lock:
+        stats = {
+            peer: {
+                "alive": peer in peers,
+                "phi": round(st.phi(now), 3),
+                "rtt_ms": round(st.rtt * 1000, 2) if st.rtt is not None else None,
+                "since_last_heartbeat": round(now - st.last_heartbeat, 3),
+                "probes": st.probes,
+                "failures": st.failures,
+            }
+            for peer, st in peer_states.items()
+        }
+    return jsonify({"phi_threshold": PHI_THRESHOLD, "interval": PROBE_INTERVAL, "peers": stats})
+
+
 @app.route('/add_peer', methods=['POST'])
 def add_peer():
     peer = request.json.get("peer")
-    if peer and peer not in peers:
-        peers.append(peer)
+    with state_lock:
+        if peer and peer not in known_peers:
+            known_peers.append(peer)
+            peer_states[peer] = PeerState()
+        if peer and peer not in peers:
+            peers.append(peer)
     return jsonify({"status": "peer added", "peers": peers})
 
+def probe(peer):
+    """Send one heartbeat; returns the round-trip time in seconds, or None if it failed."""
+    start = time.perf_counter()
+    try:
+        res = session.get(f"{peer}/heartbeat", timeout=PROBE_TIMEOUT)
+        if res.status_code == 200:
+            return time.perf_counter() - start
+    except requests.RequestException:
+        pass
+    return None
+
 def monitor_peers(): #checking for periodic heartbeat
     global peers
     while True:
-        alive = []
-        for peer in peers:
-            try:
-                res = requests.get(f"{peer}/heartbeat", timeout=2)
-                if res.status_code == 200:
+        started = time.time()
+        with state_lock:
+            targets = list(known_peers)
+        # all peers are probed at once, so a round takes at most PROBE_TIMEOUT
+        rtts = dict(zip(targets, probe_pool.map(probe, targets)))
+        now = time.time()
+        with state_lock:
+            alive = []
+            for peer in known_peers:
+                st = peer_states[peer]
+                if peer in rtts:
+                    st.probes += 1
+                    if rtts[peer] is None:
+                        st.missed()
+                    else:
+                        st.heard(now, rtts[peer])
+                if st.phi(now) < PHI_THRESHOLD:
                     alive.append(peer)
-            except:
-                print(f"Peer {peer} is unresponsive")
-        peers = alive #update list 
-        time.sleep(5)
+            for peer in set(peers) - set(alive):
+                print(f"Peer {peer} is unresponsive (phi {peer_states[peer].phi(now):.1f})")
+            for peer in set(alive) - set(peers):
+                print(f"Peer {peer} is back")
+            peers = alive #update list
+        time.sleep(max(0.0, PROBE_INTERVAL - (time.time() - started)))
 
 
 if __name__ == "__main__":
@@ -6,10 +6,18 @@ Citation(s):
 
 import os # working with paths and environment variables.
 import hashlib # computing SHA-1 hashes (used to map nodes and keys onto the DHT ring).
-from typing import Dict, List # type hints to make code clearer (Dict[str, str], etc.).
+import json # saved membership file.
+import bisect # binary search over the sorted ring tokens.
+import threading # locks and semaphores for the shared inter-node connection pools.
+import time # measuring pool wait time and retry backoff.
+from collections import deque # ordered windows of in-flight chunk transfers.
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # parallel fan-out to peers/replicas.
+from typing import Dict, List, Optional # type hints to make code clearer (Dict[str, str], etc.).
 import requests # to send HTTP requests to other nodes (forwarding).
+from requests.adapters import HTTPAdapter # per-peer keep-alive connection pool.
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError # telling "never connected" apart.
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, g, request, jsonify, send_from_directory
 # flask imports:
 # Flask – main application class.
 # request – incoming HTTP request object.
@@ -17,42 +25,79 @@ from flask import Flask, request, jsonify, send_from_directory
 # send_from_directory – helper to send files from a folder.
 
 from werkzeug.utils import secure_filename # sanitizes file names so users can’t inject weird paths.
+from werkzeug.http import parse_content_range_header # parsing Content-Range of resumable uploads.
+import tempfile # upload temp files created inside STORAGE_DIR so finishing is a rename.
+
+import atexit # flush the write-ahead log on shutdown.
+from kv_persistence import KVPersistence # write-ahead log + snapshots for kv_store.
+from kv_engine import open_engine # storage engine behind kv_store.
+from kv_cache import ReadCache, LeaseTable # hot-key read cache + leases that invalidate it.
 
 import logging
-from datetime import datetime
+import logging.handlers # QueueHandler/QueueListener: log records are written by a background thread.
+import queue
+import random # sampling of per-request log lines.
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE # Prometheus-style /metrics.
 
 # Logging Setup
+# LOG_LEVEL gates logging before any message is formatted (messages use
+# %-style arguments, formatted only when a record is actually emitted).
+# LOG_REQUEST_SAMPLE is the fraction of per-request log lines kept
+# (1.0 = every request, 0.01 = one in a hundred); warnings and errors are
+# never sampled.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_REQUEST_SAMPLE = float(os.getenv("LOG_REQUEST_SAMPLE", "1.0"))
+
 class LogFormat(logging.Formatter):
     """Custom log formatter with timestamps."""
+    _cached_second = None
+    _cached_stamp = ""
+
     def format(self, record):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        level = record.levelname
-        message = record.getMessage()
-        return f"[{timestamp}] [{level}] {message}"
+        # Records are created with a timestamp already; the formatted second
+        # is cached so strftime runs at most once per second.
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+            self._cached_second = second
+        return f"[{self._cached_stamp}] [{record.levelname}] {record.getMessage()}"
 
 
 logger = logging.getLogger("DHT_Node")
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
 
+# Request threads only put records on a queue; a listener thread formats
+# them and writes to stderr, so slow terminal/pipe writes never block a request.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
 _stream_handler = logging.StreamHandler()
 _stream_handler.setFormatter(LogFormat())
+_log_listener = logging.handlers.QueueListener(_log_queue, _stream_handler)
 # Avoid adding multiple handlers if app.py is reloaded
 if not logger.handlers:
-    logger.addHandler(_stream_handler)
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+def log_info(msg: str, *args) -> None:
+    logger.info(msg, *args)
 
-def log_info(msg: str) -> None:
-    logger.info(msg)
+def log_warn(msg: str, *args) -> None:
+    logger.warning(msg, *args)
 
-def log_warn(msg: str) -> None:
-    logger.warning(msg)
+def log_error(msg: str, *args) -> None:
+    logger.error(msg, *args)
 
-def log_error(msg: str) -> None:
-    logger.error(msg)
+def log_request(msg: str, *args) -> None:
+    """Per-request INFO log line, kept for a LOG_REQUEST_SAMPLE fraction of calls."""
+    if logger.isEnabledFor(logging.INFO) and (LOG_REQUEST_SAMPLE >= 1.0 or random.random() < LOG_REQUEST_SAMPLE):
+        logger.info(msg, *args)
 
 # Configuration
 
-# Base directory for file storage
-STORAGE_DIR = os.path.join(os.path.dirname(__file__), "storage")
+# Base directory for file storage (override with STORAGE_DIR to run several
+# nodes from one checkout)
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(os.path.dirname(__file__), "storage"))
 
 # Ensure storage directory exists
 os.makedirs(STORAGE_DIR, exist_ok=True)
@@ -66,6 +111,21 @@ SELF_URL = os.getenv("SELF_URL", "http://localhost:5000")
 # "http://node1:5000,http://node2:5000,http://node3:5000"
 PEERS_ENV = os.getenv("PEERS", "")
 
+# number of virtual nodes (ring positions) each peer gets; more virtual
+# nodes give a more even key spread at the cost of a larger ring.
+VNODES = int(os.getenv("VNODES", "64"))
+
+# replication: every key is stored on REPLICATION_FACTOR (N) distinct nodes –
+# its owner plus the next successors on the ring. A write succeeds once
+# WRITE_QUORUM (W) replicas acknowledge it, a read once READ_QUORUM (R)
+# replicas answer. With R + W > N (the defaults: 2 + 2 > 3) every read
+# overlaps the last acknowledged write; a lower R trades that for latency.
+REPLICATION_FACTOR = int(os.getenv("REPLICATION_FACTOR", "3"))
+WRITE_QUORUM = int(os.getenv("WRITE_QUORUM", "2"))
+READ_QUORUM = int(os.getenv("READ_QUORUM", "2"))
+# if a replica has not answered a read within this delay, also ask the next one.
+HEDGE_DELAY_MS = float(os.getenv("HEDGE_DELAY_MS", "20"))
+
 
 def parse_peers(peers_env: str) -> List[str]:
     """
@@ -80,7 +140,7 @@ def parse_peers(peers_env: str) -> List[str]:
     if SELF_URL not in peers:
         peers.append(SELF_URL)
     unique_peers = sorted(set(peers))
-    log_info(f"Configured peers: {unique_peers}")
+    log_info("Configured peers: %s", unique_peers)
     return unique_peers
 
 PEERS: List[str] = parse_peers(PEERS_ENV)
@@ -91,51 +151,499 @@ def sha1_to_int(value: str) -> int:
     h = hashlib.sha1(value.encode("utf-8")).hexdigest()
     return int(h, 16)  # a big integer representing the hash position on the ring.
 
-def build_ring(peers: List[str]) -> List[Dict]:
+def build_ring(peers: List[str], vnodes: int = VNODES) -> List[Dict]:
     """
-    Build a sorted list of nodes on the ring.
-    Each element: {"url": url, "id": int_hash}
+    Build a sorted list of virtual nodes on the ring.
+
+    Each peer is hashed onto the ring `vnodes` times (token = SHA1("url#i")),
+    so every peer owns many small arcs instead of one large one and keys are
+    spread more evenly.
+    Each element: {"url": url, "id": int_hash, "vnode": i}
     """
-    ring = [{"url": url, "id": sha1_to_int(url)} for url in peers]
+    ring = [
+        {"url": url, "id": sha1_to_int(f"{url}#{i}"), "vnode": i}
+        for url in peers
+        for i in range(vnodes)
+    ]
     ring.sort(key=lambda n: n["id"])
-    log_info(f"DHT ring built with nodes: {ring}")
+    log_info("DHT ring built with %s nodes x %s virtual nodes", len(peers), vnodes)
     return ring
 
+# Membership changes made at runtime (POST /membership/join, /leave) are
+# saved here so a restarted node rejoins with the current peer list rather
+# than the one in its PEERS environment variable. Delete it to go back to PEERS.
+# _meta is internal (see is_internal_name), so uploads cannot replace it.
+META_DIR = os.path.join(STORAGE_DIR, "_meta")
+MEMBERSHIP_FILE = os.path.join(META_DIR, "membership.json")
+LEGACY_MEMBERSHIP_FILE = os.path.join(STORAGE_DIR, "_membership.json")  # where older nodes saved it
+MEMBERSHIP_EPOCH = 0  # bumped on every membership change; older updates are rejected
+
+os.makedirs(META_DIR, exist_ok=True)
+
+def valid_membership(peers, epoch) -> bool:
+    """True for a non-empty list of peer URLs and a non-negative integer epoch."""
+    return (
+        isinstance(peers, list)
+        and len(peers) > 0
+        and all(isinstance(url, str) and url for url in peers)
+        and isinstance(epoch, int)
+        and not isinstance(epoch, bool)
+        and epoch >= 0
+    )
+
+def load_membership() -> None:
+    """Replace PEERS with the saved membership, if this node has one."""
+    global PEERS, MEMBERSHIP_EPOCH
+    if not os.path.exists(MEMBERSHIP_FILE) and os.path.exists(LEGACY_MEMBERSHIP_FILE):
+        os.replace(LEGACY_MEMBERSHIP_FILE, MEMBERSHIP_FILE)
+        log_info("Moved %s to %s", LEGACY_MEMBERSHIP_FILE, MEMBERSHIP_FILE)
+    try:
+        with open(MEMBERSHIP_FILE, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        log_warn("Ignoring unreadable %s: %s", MEMBERSHIP_FILE, e)
+        return
+    if not isinstance(saved, dict) or not valid_membership(saved.get("peers"), saved.get("epoch")):
+        log_warn("Ignoring %s: expected {\"peers\": [url, ...], \"epoch\": int}", MEMBERSHIP_FILE)
+        return
+    PEERS = sorted(set(saved["peers"]))
+    MEMBERSHIP_EPOCH = saved["epoch"]
+    log_info("Loaded membership epoch %s: %s", MEMBERSHIP_EPOCH, PEERS)
+
+load_membership()
+
 RING = build_ring(PEERS)
 
+# Sorted array of integer tokens, parallel to RING, used for bisect lookups.
+RING_TOKENS: List[int] = [n["id"] for n in RING]
+
+# (ring, tokens) read together by lookups, so a membership change that
+# replaces both is seen atomically.
+_ring_snapshot = (RING, RING_TOKENS)
+
+def ring_version(peers: List[str], vnodes: int = VNODES) -> str:
+    """Short fingerprint of a ring layout; it changes whenever placement would change."""
+    return hashlib.sha1(f"{vnodes}|{','.join(sorted(peers))}".encode("utf-8")).hexdigest()[:16]
+
+# Sent on every response as X-Ring-Version so clients that route by
+# themselves (dht_client.py) notice when their cached ring is stale.
+RING_VERSION = ring_version(PEERS)
+
 def find_responsible_node(key: str) -> Dict:
     """
     Given a key, find the node dict responsible for it based on the ring.
 
     The algorithm:
         1. Hash the key to an integer.
-        2. Walk the ring in ascending order and return the first node whose
-           ID is >= key hash.
-        3. If none, wrap around and return the first node.
+        2. Binary-search the sorted token array for the first virtual node
+           whose ID is >= key hash (O(log n) instead of a linear scan).
+        3. If none, wrap around and return the first virtual node.
     """
+    ring, tokens = _ring_snapshot
     key_id = sha1_to_int(key)
-    for node in RING:
-        if key_id <= node["id"]:
-            return node
-    # wrap-around
-    return RING[0]
+    idx = bisect.bisect_left(tokens, key_id)
+    if idx == len(tokens):
+        # wrap-around
+        idx = 0
+    return ring[idx]
+
+def ring_replicas(ring: List[Dict], tokens: List[int], key: str) -> List[str]:
+    """
+    Return the replica URLs of a key on the given ring.
+
+    The first entry is the owner; the rest are the next distinct peers
+    walking clockwise around the ring. Virtual nodes of a peer already in
+    the list are skipped.
+    """
+    n = REPLICATION_FACTOR
+    idx = bisect.bisect_left(tokens, sha1_to_int(key))
+    replicas: List[str] = []
+    for i in range(len(ring)):
+        url = ring[(idx + i) % len(ring)]["url"]
+        if url not in replicas:
+            replicas.append(url)
+            if len(replicas) == n:
+                break
+    return replicas
+
+def find_replica_nodes(key: str) -> List[str]:
+    """
+    Return the URLs of the nodes that store replicas of a key.
+
+    The first entry is the owner (same as find_responsible_node).
+    """
+    ring, tokens = _ring_snapshot
+    return ring_replicas(ring, tokens, key)
+
+def apply_membership(peers: List[str], epoch: int) -> List[str]:
+    """
+    Switch this node to a new peer list: rebuild the ring and save it.
+
+    Returns the previous peer list. Requests already running finish on the
+    ring they started with; new lookups use the new ring.
+    """
+    global PEERS, RING, RING_TOKENS, RING_VERSION, MEMBERSHIP_EPOCH, _ring_snapshot
+    old_peers = PEERS
+    ring = build_ring(sorted(set(peers)))
+    tokens = [n["id"] for n in ring]
+    _ring_snapshot = (ring, tokens)
+    PEERS, RING, RING_TOKENS = sorted(set(peers)), ring, tokens
+    RING_VERSION = ring_version(PEERS)
+    MEMBERSHIP_EPOCH = epoch
+
+    tmp = MEMBERSHIP_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"peers": PEERS, "epoch": epoch}, f)
+    os.replace(tmp, MEMBERSHIP_FILE)
+    log_info("Membership epoch %s: %s (ring %s)", epoch, PEERS, RING_VERSION)
+    return old_peers
+
+def ring_load_report(ring: List[Dict]) -> Dict[str, Dict]:
+    """
+    Summarize how much of the hash space each peer owns.
+
+    A virtual node owns the arc (previous token, its token], so a peer's
+    ownership is the sum of its arcs divided by the ring size (2^160).
+    With even spreading each peer should be close to 1 / len(PEERS).
+
+    Returns:
+        { url: {"vnodes": int, "ownership": float} }
+    """
+    report: Dict[str, Dict] = {}
+    if not ring:
+        return report
+    space = 1 << 160  # SHA-1 output range
+    for i, node in enumerate(ring):
+        prev_id = ring[i - 1]["id"] if i > 0 else ring[-1]["id"] - space
+        entry = report.setdefault(node["url"], {"vnodes": 0, "ownership": 0.0})
+        entry["vnodes"] += 1
+        entry["ownership"] += (node["id"] - prev_id) / space
+    for entry in report.values():
+        entry["ownership"] = round(entry["ownership"], 6)
+    return report
 
 def is_local_node(node: Dict) -> bool:
     """Check if the given node dict corresponds to this running node."""
     return node["url"] == SELF_URL
 
 # In-memory Key-Value Store
-kv_store: Dict[str, str] = {}
+# KV_ENGINE picks how keys are held in memory (see kv_engine.py): "dict"
+# (default), "arena" (packed byte arena, a fraction of the memory per key)
+# or "mmap" (arena in a memory-mapped file under STORAGE_DIR/_engine).
+KV_ENGINE = os.getenv("KV_ENGINE", "dict")
+kv_store = open_engine(KV_ENGINE, os.path.join(STORAGE_DIR, "_engine"))
+
+# Last-write-wins version of each key (missing = 0). Replicas only apply a
+# write whose version is not older than the one they already have.
+kv_versions = kv_store.versions
+kv_lock = threading.Lock()
+
+# Durable Persistence
+# Every write to kv_store is appended to a write-ahead log, and the store is
+# periodically compacted into a snapshot (see kv_persistence.py). On startup
+# the snapshot is loaded and the log replayed, so a restart keeps the data.
+KV_PERSISTENCE = os.getenv("KV_PERSISTENCE", "1") == "1"
+KV_DATA_DIR = os.getenv("KV_DATA_DIR", os.path.join(STORAGE_DIR, "_kv"))
+WAL_SYNC_MODE = os.getenv("WAL_SYNC_MODE", "group")  # group | async | off
+WAL_FSYNC_INTERVAL_MS = float(os.getenv("WAL_FSYNC_INTERVAL_MS", "2"))  # how long a commit group may form
+WAL_FSYNC_BATCH = int(os.getenv("WAL_FSYNC_BATCH", "1024"))  # fsync early once this many records wait
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))  # seconds between snapshot checks
+SNAPSHOT_MIN_RECORDS = int(os.getenv("SNAPSHOT_MIN_RECORDS", "100000"))  # new records needed to snapshot
+
+persistence = None
+if KV_PERSISTENCE:
+    persistence = KVPersistence(
+        KV_DATA_DIR,
+        kv_store,
+        kv_versions,
+        sync_mode=WAL_SYNC_MODE,
+        fsync_interval=WAL_FSYNC_INTERVAL_MS / 1000.0,
+        fsync_batch=WAL_FSYNC_BATCH,
+        snapshot_interval=SNAPSHOT_INTERVAL,
+        snapshot_min_records=SNAPSHOT_MIN_RECORDS,
+    )
+    _recovery = persistence.recover()
+    log_info(
+        "Recovered %d keys in %ss (%d from snapshot, %d log records)",
+        _recovery["keys"], _recovery["seconds"], _recovery["snapshot_keys"], _recovery["replayed_records"],
+    )
+    persistence.start()
+    atexit.register(persistence.close)
+
+# Hot-Key Read Cache
+# A node that coordinates a GET for a key it does not replicate caches the
+# answer (KV_CACHE_SIZE entries, 0 = off) for up to KV_CACHE_TTL seconds.
+# The replica that answered grants it a lease on the key and, when it later
+# applies a write to that key, revokes the lease so the cached copy is
+# dropped (see kv_cache.py). KV_LEASE_MAX_KEYS bounds the leases a replica
+# tracks; past it, reads are served without a lease and are not cached.
+# A write is acknowledged once its revocations were confirmed or
+# KV_LEASE_REVOKE_TIMEOUT seconds passed, whichever comes first.
+KV_CACHE_SIZE = int(os.getenv("KV_CACHE_SIZE", "0"))
+KV_CACHE_TTL = float(os.getenv("KV_CACHE_TTL", "5"))
+KV_LEASE_MAX_KEYS = int(os.getenv("KV_LEASE_MAX_KEYS", "100000"))
+KV_LEASE_REVOKE_TIMEOUT = float(os.getenv("KV_LEASE_REVOKE_TIMEOUT", "0.5"))
+KV_REVOKE_WORKERS = int(os.getenv("KV_REVOKE_WORKERS", "8"))
+read_cache = ReadCache(KV_CACHE_SIZE, KV_CACHE_TTL)
+leases = LeaseTable(KV_LEASE_MAX_KEYS)
+
+# Revocations get their own threads: revoke_leases() waits for them and often
+# runs on a fanout_executor thread itself (replica writes from quorum_write
+# or read_repair), so with a shared pool a busy node would wait out
+# KV_LEASE_REVOKE_TIMEOUT on revocations queued behind its own writes.
+revoke_executor = ThreadPoolExecutor(max_workers=KV_REVOKE_WORKERS)
+
+def revoke_leases(versions: Dict[str, int]) -> None:
+    """
+    Tell the nodes caching these keys that they were overwritten, and wait
+    (up to KV_LEASE_REVOKE_TIMEOUT) for them to confirm.
+
+    A holder that fails or does not answer in time keeps its lease, and the
+    key gets no new leases until that lease runs out (LeaseTable.revoke_failed).
+    """
+    by_holder: Dict[str, Dict[str, int]] = {}
+    expiry: Dict[str, Dict[str, float]] = {}
+    for key, version in versions.items():
+        for holder, expires in leases.revoke(key).items():
+            by_holder.setdefault(holder, {})[key] = version
+            expiry.setdefault(holder, {})[key] = expires
+    futures = {}
+    for holder, keys in by_holder.items():
+        if holder == SELF_URL:
+            for key, version in keys.items():
+                read_cache.invalidate(key, version)
+        else:
+            future = revoke_executor.submit(forward_request, holder, "POST", "/kv/cache/invalidate", json={"keys": keys})
+            futures[future] = holder
+    if not futures:
+        return
+    done, _ = wait(futures, timeout=KV_LEASE_REVOKE_TIMEOUT)
+    for future, holder in futures.items():
+        if future in done and future.result()[1] == 200:
+            continue
+        log_warn("Lease revocation for %d keys not confirmed by %s", len(by_holder[holder]), holder)
+        for key, expires in expiry[holder].items():
+            leases.revoke_failed(key, holder, expires)
+
+def local_put(key: str, value, version: int = 0) -> bool:
+    """
+    Store a key on this node, logging it first when persistence is enabled.
+
+    Returns False (and changes nothing) if a newer version is already stored.
+    """
+    if persistence is not None:
+        applied = persistence.put(key, value, version)
+    else:
+        with kv_lock:
+            applied = version >= kv_versions.get(key, 0)
+            if applied:
+                kv_store[key] = value
+                if version:
+                    kv_versions[key] = version
+    if applied:
+        revoke_leases({key: version})
+    return applied
+
+def local_put_many(items: Dict, versions: Optional[Dict[str, int]] = None) -> List[str]:
+    """Store many keys on this node with a single group commit. Returns the keys applied."""
+    versions = versions or {}
+    if persistence is not None:
+        applied = persistence.put_many(items, versions)
+    else:
+        applied = []
+        with kv_lock:
+            for key, value in items.items():
+                version = versions.get(key, 0)
+                if version < kv_versions.get(key, 0):
+                    continue
+                kv_store[key] = value
+                if version:
+                    kv_versions[key] = version
+                applied.append(key)
+    revoke_leases({key: versions.get(key, 0) for key in applied})
+    return applied
+
+def local_delete_many(versions: Dict[str, int]) -> List[str]:
+    """
+    Delete keys from this node's store, skipping any whose version changed
+    since `versions` was read (a newer write arrived). Returns the keys deleted.
+    """
+    if persistence is not None:
+        return persistence.delete_many(versions)
+    deleted = []
+    with kv_lock:
+        for key, version in versions.items():
+            if key not in kv_store or kv_versions.get(key, 0) != version:
+                continue
+            del kv_store[key]
+            if key in kv_versions:  # the arena engines drop the version with the key
+                del kv_versions[key]
+            deleted.append(key)
+    return deleted
+
+def local_get(key: str, lease_holder: Optional[str] = None) -> Dict:
+    """
+    Read a key from this node's store as a replica response.
+
+    With `lease_holder` (a node that wants to cache the answer), a found key
+    also grants that node a lease; the response's "lease" is its length in
+    seconds, 0 if none was granted.
+    """
+    found = kv_store.lookup(key)
+    if found is not None:
+        resp = {
+            "status": "found",
+            "key": key,
+            "value": found[0],
+            "version": found[1],
+            "node": SELF_URL,
+        }
+        if lease_holder:
+            resp["lease"] = leases.grant(key, lease_holder, KV_CACHE_TTL)
+        return resp
+    return {"status": "not_found", "key": key, "version": 0, "node": SELF_URL}
+
+# Streaming File Transfers
+# uploads are read from the request and written to disk in chunks of this size.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1 << 20)))
+
+class StreamingRequest(Request):
+    """
+    Request that spools multipart file parts straight into STORAGE_DIR.
+
+    Flask's default keeps small parts in memory and large ones in a system
+    temp file, which f.save() then copies. Writing the part to a temp file
+    next to its final location lets the upload finish with a rename. The
+    handler must call discard_spooled() when done, so parts it did not
+    publish (other fields, rejected or aborted uploads) are deleted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spooled = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        f = tempfile.NamedTemporaryFile("wb+", dir=STORAGE_DIR, prefix=".upload-", delete=False)
+        self.spooled.append(f)
+        return f
+
+    def discard_spooled(self) -> None:
+        """Close every spooled part and delete those still in STORAGE_DIR."""
+        for f in self.spooled:
+            f.close()
+            remove_if_exists(f.name)
+        self.spooled.clear()
+
+def part_path(filename: str) -> str:
+    """Path of the partial file a resumable upload is written to (a dotfile, see is_internal_name)."""
+    return os.path.join(STORAGE_DIR, f".{filename}.part")
+
+def is_internal_name(filename: str) -> bool:
+    """
+    True if a path names one of this node's own files in STORAGE_DIR rather
+    than an upload: dotfiles (partial and spooled uploads) and "_" names
+    (_kv, _chunks, _engine, ...). /download and /files refuse these.
+    """
+    return any(part.startswith((".", "_")) for part in filename.split("/"))
+
+def file_etag(path: str) -> str:
+    """Strong ETag (unquoted) for a stored file, based on its size and modification time."""
+    st = os.stat(path)
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+def remove_if_exists(path: str) -> None:
+    """Delete a temp file that may already have been published (renamed away)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def publish_file(tmp_path: str, save_path: str) -> None:
+    """Atomically move a finished upload into place with normal file permissions."""
+    os.chmod(tmp_path, 0o644)  # temp files are created owner-only
+    os.replace(tmp_path, save_path)
+
+def copy_stream(read, write) -> int:
+    """Copy from read(n) to write(chunk) in UPLOAD_CHUNK_SIZE pieces. Returns bytes copied."""
+    copied = 0
+    while True:
+        chunk = read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        write(chunk)
+        copied += len(chunk)
 
 # Flask App
 app = Flask(__name__)
+app.request_class = StreamingRequest
+
+@app.after_request
+def add_ring_version(response):
+    response.headers["X-Ring-Version"] = RING_VERSION
+    return response
+
+
+# Metrics
+# Per-route request counts and latency, inter-node forward counts, and
+# gauges read at scrape time. Served in Prometheus text format at /metrics.
+metrics = Registry()
+http_requests = metrics.counter(
+    "dht_http_requests_total", "HTTP requests handled, by route and status.", ("method", "route", "status")
+)
+http_latency = metrics.histogram(
+    "dht_http_request_duration_seconds",
+    "Time to produce a response (streamed bodies: time to first byte).",
+    ("method", "route"),
+)
+forward_requests = metrics.counter(
+    "dht_forward_requests_total", "Requests sent to other nodes, by peer and outcome.", ("peer", "outcome")
+)
+forward_latency = metrics.histogram(
+    "dht_forward_duration_seconds", "Round-trip time of requests sent to other nodes.", ("peer",)
+)
+metrics.gauge("dht_kv_store_keys", "Keys stored on this node.", lambda: len(kv_store))
+metrics.gauge("dht_ring_peers", "Peers in this node's ring.", lambda: len(PEERS))
+metrics.gauge("dht_log_queue_depth", "Log records waiting to be written.", lambda: _log_queue.qsize())
+metrics.gauge("dht_kv_cache_entries", "Entries in the hot-key read cache.", lambda: read_cache.stats()["entries"])
+metrics.counter_func("dht_kv_cache_hits_total", "Reads served from the read cache.", lambda: read_cache.hits)
+metrics.counter_func("dht_kv_cache_misses_total", "Cacheable reads that missed the read cache.", lambda: read_cache.misses)
+metrics.counter_func(
+    "dht_kv_cache_evictions_total", "Read cache entries evicted to stay within KV_CACHE_SIZE.", lambda: read_cache.evictions
+)
+metrics.gauge("dht_kv_leases", "Keys on which this node granted cache leases.", lambda: leases.stats()["leased_keys"])
+metrics.counter_func(
+    "dht_kv_lease_revoke_failures_total",
+    "Lease revocations a holder did not confirm in time.",
+    lambda: leases.revoke_failures,
+)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.get("request_start")
+    if start is not None:
+        # The route template (e.g. /kv/<key>) keeps the label set small.
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_latency.observe(time.perf_counter() - start, request.method, route)
+        http_requests.inc(request.method, route, response.status_code)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus-style metrics for this node."""
+    return Response(metrics.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
 
 
 # Health & Peer Info
 @app.route("/health", methods=["GET"])
 def health():
     """Basic health check endpoint."""
-    log_info(f"GET /health from {request.remote_addr}")
+    log_request("GET /health from %s", request.remote_addr)
     return jsonify(
         {
             "status": "ok",
@@ -146,13 +654,24 @@ def health():
 
 @app.route("/peers", methods=["GET"])
 def get_peers():
-    """Return the peer list and ring for debugging."""
-    log_info(f"GET /peers from {request.remote_addr}")
+    """
+    Return the peer list and ring for debugging.
+
+    "load" reports each peer's share of the hash space, and "local_keys"
+    the number of keys stored on this node, so the spread can be checked
+    by querying every node.
+    """
+    log_info("GET /peers from %s", request.remote_addr)
     return jsonify(
         {
             "self": SELF_URL,
             "peers": PEERS,
+            "vnodes": VNODES,
+            "ring_version": RING_VERSION,
+            "replication": {"n": REPLICATION_FACTOR, "w": WRITE_QUORUM, "r": READ_QUORUM},
             "ring": RING,
+            "load": ring_load_report(RING),
+            "local_keys": len(kv_store),
         }
     )
 
@@ -163,22 +682,32 @@ def upload_file():
     Upload a file to this node's local storage directory.
     Expects form-data: file=@filename
     """
-    log_info(f"POST /upload from {request.remote_addr}")
+    log_info("POST /upload from %s", request.remote_addr)
 
-    if "file" not in request.files:
-        log_warn("Upload failed – no file part in request")
-        return jsonify({"error": "No file part"}), 400
+    # Every file part is spooled to a temp file in STORAGE_DIR; whatever is
+    # not published below (other parts, a rejected or failed upload) is
+    # deleted on the way out.
+    try:
+        if "file" not in request.files:
+            log_warn("Upload failed – no file part in request")
+            return jsonify({"error": "No file part"}), 400
 
-    f = request.files["file"]
-    if f.filename == "":
-        log_warn("Upload failed – empty filename")
-        return jsonify({"error": "No selected file"}), 400
+        f = request.files["file"]
+        if f.filename == "":
+            log_warn("Upload failed – empty filename")
+            return jsonify({"error": "No selected file"}), 400
+        if is_internal_name(os.path.basename(f.filename)):
+            log_warn("Upload failed – reserved filename %s", f.filename)
+            return jsonify({"error": "Names starting with '.' or '_' are reserved"}), 400
 
-    filename = secure_filename(f.filename)
-    save_path = os.path.join(STORAGE_DIR, filename)
-    f.save(save_path)
+        filename = secure_filename(f.filename)
+        save_path = os.path.join(STORAGE_DIR, filename)
+        f.stream.close()
+        publish_file(f.stream.name, save_path)
+    finally:
+        request.discard_spooled()
 
-    log_info(f"File uploaded: {filename} -> {save_path}")
+    log_info("File uploaded: %s -> %s", filename, save_path)
 
     return jsonify(
         {
@@ -190,55 +719,466 @@ def upload_file():
     )
 
 
+@app.route("/upload/<filename>", methods=["PUT"])
+def upload_stream(filename):
+    """
+    Stream a raw request body into this node's storage directory.
+
+    The body is written to disk in UPLOAD_CHUNK_SIZE chunks as it arrives,
+    so memory use does not grow with the file size:
+        curl -T big.iso http://localhost:5001/upload/big.iso
+
+    Resumable uploads send pieces with a Content-Range header
+    ("bytes <start>-<end>/<total>"). Pieces are appended to a hidden partial
+    file and must start where the stored part ends; the file becomes
+    visible once all <total> bytes arrived. HEAD on the same URL reports the
+    stored size of a partial upload in the Upload-Offset header.
+    """
+    if is_internal_name(filename):
+        return jsonify({"error": "Names starting with '.' or '_' are reserved"}), 400
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({"error": "Invalid filename"}), 400
+    log_info("PUT /upload/%s from %s", filename, request.remote_addr)
+
+    save_path = os.path.join(STORAGE_DIR, filename)
+    content_range = request.headers.get("Content-Range")
+
+    if content_range is None:
+        # Whole file in one request: write to a temp file, then rename.
+        out = tempfile.NamedTemporaryFile("wb", dir=STORAGE_DIR, prefix=".upload-", delete=False)
+        try:
+            with out:
+                size = copy_stream(request.stream.read, out.write)
+            publish_file(out.name, save_path)
+        finally:
+            remove_if_exists(out.name)  # the client went away mid-upload
+        log_info("File streamed: %s (%s bytes) -> %s", filename, size, save_path)
+        return jsonify({"status": "ok", "filename": filename, "size": size, "stored_at": save_path, "node": SELF_URL})
+
+    rng = parse_content_range_header(content_range)
+    if rng is None or rng.units != "bytes" or rng.length is None:
+        return jsonify({"error": "Content-Range must be 'bytes <start>-<end>/<total>'"}), 400
+
+    part = part_path(filename)
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if rng.start != offset:
+        log_warn("Resumable upload %s: got offset %s, expected %s", filename, rng.start, offset)
+        return jsonify({"error": "Unexpected offset", "upload_offset": offset}), 416, {"Upload-Offset": str(offset)}
+
+    with open(part, "ab") as out:
+        written = copy_stream(request.stream.read, out.write)
+    offset += written
+    if written != rng.stop - rng.start:
+        log_warn("Resumable upload %s: short piece (%s of %s bytes)", filename, written, rng.stop - rng.start)
+
+    if offset >= rng.length:
+        publish_file(part, save_path)
+        log_info("Resumable upload complete: %s (%s bytes)", filename, offset)
+        return jsonify({"status": "ok", "filename": filename, "size": offset, "stored_at": save_path, "node": SELF_URL})
+
+    return jsonify({"status": "partial", "filename": filename, "upload_offset": offset, "total": rng.length}), 202, {
+        "Upload-Offset": str(offset)
+    }
+
+
+@app.route("/upload/<filename>", methods=["HEAD"])
+def upload_offset(filename):
+    """Report how many bytes of a resumable upload are stored (Upload-Offset header)."""
+    if is_internal_name(filename):
+        return "", 400
+    part = part_path(secure_filename(filename))
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    return "", 200, {"Upload-Offset": str(offset)}
+
+
 @app.route("/download/<path:filename>", methods=["GET"])
 def download_file(filename):
     """
     Download a file from this node's local storage directory.
+
+    Supports partial downloads (Range -> 206 Partial Content) and
+    conditional requests (If-None-Match with the file's ETag -> 304).
+    Files that are not stored locally are looked up as distributed files.
     """
-    log_info(f"GET /download/{filename} from {request.remote_addr}")
+    log_request("GET /download/%s from %s", filename, request.remote_addr)
+
+    if is_internal_name(filename):
+        log_warn("Refused download of internal file: %s", filename)
+        return jsonify({"error": "File not found"}), 404
 
     full_path = os.path.join(STORAGE_DIR, filename)
     if not os.path.exists(full_path):
-        log_warn(f"File not found: {filename}")
+        # Not stored on this node – it may be a distributed file (see /files).
+        manifest = load_manifest(secure_filename(filename))
+        if manifest is not None:
+            return distributed_file_response(manifest)
+        log_warn("File not found: %s", filename)
         return jsonify({"error": "File not found"}), 404
 
-    log_info(f"File sent: {filename}")
+    log_request("File sent: %s", filename)
     # Security is minimal here; in a real system you'd be stricter
-    return send_from_directory(STORAGE_DIR, filename, as_attachment=True)
+    # conditional=True makes werkzeug answer Range and If-None-Match itself.
+    # The open file is handed to the server's wsgi.file_wrapper, which
+    # sends it with zero-copy sendfile() on servers that support it.
+    return send_from_directory(
+        STORAGE_DIR,
+        filename,
+        as_attachment=True,
+        conditional=True,
+        etag=file_etag(full_path),
+    )
+
+
+# Persistence Info
+@app.route("/persistence", methods=["GET"])
+def persistence_stats():
+    """Return write-ahead log, snapshot and recovery statistics."""
+    log_info("GET /persistence from %s", request.remote_addr)
+    if persistence is None:
+        return jsonify({"enabled": False, "node": SELF_URL})
+    return jsonify({"enabled": True, "node": SELF_URL, **persistence.stats()})
+
+@app.route("/engine-stats", methods=["GET"])
+def engine_stats():
+    """Return the storage engine's key count and memory use."""
+    return jsonify({"node": SELF_URL, **kv_store.stats()})
+
+@app.route("/persistence/snapshot", methods=["POST"])
+def persistence_snapshot():
+    """Write a compacted snapshot now instead of waiting for the next interval."""
+    log_info("POST /persistence/snapshot from %s", request.remote_addr)
+    if persistence is None:
+        return jsonify({"error": "Persistence is disabled"}), 409
+    return jsonify({"status": "ok", "node": SELF_URL, "snapshot": persistence.snapshot()})
+
+
+# Inter-node HTTP Client
+# Settings for the keep-alive connection pools used when forwarding to peers.
+FORWARD_POOL_SIZE = int(os.getenv("FORWARD_POOL_SIZE", "10"))  # max connections per peer
+FORWARD_CONNECT_TIMEOUT = float(os.getenv("FORWARD_CONNECT_TIMEOUT", "1.0"))  # seconds
+FORWARD_READ_TIMEOUT = float(os.getenv("FORWARD_READ_TIMEOUT", "5.0"))  # seconds
+FORWARD_RETRIES = int(os.getenv("FORWARD_RETRIES", "2"))  # extra attempts on connect errors
+FORWARD_BACKOFF = float(os.getenv("FORWARD_BACKOFF", "0.1"))  # first backoff delay, doubles per retry
+
+
+# Methods that may be sent twice without changing the result.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+def connect_failed(e: requests.ConnectionError) -> bool:
+    """True if the TCP connection could not be opened, so the peer never saw the request."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+class PeerPool:
+    """
+    A persistent, keep-alive HTTP session to a single peer.
+
+    Connections are reused across forwarded requests instead of opening a
+    new TCP connection per call. At most `size` requests are in flight to
+    the peer at once; extra callers wait for a free slot, and that wait is
+    recorded in the stats.
+    """
+
+    def __init__(self, node_url: str, size: int = FORWARD_POOL_SIZE):
+        self.node_url = node_url
+        self.size = size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        # smoothed response time, used to send reads to the fastest replica
+        self.latency_ewma: Optional[float] = None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request over the pooled session.
+
+        Connection errors are retried with exponential backoff. For methods
+        that are not idempotent (POST), only a failure to connect is retried:
+        a connection that broke after the request was sent may already have
+        been processed by the peer. Read timeouts are never retried.
+        """
+        start = time.perf_counter()
+        with self._slots:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.requests += 1
+                self.in_flight += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        sent = time.perf_counter()
+                        resp = self.session.request(
+                            method,
+                            url,
+                            timeout=(FORWARD_CONNECT_TIMEOUT, FORWARD_READ_TIMEOUT),
+                            **kwargs,
+                        )
+                        self._record_latency(time.perf_counter() - sent)
+                        return resp
+                    except requests.ConnectionError as e:
+                        if attempt >= FORWARD_RETRIES or (method not in IDEMPOTENT_METHODS and not connect_failed(e)):
+                            raise
+                        with self._lock:
+                            self.retries += 1
+                        time.sleep(FORWARD_BACKOFF * (2 ** attempt))
+                        attempt += 1
+            except requests.RequestException:
+                with self._lock:
+                    self.errors += 1
+                # A failing peer should look slow so reads prefer other replicas.
+                self._record_latency(FORWARD_READ_TIMEOUT)
+                raise
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _record_latency(self, seconds: float) -> None:
+        with self._lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = seconds
+            else:
+                self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * seconds
+
+    def stats(self) -> Dict:
+        """Return usage counters for this peer's pool."""
+        created = 0
+        idle = 0
+        # urllib3 keeps one connection pool per host; count connections it
+        # opened and the idle ones waiting in its queue for reuse.
+        for pool_key in self._adapter.poolmanager.pools.keys():
+            pool = self._adapter.poolmanager.pools.get(pool_key)
+            if pool is None:
+                continue
+            created += pool.num_connections
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "requests": self.requests,
+                "connections_created": created,
+                "reused": max(self.requests - created, 0),
+                "open_connections": idle + self.in_flight,
+                "in_flight": self.in_flight,
+                "retries": self.retries,
+                "errors": self.errors,
+                "total_wait_s": round(self.wait_time, 6),
+                "avg_wait_s": round(self.wait_time / self.requests, 6) if self.requests else 0.0,
+                "max_wait_s": round(self.max_wait, 6),
+                "latency_ewma_s": round(self.latency_ewma, 6) if self.latency_ewma is not None else None,
+            }
+
+
+# One pool per peer URL, created lazily on first use.
+peer_pools: Dict[str, PeerPool] = {}
+_peer_pools_lock = threading.Lock()
+
+def get_peer_pool(node_url: str) -> PeerPool:
+    """Return the pool for a peer, creating it if needed."""
+    pool = peer_pools.get(node_url)
+    if pool is None:
+        with _peer_pools_lock:
+            pool = peer_pools.get(node_url)
+            if pool is None:
+                pool = PeerPool(node_url)
+                peer_pools[node_url] = pool
+    return pool
+
+
+# Thread pool shared by all fan-out work: replica writes/reads and batch sub-requests.
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "32"))
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+
+def by_latency(node_urls: List[str]) -> List[str]:
+    """Order nodes fastest first: this node, then peers by smoothed response time."""
+    def cost(url: str) -> float:
+        if url == SELF_URL:
+            return -1.0
+        pool = peer_pools.get(url)
+        # Peers we have not talked to yet sort first so they get measured.
+        return pool.latency_ewma if pool is not None and pool.latency_ewma is not None else 0.0
+    return sorted(node_urls, key=cost)
+
+
+@app.route("/pool-stats", methods=["GET"])
+def pool_stats():
+    """Return connection pool statistics for every peer this node has forwarded to."""
+    log_info("GET /pool-stats from %s", request.remote_addr)
+    return jsonify(
+        {
+            "self": SELF_URL,
+            "pools": {url: pool.stats() for url, pool in peer_pools.items()},
+        }
+    )
 
 
 # Helper: Forwarding Requests
 def forward_request(node_url: str, method: str, path: str, **kwargs):
     """
-    Forward an HTTP request to another node.
+    Forward an HTTP request to another node over its pooled keep-alive session.
 
     Args:
         node_url: Base URL of the destination node (e.g. http://node2:5000).
         method: "GET" or "POST".
         path: Route path starting with '/', e.g. "/kv" or f"/kv/{key}".
-        **kwargs: Passed directly to requests.get/post (json=..., params=..., etc.).
+        **kwargs: Passed directly to requests (json=..., params=..., etc.).
 
     Returns:
         (json_body, status_code)
     """
     url = node_url.rstrip("/") + path
-    log_info(f"Forwarding {method.upper()} {path} to {node_url}")
+    log_request("Forwarding %s %s to %s", method.upper(), path, node_url)
 
     try:
-        if method.upper() == "GET":
-            resp = requests.get(url, timeout=5, **kwargs)
-        elif method.upper() == "POST":
-            resp = requests.post(url, timeout=5, **kwargs)
-        else:
+        if method.upper() not in ("GET", "POST"):
             raise ValueError(f"Unsupported method {method}")
 
+        sent = time.perf_counter()
+        resp = get_peer_pool(node_url).request(method.upper(), url, **kwargs)
+        forward_latency.observe(time.perf_counter() - sent, node_url)
+
         # We assume JSON response from peer
-        return resp.json(), resp.status_code
+        body = resp.json()
 
-    except requests.RequestException as e:
-        log_error(f"Failed to contact node {node_url}: {e}")
+    # A body that is not JSON raises a ValueError (also a RequestException
+    # in recent requests versions); either way the call counts once, as an error.
+    except (requests.RequestException, ValueError) as e:
+        forward_requests.inc(node_url, "error")
+        log_error("Failed to contact node %s: %s", node_url, e)
         return {"error": f"Failed to contact node {node_url}", "details": str(e)}, 502
 
+    forward_requests.inc(node_url, "ok")
+    return body, resp.status_code
+
+
+# Replication Helpers
+def quorum_sizes(replicas: List[str]):
+    """Return (w, r) capped at the number of replicas actually available."""
+    return min(WRITE_QUORUM, len(replicas)), min(READ_QUORUM, len(replicas))
+
+def replica_write(node_url: str, key: str, value, version: int) -> bool:
+    """Write one replica of a key. Returns True if the replica acknowledged it."""
+    if node_url == SELF_URL:
+        local_put(key, value, version)
+        return True
+    _, status = forward_request(
+        node_url, "POST", "/kv/replica", json={"key": key, "value": value, "version": version}
+    )
+    # "stale" replies are 200 too: that replica already has a newer version.
+    return status == 200
+
+def replica_read(node_url: str, key: str, lease: bool = False) -> Optional[Dict]:
+    """
+    Read one replica of a key. Returns its response, or None if it failed.
+
+    With `lease`, the replica is asked for a lease so the answer can be cached.
+    """
+    if node_url == SELF_URL:
+        return local_get(key)
+    params = {"lease": SELF_URL} if lease else None
+    json_resp, status = forward_request(node_url, "GET", f"/kv/replica/{key}", params=params)
+    if status in (200, 404) and isinstance(json_resp, dict) and "status" in json_resp:
+        return json_resp
+    return None
+
+def newest(responses: List[Dict]) -> Optional[Dict]:
+    """Return the found response with the highest version, or None if none found it."""
+    found = [r for r in responses if r["status"] == "found"]
+    return max(found, key=lambda r: r.get("version", 0)) if found else None
+
+def read_repair(key: str, best: Dict, responses: List[Dict]) -> None:
+    """In the background, push the newest value to replicas that answered with an older one."""
+    for resp in responses:
+        if resp is not best and resp.get("version", 0) < best.get("version", 0):
+            log_info("Read repair: %s on %s", key, resp["node"])
+            fanout_executor.submit(replica_write, resp["node"], key, best["value"], best["version"])
+
+def quorum_write(key: str, value):
+    """
+    Write a key to all of its replicas in parallel and wait for W acks.
+
+    Replicas still in flight after the quorum is reached keep running in
+    the background. Returns (acks, replicas, version).
+    """
+    version = time.time_ns()
+    replicas = find_replica_nodes(key)
+    # Our own cached copy is dropped now; the replicas revoke other nodes' leases.
+    read_cache.invalidate(key, version, fence=False)
+    w, _ = quorum_sizes(replicas)
+    pending = {
+        fanout_executor.submit(replica_write, url, key, value, version)
+        for url in replicas
+        if url != SELF_URL
+    }
+    acks = 0
+    if SELF_URL in replicas:
+        # Our own replica is written on this thread while the others are in flight.
+        acks += replica_write(SELF_URL, key, value, version)
+    while acks < w and pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        acks += sum(1 for f in done if f.result())
+    return acks, replicas, version
+
+def quorum_read(key: str, lease: bool = False):
+    """
+    Read a key from R replicas, fastest first, with hedging.
+
+    Starts with the R fastest replicas. Whenever none of the outstanding
+    requests has answered within HEDGE_DELAY_MS, or one fails, the next
+    replica is asked as well, so one slow node does not set the latency.
+    With `lease`, replicas are asked for a lease on the key (for caching).
+    Returns (responses, replicas in ring order, hedged_count).
+    """
+    owners = find_replica_nodes(key)
+    replicas = by_latency(owners)
+    _, r = quorum_sizes(replicas)
+    responses: List[Dict] = []
+    pending = set()
+    next_idx = 0
+    hedged = 0
+
+    def ask_next():
+        nonlocal next_idx
+        url = replicas[next_idx]
+        next_idx += 1
+        if url == SELF_URL:
+            responses.append(local_get(key))
+        else:
+            pending.add(fanout_executor.submit(replica_read, url, key, lease))
+
+    while next_idx < min(r, len(replicas)):
+        ask_next()
+
+    while len(responses) < r and pending:
+        done, pending = wait(pending, timeout=HEDGE_DELAY_MS / 1000.0, return_when=FIRST_COMPLETED)
+        if not done:
+            if next_idx < len(replicas):
+                hedged += 1
+                ask_next()
+            continue
+        for future in done:
+            resp = future.result()
+            if resp is not None:
+                responses.append(resp)
+            elif next_idx < len(replicas):
+                ask_next()
+    return responses, owners, hedged
+
 
 # Key-Value Endpoints with DHT Routing
 @app.route("/kv", methods=["POST"])
@@ -249,48 +1189,47 @@ def kv_put():
     Expects JSON body:
         { "key": "...", "value": "..." }
 
-    The responsible node is chosen using the DHT ring. If this node is not
-    responsible for the key, it will forward the request to the correct node.
+    The replicas are chosen using the DHT ring (the responsible node and its
+    successors). This node sends the write to all of them in parallel and
+    replies once WRITE_QUORUM have acknowledged it.
     """
     data = request.get_json(silent=True) or {}
     key = data.get("key")
     value = data.get("value")
 
-    log_info(f"POST /kv from {request.remote_addr} – key={key}, value={value}")
+    log_request("POST /kv from %s – key=%s, value=%s", request.remote_addr, key, value)
 
     if key is None or value is None:
         log_warn("KV PUT failed – JSON missing 'key' or 'value'")
         return jsonify({"error": "JSON must contain 'key' and 'value'"}), 400
 
-    responsible = find_responsible_node(key)
-    log_info(f"Key '{key}' is mapped to node {responsible['url']}")
+    acks, replicas, version = quorum_write(key, value)
+    w, _ = quorum_sizes(replicas)
+    log_request("Key '%s' written to %d/%d replicas %s", key, acks, len(replicas), replicas)
 
-    if is_local_node(responsible):
-        # Handle locally
-        kv_store[key] = value
-        log_info(f"Stored key locally: {key} -> {value}")
+    if acks < w:
+        log_warn("Write quorum not reached for '%s' (%s/%s)", key, acks, w)
         return jsonify(
             {
-                "status": "stored",
+                "error": "Write quorum not reached",
                 "key": key,
-                "value": value,
-                "node": SELF_URL,
+                "acks": acks,
+                "required": w,
+                "replicas": replicas,
             }
-        )
-    else:
-        # Forward to responsible node
-        log_info(f"Forwarding key '{key}' to {responsible['url']}")
-        json_resp, status = forward_request(responsible["url"], "POST", "/kv", json=data)
-        return (
-            jsonify(
-                {
-                    "forwarded_to": responsible["url"],
-                    "original_node": SELF_URL,
-                    "response": json_resp,
-                }
-            ),
-            status,
-        )
+        ), 503
+
+    return jsonify(
+        {
+            "status": "stored",
+            "key": key,
+            "value": value,
+            "node": SELF_URL,
+            "replicas": replicas,
+            "acks": acks,
+            "version": version,
+        }
+    )
 
 
 @app.route("/kv/<key>", methods=["GET"])
@@ -298,54 +1237,1074 @@ def kv_get(key):
     """
     Retrieve a key–value pair from the DHT.
 
-    The responsible node is chosen using the DHT ring. If this node is not
-    responsible, it forwards the request to the correct node.
-    """
-    log_info(f"GET /kv/{key} from {request.remote_addr}")
-
-    responsible = find_responsible_node(key)
-    log_info(f"Key '{key}' is mapped to node {responsible['url']}")
-
-    if is_local_node(responsible):
-        if key in kv_store:
-            value = kv_store[key]
-            log_info(f"Returned local value: {key} = {value}")
-            return jsonify(
-                {
-                    "status": "found",
-                    "key": key,
-                    "value": value,
-                    "node": SELF_URL,
-                }
-            )
+    The key's replicas are chosen using the DHT ring. This node asks the
+    fastest READ_QUORUM replicas (hedging to the next one if a replica is
+    slow) and returns the newest version among the answers. When this node
+    is not a replica and the read cache is on, answers covered by a lease
+    are cached and served from here until the lease ends or is revoked.
+    """
+    log_request("GET /kv/%s from %s", key, request.remote_addr)
+
+    cacheable = read_cache.enabled and SELF_URL not in find_replica_nodes(key)
+    if cacheable:
+        cached = read_cache.get(key)
+        if cached is not None:
+            return jsonify(cached)
+
+    responses, replicas, hedged = quorum_read(key, lease=cacheable)
+    _, r = quorum_sizes(replicas)
+
+    if len(responses) < r:
+        log_warn("Read quorum not reached for '%s' (%s/%s)", key, len(responses), r)
+        return jsonify(
+            {
+                "error": "Read quorum not reached",
+                "key": key,
+                "responses": len(responses),
+                "required": r,
+                "replicas": replicas,
+            }
+        ), 503
+
+    best = newest(responses)
+    if best is None:
+        # While keys are being moved to new nodes, a new replica may not
+        # have the key yet: also ask the replicas on the previous ring.
+        # Read repair below then copies it to the new replicas.
+        previous = [url for url in rebalancer.previous_replicas(key) if url not in replicas]
+        for resp in fanout_executor.map(lambda url: replica_read(url, key), previous):
+            if resp is not None:
+                responses.append(resp)
+        best = newest(responses)
+    if best is None:
+        log_warn("Key '%s' not found on replicas %s", key, replicas)
+        return jsonify(
+            {
+                "status": "not_found",
+                "key": key,
+                "node": SELF_URL,
+                "replicas": replicas,
+            }
+        ), 404
+
+    read_repair(key, best, responses)
+    log_request("Returned value for '%s' from %s (hedged %d)", key, best["node"], hedged)
+    result = {
+        "status": "found",
+        "key": key,
+        "value": best["value"],
+        "node": best["node"],
+        "version": best.get("version", 0),
+        "replicas": replicas,
+        "hedged": hedged,
+    }
+    if cacheable:
+        read_cache.put(key, {**result, "hedged": 0, "cached": True}, best.get("lease", 0))
+    return jsonify(result)
+
+
+# Replica Endpoints
+# Internal routes used by the coordinating node; they only touch this
+# node's local store and never forward.
+@app.route("/kv/replica", methods=["POST"])
+def kv_replica_put():
+    """Store one replica. Expects JSON { "key", "value", "version" }."""
+    data = request.get_json(silent=True) or {}
+    key = data.get("key")
+    value = data.get("value")
+    version = data.get("version", 0)
+
+    if key is None or value is None or not isinstance(version, int):
+        return jsonify({"error": "JSON must contain 'key', 'value' and integer 'version'"}), 400
+
+    applied = local_put(key, value, version)
+    log_request("Replica write %s (version %s) – %s", key, version, "stored" if applied else "stale")
+    return jsonify(
+        {
+            "status": "stored" if applied else "stale",
+            "key": key,
+            "version": version,
+            "node": SELF_URL,
+        }
+    )
+
+
+@app.route("/kv/replica/<key>", methods=["GET"])
+def kv_replica_get(key):
+    """Read one replica, including its version. ?lease=<node URL> also grants that node a lease."""
+    resp = local_get(key, request.args.get("lease"))
+    return jsonify(resp), (200 if resp["status"] == "found" else 404)
+
+
+@app.route("/kv/replica/batch", methods=["POST"])
+def kv_replica_batch_put():
+    """
+    Store many replicas. Expects JSON { "items": {key: value}, "version": int },
+    or per-key versions in "versions": {key: int} (used when rebalancing).
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    version = data.get("version", 0)
+    versions = data.get("versions")
+
+    if not isinstance(items, dict) or not isinstance(version, int):
+        return jsonify({"error": "JSON must contain 'items' object and integer 'version'"}), 400
+    if versions is None:
+        versions = {key: version for key in items}
+    elif not isinstance(versions, dict):
+        return jsonify({"error": "'versions' must map keys to integer versions"}), 400
+
+    applied = set(local_put_many(items, versions))
+    log_request("Replica batch write: %d/%d keys stored", len(applied), len(items))
+    return jsonify(
+        {
+            "node": SELF_URL,
+            "results": {key: {"status": "stored" if key in applied else "stale"} for key in items},
+        }
+    )
+
+
+@app.route("/kv/replica/batch/get", methods=["POST"])
+def kv_replica_batch_get():
+    """Read many replicas. Expects JSON { "keys": [...] }."""
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys")
+
+    if not isinstance(keys, list):
+        return jsonify({"error": "JSON must contain 'keys' list"}), 400
+
+    return jsonify({"node": SELF_URL, "results": {key: local_get(key) for key in keys}})
+
+
+@app.route("/kv/cache/invalidate", methods=["POST"])
+def kv_cache_invalidate():
+    """Lease revocation from a replica. Expects JSON { "keys": {key: new version} }."""
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys")
+
+    if not isinstance(keys, dict) or not all(isinstance(v, int) for v in keys.values()):
+        return jsonify({"error": "JSON must contain 'keys' mapping keys to integer versions"}), 400
+
+    for key, version in keys.items():
+        read_cache.invalidate(key, version)
+    return jsonify({"status": "invalidated", "keys": len(keys), "node": SELF_URL})
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """Return read cache hits, misses and evictions, and the leases this node granted."""
+    return jsonify({"node": SELF_URL, "cache": read_cache.stats(), "leases": leases.stats()})
+
+
+# Batch Key-Value Endpoints (scatter-gather)
+# Upper bound on keys per batch request.
+BATCH_MAX_KEYS = int(os.getenv("BATCH_MAX_KEYS", "10000"))
+
+def scatter_gather(groups: Dict[str, List[str]], path: str, build_body, handle_local) -> Dict[str, Optional[Dict]]:
+    """
+    Run one sub-request per node in parallel and collect each node's results.
+
+    Args:
+        groups: node URL -> keys to send to that node.
+        path: replica batch route on the node, e.g. "/kv/replica/batch".
+        build_body: function(keys) -> JSON body for that node's sub-request.
+        handle_local: function(keys) -> {key: result} for this node's own keys.
+
+    Returns:
+        { node_url: {key: result} }, or None for a node whose sub-request failed.
+    """
+    futures = {
+        node_url: fanout_executor.submit(forward_request, node_url, "POST", path, json=build_body(keys))
+        for node_url, keys in groups.items()
+        if node_url != SELF_URL
+    }
+
+    node_results: Dict[str, Optional[Dict]] = {}
+    # Local keys are handled on this thread while the remote calls are in flight.
+    if SELF_URL in groups:
+        node_results[SELF_URL] = handle_local(groups[SELF_URL])
+
+    for node_url, future in futures.items():
+        json_resp, status = future.result()
+        results = json_resp.get("results") if isinstance(json_resp, dict) else None
+        if status != 200 or not isinstance(results, dict):
+            log_warn("Batch sub-request to %s failed with status %s", node_url, status)
+            results = None
+        node_results[node_url] = results
+    return node_results
+
+def batch_response(results: Dict[str, Dict], groups: Dict[str, List[str]]):
+    """Build the merged JSON response for a batch request."""
+    failed = sum(1 for r in results.values() if r["status"] == "error")
+    return jsonify(
+        {
+            "status": "ok" if failed == 0 else "partial",
+            "node": SELF_URL,
+            "owners": {url: len(keys) for url, keys in groups.items()},  # node -> keys sent to it
+            "failed": failed,
+            "results": results,
+        }
+    )
+
+
+@app.route("/kv/batch", methods=["POST"])
+def kv_batch_put():
+    """
+    Store many key–value pairs in the DHT with one request.
+
+    Expects JSON body:
+        { "items": { "key1": "value1", "key2": "value2", ... } }
+
+    Keys are grouped by replica node and each node receives a single
+    sub-request, sent in parallel. A key is "stored" once WRITE_QUORUM of
+    its replicas acknowledged it, otherwise "error".
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+
+    if not isinstance(items, dict) or any(v is None for v in items.values()):
+        log_warn("KV batch PUT failed – JSON missing 'items' object")
+        return jsonify({"error": "JSON must contain 'items' mapping keys to values"}), 400
+    if len(items) > BATCH_MAX_KEYS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_KEYS} keys"}), 413
+
+    log_request("POST /kv/batch from %s – %d keys", request.remote_addr, len(items))
+
+    version = time.time_ns()
+    groups: Dict[str, List[str]] = {}
+    required: Dict[str, int] = {}
+    for key in items:
+        read_cache.invalidate(key, version, fence=False)
+        replicas = find_replica_nodes(key)
+        required[key], _ = quorum_sizes(replicas)
+        for url in replicas:
+            groups.setdefault(url, []).append(key)
+
+    def handle_local(keys):
+        local_put_many({key: items[key] for key in keys}, {key: version for key in keys})
+        log_request("Stored %d keys locally from batch", len(keys))
+        return {key: {"status": "stored"} for key in keys}
+
+    node_results = scatter_gather(
+        groups,
+        "/kv/replica/batch",
+        lambda keys: {"items": {key: items[key] for key in keys}, "version": version},
+        handle_local,
+    )
+
+    # Every reply for a key counts as an ack, including "stale" (the replica
+    # already has a newer write).
+    acks = {key: 0 for key in items}
+    for node_url, results in node_results.items():
+        if results is None:
+            continue
+        for key in groups[node_url]:
+            if key in results:
+                acks[key] += 1
+
+    results = {
+        key: {"status": "stored" if acks[key] >= required[key] else "error", "acks": acks[key]}
+        for key in items
+    }
+    return batch_response(results, groups)
+
+
+@app.route("/kv/batch/get", methods=["POST"])
+def kv_batch_get():
+    """
+    Retrieve many keys from the DHT with one request.
+
+    Expects JSON body:
+        { "keys": ["key1", "key2", ...] }
+
+    Each key is read from its READ_QUORUM fastest replicas, with one
+    parallel sub-request per node. Keys whose replica did not answer are
+    retried on their next replica. Each result has status "found" (with
+    "value"), "not_found" or "error".
+    """
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys")
+
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        log_warn("KV batch GET failed – JSON missing 'keys' list")
+        return jsonify({"error": "JSON must contain 'keys' as a list of strings"}), 400
+    if len(keys) > BATCH_MAX_KEYS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_KEYS} keys"}), 413
+
+    log_request("POST /kv/batch/get from %s – %d keys", request.remote_addr, len(keys))
+
+    keys = list(dict.fromkeys(keys))
+    candidates = {key: by_latency(find_replica_nodes(key)) for key in keys}
+    needed = {key: quorum_sizes(candidates[key])[1] for key in keys}
+    tried = {key: 0 for key in keys}
+    responses: Dict[str, List[Dict]] = {key: [] for key in keys}
+    all_groups: Dict[str, List[str]] = {}
+
+    pending = keys
+    while pending:
+        groups: Dict[str, List[str]] = {}
+        for key in pending:
+            missing = needed[key] - len(responses[key])
+            for url in candidates[key][tried[key]:tried[key] + missing]:
+                groups.setdefault(url, []).append(key)
+            tried[key] += missing
+        for url, group_keys in groups.items():
+            all_groups.setdefault(url, []).extend(group_keys)
+
+        node_results = scatter_gather(
+            groups,
+            "/kv/replica/batch/get",
+            lambda node_keys: {"keys": node_keys},
+            lambda local_keys: {key: local_get(key) for key in local_keys},
+        )
+        for node_url, results in node_results.items():
+            if results is None:
+                continue
+            for key in groups[node_url]:
+                if key in results:
+                    responses[key].append(results[key])
+
+        pending = [
+            key for key in pending
+            if len(responses[key]) < needed[key] and tried[key] < len(candidates[key])
+        ]
+
+    results: Dict[str, Dict] = {}
+    for key in keys:
+        best = newest(responses[key])
+        if len(responses[key]) < needed[key]:
+            results[key] = {"status": "error", "responses": len(responses[key])}
+        elif best is None:
+            results[key] = {"status": "not_found"}
         else:
-            log_warn(f"Key '{key}' not found on local node")
-            return jsonify(
-                {
-                    "status": "not_found",
-                    "key": key,
-                    "node": SELF_URL,
-                }
-            ), 404
-    else:
-        log_info(f"Forwarding GET /kv/{key} to {responsible['url']}")
-        json_resp, status = forward_request(
-            responsible["url"], "GET", f"/kv/{key}"
+            results[key] = {"status": "found", "value": best["value"], "node": best["node"]}
+    return batch_response(results, all_groups)
+
+
+# Dynamic Membership & Rebalancing
+# Nodes can join or leave while the cluster runs. The node that receives
+# POST /membership/join or /membership/leave sends the new peer list to every
+# old and new member (POST /membership). Each member switches to the new ring
+# at once and then, in the background, streams the keys it is responsible
+# for handing over to the nodes that newly became their replicas. Only keys
+# whose replica set changed are sent, in batches and rate-limited, so the
+# node keeps serving while data moves.
+REBALANCE_BATCH = int(os.getenv("REBALANCE_BATCH", "1000"))  # keys per transfer request
+REBALANCE_RATE = float(os.getenv("REBALANCE_RATE", "20000"))  # max keys/s sent (0 = unlimited)
+# reads that find nothing also ask the previous ring's replicas for this
+# long after a change, since other nodes may still be sending keys.
+REBALANCE_READ_FALLBACK = float(os.getenv("REBALANCE_READ_FALLBACK", "300"))  # seconds
+
+membership_lock = threading.Lock()
+
+def store_lock() -> threading.Lock:
+    """The lock that guards kv_store writes."""
+    return persistence.lock if persistence is not None else kv_lock
+
+class Rebalancer:
+    """
+    Moves keys, then file chunks, after a membership change, in a background
+    thread, and finally drops the local copies this node no longer replicates.
+
+    Placement is compared against the last ring whose rebalance completed,
+    so if a second change arrives mid-move, the new run also covers the keys
+    the interrupted run had not sent yet. A run that is replaced only stops
+    at its next check and no longer touches the shared status.
+    """
+
+    def __init__(self, peers: List[str]):
+        self.stable_peers = list(peers)  # ring that all local keys were placed by
+        self._lock = threading.Lock()  # protects _status, _stop and stable_peers
+        self._start_lock = threading.Lock()  # serializes start()
+        self._stop = threading.Event()  # stop signal of the current run
+        self._status: Dict = {"state": "idle"}
+        self._read_ring = None  # (ring, tokens) of the cluster's previous ring, for read fallback
+        self._changed_at = 0.0
+
+    def start(self, previous_peers: Optional[List[str]] = None) -> None:
+        """
+        (Re)start a rebalance from stable_peers to the current ring.
+
+        `previous_peers` is the cluster's ring before the change, as sent by
+        the coordinator; it differs from stable_peers on a node that just joined.
+        A run still in progress is told to stop; this does not wait for it.
+        """
+        with self._start_lock:
+            with self._lock:
+                old_peers = list(self.stable_peers)
+            old_ring = build_ring(old_peers)
+            read_ring = old_ring if previous_peers in (None, old_peers) else build_ring(sorted(set(previous_peers)))
+            stop = threading.Event()
+            with self._lock:
+                self._stop.set()
+                self._stop = stop
+                self._read_ring = (read_ring, [n["id"] for n in read_ring])
+                self._changed_at = time.time()
+                self._status = {"state": "running", "started": time.time()}
+            old = (old_ring, [n["id"] for n in old_ring])
+            threading.Thread(target=self._run, args=(old_peers, list(PEERS), old, stop), daemon=True).start()
+
+    def previous_replicas(self, key: str) -> List[str]:
+        """Replicas of a key on the previous ring, while keys may still be moving ([] otherwise)."""
+        with self._lock:
+            if self._read_ring is None or (
+                self._status.get("state") != "running" and time.time() - self._changed_at > REBALANCE_READ_FALLBACK
+            ):
+                return []
+            ring, tokens = self._read_ring
+        return ring_replicas(ring, tokens, key)
+
+    def _update(self, stop: threading.Event, **fields) -> None:
+        with self._lock:
+            if stop is self._stop:  # a replaced run no longer reports
+                self._status.update(fields)
+
+    def _plan(self, old, new_peers: List[str], stop: threading.Event):
+        """Return ({target node: keys it must receive from this node}, keys this node no longer replicates)."""
+        old_ring, old_tokens = old
+        new_ring, new_tokens = _ring_snapshot
+        with store_lock():
+            keys = list(kv_store)
+
+        moves: Dict[str, List[str]] = {}
+        not_owned: List[str] = []
+        for i, key in enumerate(keys):
+            if stop.is_set():
+                break
+            if i % 10000 == 0:
+                self._update(stop, keys_scanned=i)
+            old_replicas = ring_replicas(old_ring, old_tokens, key)
+            new_replicas = ring_replicas(new_ring, new_tokens, key)
+            if SELF_URL not in new_replicas:
+                not_owned.append(key)
+            for url in self._targets(old_replicas, new_replicas, new_peers):
+                moves.setdefault(url, []).append(key)
+        self._update(stop, keys_scanned=len(keys), keys_no_longer_owned=len(not_owned))
+        return moves, not_owned
+
+    @staticmethod
+    def _targets(old: List[str], new: List[str], new_peers: List[str]) -> List[str]:
+        """New replicas of a key or chunk that this node must send it to ([] if another node sends it)."""
+        targets = [url for url in new if url not in old]
+        if not targets:
+            return []
+        # One sender per key: the first old replica that stays in the
+        # cluster, or the old owner if none does (e.g. N=1 and it leaves).
+        survivors = [url for url in old if url in new_peers]
+        sender = survivors[0] if survivors else old[0]
+        return targets if sender == SELF_URL else []
+
+    def _plan_chunks(self, old, new_peers: List[str], stop: threading.Event):
+        """Return ({target node: chunk digests it must receive from this node}, chunks no longer replicated here)."""
+        old_ring, old_tokens = old
+        new_ring, new_tokens = _ring_snapshot
+        moves: Dict[str, List[str]] = {}
+        not_owned: List[str] = []
+        for digest in local_chunks():
+            if stop.is_set():
+                break
+            old_replicas = ring_replicas(old_ring, old_tokens, digest)
+            new_replicas = ring_replicas(new_ring, new_tokens, digest)
+            if SELF_URL not in new_replicas:
+                not_owned.append(digest)
+            for url in self._targets(old_replicas, new_replicas, new_peers):
+                moves.setdefault(url, []).append(digest)
+        return moves, not_owned
+
+    def _move_chunks(self, moves: Dict[str, List[str]], stop: threading.Event) -> int:
+        """Copy chunks to their new replicas, one at a time. Returns the number that failed."""
+        self._update(stop, chunks_to_move=sum(len(digests) for digests in moves.values()))
+        moved = errors = 0
+        for url, digests in moves.items():
+            for digest in digests:
+                if stop.is_set():
+                    return errors
+                try:
+                    with open(chunk_path(digest), "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                if store_chunk_on(url, digest, data) is None:
+                    errors += 1
+                else:
+                    moved += 1
+                self._update(stop, chunks_moved=moved, chunk_errors=errors)
+        return errors
+
+    def _confirm_keys(self, url: str, keys: List[str]) -> List[str]:
+        """
+        Make sure `url` holds these keys at least at this node's version,
+        sending the ones it lacks. Returns the keys it confirmed.
+        """
+        with store_lock():
+            versions = {key: kv_versions.get(key, 0) for key in keys if key in kv_store}
+        json_resp, status = forward_request(url, "POST", "/kv/replica/batch/get", json={"keys": list(versions)})
+        results = json_resp.get("results") if status == 200 and isinstance(json_resp, dict) else None
+        if not isinstance(results, dict):
+            return []
+        confirmed = [
+            key for key, version in versions.items()
+            if isinstance(results.get(key), dict)
+            and results[key].get("status") == "found"
+            and results[key].get("version", 0) >= version
+        ]
+        have = set(confirmed)
+        missing = [key for key in versions if key not in have]
+        if missing:
+            with store_lock():
+                items = {key: kv_store[key] for key in missing if key in kv_store}
+                item_versions = {key: kv_versions.get(key, 0) for key in items}
+            json_resp, status = forward_request(
+                url, "POST", "/kv/replica/batch", json={"items": items, "versions": item_versions}
+            )
+            results = json_resp.get("results") if status == 200 and isinstance(json_resp, dict) else None
+            if isinstance(results, dict):
+                # "stale" means the target already has a newer write: that confirms it too.
+                confirmed += [key for key in items if key in results]
+        return confirmed
+
+    def _drop_keys(self, keys: List[str], stop: threading.Event) -> int:
+        """
+        Delete local copies of keys this node no longer replicates, once
+        every new replica confirmed it has them. Returns the keys deleted.
+        """
+        dropped = 0
+        for i in range(0, len(keys), REBALANCE_BATCH):
+            if stop.is_set():
+                break
+            batch = keys[i:i + REBALANCE_BATCH]
+            owners = {key: find_replica_nodes(key) for key in batch}
+            # The ring may have changed again since the plan: keep keys we replicate now.
+            batch = [key for key in batch if SELF_URL not in owners[key]]
+            with store_lock():
+                versions = {key: kv_versions.get(key, 0) for key in batch if key in kv_store}
+            by_owner: Dict[str, List[str]] = {}
+            for key in versions:
+                for url in owners[key]:
+                    by_owner.setdefault(url, []).append(key)
+            acks = {key: 0 for key in versions}
+            for url, owner_keys in by_owner.items():
+                for key in self._confirm_keys(url, owner_keys):
+                    acks[key] += 1
+            if stop.is_set():
+                break
+            # delete_many / the version check skip keys rewritten since they were read.
+            dropped += len(local_delete_many(
+                {key: version for key, version in versions.items() if acks[key] >= len(owners[key])}
+            ))
+            self._update(stop, keys_dropped=dropped)
+        return dropped
+
+    def _drop_chunks(self, digests: List[str], stop: threading.Event) -> int:
+        """Delete local chunks this node no longer replicates, once every new replica has them."""
+        dropped = 0
+        for digest in digests:
+            if stop.is_set():
+                break
+            owners = find_replica_nodes(digest)
+            if SELF_URL in owners:
+                continue
+            try:
+                with open(chunk_path(digest), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            # store_chunk_on only sends the chunk if the owner does not have it yet.
+            if all(store_chunk_on(url, digest, data) is not None for url in owners):
+                remove_if_exists(chunk_path(digest))
+                dropped += 1
+                self._update(stop, chunks_dropped=dropped)
+        return dropped
+
+    def _run(self, old_peers: List[str], new_peers: List[str], old, stop: threading.Event) -> None:
+        started = time.time()
+        self._update(
+            stop, state="running", from_peers=old_peers, to_peers=new_peers, started=started, keys_scanned=0,
+            keys_to_move=0, keys_moved=0, batches=0, errors=0, targets={}, keys_per_sec=0.0, eta_s=None,
+            chunks_to_move=0, chunks_moved=0, chunk_errors=0, keys_no_longer_owned=0, keys_dropped=0,
+            chunks_dropped=0,
         )
-        return (
-            jsonify(
-                {
-                    "forwarded_to": responsible["url"],
-                    "original_node": SELF_URL,
-                    "response": json_resp,
-                }
-            ),
-            status,
+        log_info("Rebalance started: %d -> %d peers", len(old_peers), len(new_peers))
+
+        moves, not_owned = self._plan(old, new_peers, stop)
+        total = sum(len(keys) for keys in moves.values())
+        self._update(stop, keys_to_move=total, targets={url: {"keys": len(keys), "moved": 0} for url, keys in moves.items()})
+
+        sent = moved = errors = batches = 0
+        send_start = time.perf_counter()
+        for url, keys in moves.items():
+            for i in range(0, len(keys), REBALANCE_BATCH):
+                if stop.is_set():
+                    break
+                batch = keys[i:i + REBALANCE_BATCH]
+                with store_lock():
+                    items = {key: kv_store[key] for key in batch if key in kv_store}
+                    versions = {key: kv_versions.get(key, 0) for key in items}
+                _, status = forward_request(url, "POST", "/kv/replica/batch", json={"items": items, "versions": versions})
+                batches += 1
+                sent += len(batch)
+                if status == 200:
+                    moved += len(batch)
+                    with self._lock:
+                        if stop is self._stop:
+                            self._status["targets"][url]["moved"] += len(batch)
+                else:
+                    errors += 1
+
+                # Rate limit: don't get ahead of REBALANCE_RATE keys per second.
+                if REBALANCE_RATE > 0:
+                    ahead = sent / REBALANCE_RATE - (time.perf_counter() - send_start)
+                    if ahead > 0:
+                        stop.wait(ahead)
+                elapsed = time.perf_counter() - send_start
+                rate = moved / elapsed if elapsed > 0 else 0.0
+                self._update(
+                    stop, keys_moved=moved, batches=batches, errors=errors, keys_per_sec=round(rate, 1),
+                    eta_s=round((total - moved) / rate, 1) if rate > 0 else None,
+                )
+
+        # Distributed file chunks are placed on the ring by their digest, like keys.
+        chunk_moves, chunks_not_owned = self._plan_chunks(old, new_peers, stop)
+        chunk_errors = self._move_chunks(chunk_moves, stop)
+
+        # Copies this node no longer replicates are deleted once their new
+        # replicas confirmed them; unconfirmed ones are kept for a later run.
+        dropped = self._drop_keys(not_owned, stop)
+        chunks_dropped = self._drop_chunks(chunks_not_owned, stop)
+
+        if stop.is_set():
+            log_warn("Rebalance interrupted by a newer membership change")
+            return
+        if errors or chunk_errors:
+            # stable_peers stays at the old ring, so POST /membership/rebalance retries everything missing.
+            self._update(stop, state="failed", elapsed_s=round(time.time() - started, 3))
+            log_error(
+                "Rebalance finished with %d failed batches and %d failed chunks (%d/%d keys moved)",
+                errors, chunk_errors, moved, total,
+            )
+            return
+        with self._lock:
+            if stop is self._stop:
+                self.stable_peers = new_peers
+        self._update(stop, state="done", elapsed_s=round(time.time() - started, 3))
+        log_info(
+            "Rebalance done: %d keys moved, %d of %d unowned keys and %d chunks dropped in %.1fs",
+            moved, dropped, len(not_owned), chunks_dropped, time.time() - started,
         )
 
+    def status(self) -> Dict:
+        with self._lock:
+            status = dict(self._status)
+            status["targets"] = {url: dict(t) for url, t in status.get("targets", {}).items()}
+        if status.get("state") == "running":
+            status["elapsed_s"] = round(time.time() - status["started"], 3)
+        return status
+
+rebalancer = Rebalancer(PEERS)
+
+def membership_info() -> Dict:
+    return {
+        "self": SELF_URL,
+        "epoch": MEMBERSHIP_EPOCH,
+        "peers": PEERS,
+        "ring_version": RING_VERSION,
+        "rebalance": rebalancer.status(),
+    }
+
+def update_membership(peers: List[str], epoch: int, previous: Optional[List[str]] = None) -> bool:
+    """Apply a membership change sent by the coordinating node and start moving keys."""
+    with membership_lock:
+        if epoch <= MEMBERSHIP_EPOCH:
+            return False
+        apply_membership(peers, epoch)
+    # Keys may now have different replicas, which hold none of our leases.
+    read_cache.clear()
+    rebalancer.start(previous)
+    return True
+
+def change_membership(new_peers: List[str]):
+    """
+    Coordinate a membership change: send the new peer list to every old and new member.
+
+    Returns (json_body, status_code).
+    """
+    with membership_lock:
+        epoch = MEMBERSHIP_EPOCH + 1
+        previous = list(PEERS)
+        members = sorted(set(previous) | set(new_peers))
+    body = {"peers": new_peers, "epoch": epoch, "previous": previous}
+    futures = {
+        url: fanout_executor.submit(forward_request, url, "POST", "/membership", json=body)
+        for url in members
+        if url != SELF_URL
+    }
+    results = {}
+    if SELF_URL in members:
+        results[SELF_URL] = "applied" if update_membership(new_peers, epoch, previous) else "stale epoch"
+    for url, future in futures.items():
+        json_resp, status = future.result()
+        results[url] = "applied" if status == 200 else json_resp.get("error", f"status {status}")
+    failed = [url for url, r in results.items() if r != "applied"]
+    if failed:
+        log_warn("Membership epoch %s not applied on %s", epoch, failed)
+    return {
+        "status": "ok" if not failed else "partial",
+        "epoch": epoch,
+        "peers": new_peers,
+        "ring_version": ring_version(new_peers),
+        "results": results,
+    }, 200 if not failed else 207
+
+
+@app.route("/membership", methods=["GET"])
+def get_membership():
+    """Return this node's peers, membership epoch and rebalance progress."""
+    return jsonify(membership_info())
+
+@app.route("/membership", methods=["POST"])
+def post_membership():
+    """
+    Apply a new peer list (sent by the node coordinating a join/leave).
+
+    Expects JSON: { "peers": [url, ...], "epoch": int, "previous": [url, ...] }
+    """
+    data = request.get_json(silent=True) or {}
+    peers = data.get("peers")
+    epoch = data.get("epoch")
+    previous = data.get("previous")
+    if not valid_membership(peers, epoch):
+        return jsonify({"error": "JSON must contain 'peers' list and integer 'epoch'"}), 400
+    if not update_membership(peers, epoch, previous if isinstance(previous, list) and previous else None):
+        return jsonify({"error": f"Epoch {epoch} is not newer than {MEMBERSHIP_EPOCH}"}), 409
+    return jsonify(membership_info())
+
+@app.route("/membership/join", methods=["POST"])
+def membership_join():
+    """
+    Add a node to the cluster. Expects JSON: { "url": "http://node4:5000" }
+
+    The new node must already be running; it is sent the full peer list.
+    """
+    url = (request.get_json(silent=True) or {}).get("url")
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        return jsonify({"error": "JSON must contain the node 'url'"}), 400
+    url = url.rstrip("/")
+    if url in PEERS:
+        return jsonify({"error": f"{url} is already a member"}), 409
+    _, status = forward_request(url, "GET", "/health")
+    if status != 200:
+        return jsonify({"error": f"{url} is not reachable"}), 502
+    log_info("Node %s joining", url)
+    return change_membership(sorted(set(PEERS) | {url}))
+
+@app.route("/membership/leave", methods=["POST"])
+def membership_leave():
+    """
+    Remove a node from the cluster. Expects JSON: { "url": "http://node3:5000" }
+
+    Its keys are handed over by the remaining replicas (or by the node
+    itself if it holds the only copy), so it should keep running until
+    its /membership rebalance reports "done".
+    """
+    url = (request.get_json(silent=True) or {}).get("url")
+    if not isinstance(url, str):
+        return jsonify({"error": "JSON must contain the node 'url'"}), 400
+    url = url.rstrip("/")
+    if url not in PEERS:
+        return jsonify({"error": f"{url} is not a member"}), 404
+    if len(PEERS) == 1:
+        return jsonify({"error": "Cannot remove the last node"}), 409
+    log_info("Node %s leaving", url)
+    return change_membership([peer for peer in PEERS if peer != url])
+
+@app.route("/membership/rebalance", methods=["POST"])
+def membership_rebalance():
+    """Restart the key transfer for the current ring (e.g. after a failed run)."""
+    rebalancer.start()
+    return jsonify(membership_info())
+
+
+# Content-Addressed File Storage
+# Files uploaded to /files are split into fixed-size chunks named by their
+# SHA-256 digest. Each chunk is stored on the replica nodes the ring picks
+# for its digest, so storage and bandwidth spread over the cluster, and a
+# chunk that is already stored is never stored (or sent) twice. The list of
+# chunks is kept in a manifest, itself stored in the DHT under "file:<name>".
+CHUNK_DIR = os.path.join(STORAGE_DIR, "_chunks")
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(4 << 20)))  # bytes per chunk
+FILE_TRANSFER_WINDOW = int(os.getenv("FILE_TRANSFER_WINDOW", "8"))  # chunks in flight per upload/download
+
+os.makedirs(CHUNK_DIR, exist_ok=True)
+
+def is_chunk_digest(digest: str) -> bool:
+    """Chunk names must be lowercase hex SHA-256 digests (also keeps paths safe)."""
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest)
+
+def chunk_path(digest: str) -> str:
+    return os.path.join(CHUNK_DIR, digest[:2], digest)
+
+def local_chunks() -> List[str]:
+    """Digests of the chunks stored on this node."""
+    return [name for _, _, names in os.walk(CHUNK_DIR) for name in names if is_chunk_digest(name)]
+
+def manifest_key(filename: str) -> str:
+    return f"file:{filename}"
+
+def store_chunk_local(digest: str, data: bytes) -> str:
+    """Store a chunk on this node. Returns "stored", or "exists" if it was already here."""
+    path = chunk_path(digest)
+    if os.path.exists(path):
+        return "exists"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), prefix=".chunk-", delete=False) as out:
+        out.write(data)
+    publish_file(out.name, path)
+    return "stored"
+
+def store_chunk_on(node_url: str, digest: str, data: bytes) -> Optional[str]:
+    """
+    Store a chunk on one node. Asks first whether the node already has it so
+    duplicate chunks are not sent over the network.
+    Returns "stored", "exists", or None on failure.
+    """
+    if node_url == SELF_URL:
+        return store_chunk_local(digest, data)
+    url = f"{node_url.rstrip('/')}/chunks/{digest}"
+    pool = get_peer_pool(node_url)
+    try:
+        if pool.request("HEAD", url).status_code == 200:
+            return "exists"
+        resp = pool.request("PUT", url, data=data)
+        return resp.json().get("status") if resp.status_code == 200 else None
+    except (requests.RequestException, ValueError) as e:
+        log_error("Failed to store chunk %s on %s: %s", digest[:12], node_url, e)
+        return None
+
+def fetch_chunk(digest: str) -> bytes:
+    """Fetch a chunk from the fastest replica that has it."""
+    for node_url in by_latency(find_replica_nodes(digest)):
+        if node_url == SELF_URL:
+            if os.path.exists(chunk_path(digest)):
+                with open(chunk_path(digest), "rb") as f:
+                    return f.read()
+            continue
+        try:
+            resp = get_peer_pool(node_url).request("GET", f"{node_url.rstrip('/')}/chunks/{digest}")
+        except requests.RequestException as e:
+            log_warn("Chunk %s unavailable on %s: %s", digest[:12], node_url, e)
+            continue
+        if resp.status_code == 200 and hashlib.sha256(resp.content).hexdigest() == digest:
+            return resp.content
+    raise IOError(f"Chunk {digest} not available on any replica")
+
+def load_manifest(filename: str) -> Optional[Dict]:
+    """Read a file's manifest from the DHT, or None if there is none."""
+    responses, _, _ = quorum_read(manifest_key(filename))
+    best = newest(responses)
+    return best["value"] if best is not None else None
+
+def read_exact(stream, size: int) -> bytes:
+    """Read up to `size` bytes, looping over short reads until the stream ends."""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+def distributed_file_response(manifest: Dict):
+    """
+    Stream a distributed file back to the client.
+
+    Up to FILE_TRANSFER_WINDOW chunks are fetched in parallel (from
+    different nodes) ahead of the one being sent, and sent in order. The
+    first window is fetched before the headers go out, so a file with a
+    missing chunk there is a 502 rather than a 200 with a truncated body;
+    a chunk lost after that aborts the connection short of Content-Length.
+    """
+    etag = manifest["sha256"]
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"'}
+
+    digests = iter(manifest["chunks"])
+    window = deque()
+    for digest in digests:
+        window.append(fanout_executor.submit(fetch_chunk, digest))
+        if len(window) >= FILE_TRANSFER_WINDOW:
+            break
+    try:
+        for future in window:
+            future.result()
+    except IOError as e:
+        for future in window:
+            future.cancel()
+        log_error("Cannot send distributed file %s: %s", manifest["filename"], e)
+        return jsonify({"error": "File chunk unavailable", "details": str(e)}), 502
+
+    def generate():
+        while window:
+            data = window.popleft().result()
+            next_digest = next(digests, None)
+            if next_digest is not None:
+                window.append(fanout_executor.submit(fetch_chunk, next_digest))
+            yield data
+
+    log_info("Sending distributed file %s (%s chunks)", manifest['filename'], len(manifest['chunks']))
+    return Response(
+        generate(),
+        mimetype="application/octet-stream",
+        headers={
+            "Content-Length": str(manifest["size"]),
+            "Content-Disposition": f"attachment; filename={manifest['filename']}",
+            "ETag": f'"{etag}"',
+        },
+    )
+
+
+@app.route("/chunks/<digest>", methods=["PUT"])
+def chunk_put(digest):
+    """Store one chunk on this node. The body must hash to the digest."""
+    if not is_chunk_digest(digest):
+        return jsonify({"error": "Chunk name must be a SHA-256 hex digest"}), 400
+    data = request.get_data()
+    if hashlib.sha256(data).hexdigest() != digest:
+        return jsonify({"error": "Chunk content does not match digest"}), 400
+    status = store_chunk_local(digest, data)
+    return jsonify({"status": status, "digest": digest, "size": len(data), "node": SELF_URL})
+
+
+@app.route("/chunks/<digest>", methods=["GET", "HEAD"])
+def chunk_get(digest):
+    """Return one chunk stored on this node (HEAD: just whether it exists)."""
+    if not is_chunk_digest(digest) or not os.path.exists(chunk_path(digest)):
+        return jsonify({"error": "Chunk not found"}), 404
+    return send_from_directory(os.path.dirname(chunk_path(digest)), digest, mimetype="application/octet-stream")
+
+
+@app.route("/files/<filename>", methods=["PUT"])
+def file_put(filename):
+    """
+    Upload a file into distributed, deduplicated storage.
+
+        curl -T big.iso http://localhost:5001/files/big.iso
+
+    The body is split into FILE_CHUNK_SIZE chunks as it streams in. Each
+    chunk goes to its replica nodes (at most FILE_TRANSFER_WINDOW chunks in
+    flight), then the manifest is written to the DHT.
+    """
+    if is_internal_name(filename):
+        return jsonify({"error": "Names starting with '.' or '_' are reserved"}), 400
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({"error": "Invalid filename"}), 400
+    log_info("PUT /files/%s from %s", filename, request.remote_addr)
+
+    digests: List[str] = []
+    whole = hashlib.sha256()
+    size = 0
+    pending = deque()  # (digest, required acks, [futures]) in upload order
+    counts = {"stored": 0, "exists": 0}
+    failed: List[str] = []
+    seen = set()
+
+    def settle(item) -> None:
+        digest, required, futures = item
+        results = [f.result() for f in futures]
+        acks = sum(1 for r in results if r is not None)
+        if acks < required:
+            failed.append(digest)
+        # a chunk counts as new if any replica had to store it
+        counts["stored" if "stored" in results else "exists"] += 1
+
+    while True:
+        data = read_exact(request.stream, FILE_CHUNK_SIZE)
+        if not data:
+            break
+        digest = hashlib.sha256(data).hexdigest()
+        digests.append(digest)
+        whole.update(data)
+        size += len(data)
+        if digest in seen:
+            counts["exists"] += 1  # repeated inside this file; already on its way
+            continue
+        seen.add(digest)
+        replicas = find_replica_nodes(digest)
+        required, _ = quorum_sizes(replicas)
+        futures = [fanout_executor.submit(store_chunk_on, url, digest, data) for url in replicas]
+        pending.append((digest, required, futures))
+        if len(pending) >= FILE_TRANSFER_WINDOW:
+            settle(pending.popleft())
+    while pending:
+        settle(pending.popleft())
+
+    if failed:
+        log_error("Upload of %s failed: %s chunks below write quorum", filename, len(failed))
+        return jsonify({"error": "Some chunks could not be stored", "failed_chunks": failed}), 503
+
+    manifest = {
+        "filename": filename,
+        "size": size,
+        "chunk_size": FILE_CHUNK_SIZE,
+        "chunks": digests,
+        "sha256": whole.hexdigest(),
+    }
+    acks, replicas, _ = quorum_write(manifest_key(filename), manifest)
+    w, _ = quorum_sizes(replicas)
+    if acks < w:
+        return jsonify({"error": "Manifest write quorum not reached", "acks": acks, "required": w}), 503
+
+    log_info(
+        "Distributed file stored: %s (%d bytes, %d chunks, %d deduplicated)",
+        filename, size, len(digests), counts["exists"],
+    )
+    return jsonify(
+        {
+            "status": "ok",
+            "filename": filename,
+            "size": size,
+            "sha256": manifest["sha256"],
+            "chunks": len(digests),
+            "new_chunks": counts["stored"],
+            "deduplicated_chunks": counts["exists"],
+            "node": SELF_URL,
+        }
+    )
+
+
+@app.route("/files/<filename>", methods=["GET"])
+def file_get(filename):
+    """Download a distributed file, fetching its chunks from several nodes in parallel."""
+    if is_internal_name(filename):
+        return jsonify({"error": "File not found"}), 404
+    filename = secure_filename(filename)
+    log_info("GET /files/%s from %s", filename, request.remote_addr)
+    manifest = load_manifest(filename)
+    if manifest is None:
+        return jsonify({"error": "File not found"}), 404
+    return distributed_file_response(manifest)
+
+
+@app.route("/files/<filename>/manifest", methods=["GET"])
+def file_manifest(filename):
+    """Return a distributed file's manifest, with the nodes holding each chunk."""
+    if is_internal_name(filename):
+        return jsonify({"error": "File not found"}), 404
+    manifest = load_manifest(secure_filename(filename))
+    if manifest is None:
+        return jsonify({"error": "File not found"}), 404
+    return jsonify(
+        {
+            **manifest,
+            "placement": {digest: find_replica_nodes(digest) for digest in dict.fromkeys(manifest["chunks"])},
+        }
+    )
+
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5000"))
-    log_info(f"Starting DHT node at {SELF_URL} on port {port}")
+    log_info("Starting DHT node at %s on port %s", SELF_URL, port)
     # Listen on all interfaces so Docker can expose the port
     app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,1087 @@
+'''
+Async (ASGI) serving mode for the DHT node.
+
+Serves the same /kv, /kv/batch, /upload, /download, /files, /health and
+/peers API as app.py, plus the internal /kv/replica, /kv/cache and /chunks
+routes, so async and Flask nodes can be mixed in one cluster. Joins and
+leaves (/membership/join, /membership/leave) are coordinated by Flask nodes;
+an async node applies the membership changes it is sent. Requests run on an asyncio event loop (Starlette + uvicorn)
+and replica calls to peers use a non-blocking httpx client, so a forwarded
+request no longer ties up a thread while it waits on a peer.
+
+The ring, the key-value store and persistence are shared with app.py by
+importing it; only the HTTP layer is different here.
+
+Run with:
+    python async_app.py
+
+Citation(s):
+1) Encode. (n.d.). Starlette. Retrieved from https://www.starlette.io/
+2) Encode. (n.d.). HTTPX – Async Support. Retrieved from https://www.python-httpx.org/async/
+'''
+
+import os
+import time
+import hashlib
+import itertools
+import asyncio # event loop, gather/wait for replica fan-out.
+import contextlib
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import httpx # non-blocking HTTP client for peer calls.
+import uvicorn # ASGI server.
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header, parse_etags
+
+import app as node # ring, store, persistence and settings shared with the Flask mode.
+from app import SELF_URL, log_info, log_warn, log_error, log_request
+
+# Threads for work that would block the event loop: waiting for the WAL
+# group commit and writing uploaded files. Node state lives in this one
+# process, so concurrency comes from the event loop plus these threads,
+# not from several server processes.
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "32"))
+# Max simultaneous peer connections (total and per peer) held by the client.
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", "1000"))
+# Max requests the server accepts at once before replying 503.
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "10000"))
+
+blocking_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS)
+
+client: Optional[httpx.AsyncClient] = None
+
+# Replica calls still running after a quorum was reached; asyncio only keeps
+# weak references to tasks, so they are held here until they finish.
+background_tasks = set()
+
+# Smoothed response time per peer, used to send reads to the fastest replica.
+peer_latency: Dict[str, float] = {}
+
+
+async def run_blocking(func, *args):
+    """Run a blocking function on the worker threads."""
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, func, *args)
+
+
+def in_background(coro) -> None:
+    """Run a coroutine to completion without waiting for it."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def read_json(request: Request) -> Dict:
+    """The request's JSON object, or {} if the body is not one (like Flask's get_json(silent=True))."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def record_latency(node_url: str, seconds: float) -> None:
+    old = peer_latency.get(node_url)
+    peer_latency[node_url] = seconds if old is None else 0.8 * old + 0.2 * seconds
+
+
+def by_latency(node_urls: List[str]) -> List[str]:
+    """Order nodes fastest first: this node, then peers by smoothed response time."""
+    return sorted(node_urls, key=lambda url: -1.0 if url == SELF_URL else peer_latency.get(url, 0.0))
+
+
+# Helper: Forwarding Requests
+async def forward_request(node_url: str, method: str, path: str, **kwargs):
+    """
+    Async counterpart of app.forward_request.
+
+    Returns:
+        (json_body, status_code)
+    """
+    url = node_url.rstrip("/") + path
+    log_request("Forwarding %s %s to %s", method.upper(), path, node_url)
+    attempt = 0
+    while True:
+        sent = time.perf_counter()
+        try:
+            resp = await client.request(method.upper(), url, **kwargs)
+            elapsed = time.perf_counter() - sent
+            record_latency(node_url, elapsed)
+            node.forward_latency.observe(elapsed, node_url)
+            body = resp.json()
+            node.forward_requests.inc(node_url, "ok")
+            return body, resp.status_code
+        except httpx.ConnectError as e:
+            # Same policy as the Flask client: only retry when the peer never got the request.
+            if attempt < node.FORWARD_RETRIES:
+                await asyncio.sleep(node.FORWARD_BACKOFF * (2 ** attempt))
+                attempt += 1
+                continue
+            error = e
+        except (httpx.HTTPError, ValueError) as e:
+            error = e
+        record_latency(node_url, node.FORWARD_READ_TIMEOUT)
+        node.forward_requests.inc(node_url, "error")
+        log_error("Failed to contact node %s: %s", node_url, error)
+        return {"error": f"Failed to contact node {node_url}", "details": str(error)}, 502
+
+
+# Replication Helpers
+async def replica_write(node_url: str, key: str, value, version: int) -> bool:
+    """Write one replica of a key. Returns True if the replica acknowledged it."""
+    if node_url == SELF_URL:
+        await run_blocking(node.local_put, key, value, version)
+        return True
+    _, status = await forward_request(
+        node_url, "POST", "/kv/replica", json={"key": key, "value": value, "version": version}
+    )
+    return status == 200
+
+
+async def replica_read(node_url: str, key: str, lease: bool = False) -> Optional[Dict]:
+    """Read one replica of a key. Returns its response, or None if it failed."""
+    if node_url == SELF_URL:
+        return node.local_get(key)
+    params = {"lease": SELF_URL} if lease else None
+    json_resp, status = await forward_request(node_url, "GET", f"/kv/replica/{key}", params=params)
+    if status in (200, 404) and isinstance(json_resp, dict) and "status" in json_resp:
+        return json_resp
+    return None
+
+
+async def quorum_write(key: str, value):
+    """Write to all replicas concurrently; return once W have acked. Returns (acks, replicas, version)."""
+    version = time.time_ns()
+    replicas = node.find_replica_nodes(key)
+    node.read_cache.invalidate(key, version, fence=False)
+    w, _ = node.quorum_sizes(replicas)
+    pending = {asyncio.ensure_future(replica_write(url, key, value, version)) for url in replicas}
+    acks = 0
+    while acks < w and pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        acks += sum(1 for t in done if t.result())
+    # Replicas still in flight finish in the background.
+    for task in pending:
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    return acks, replicas, version
+
+
+async def quorum_read(key: str, lease: bool = False):
+    """
+    Read from the R fastest replicas, hedging to the next replica after
+    HEDGE_DELAY_MS or on failure. With `lease`, replicas are asked for a
+    lease on the key. Returns (responses, replicas, hedged_count).
+    """
+    owners = node.find_replica_nodes(key)
+    replicas = by_latency(owners)
+    _, r = node.quorum_sizes(replicas)
+    responses: List[Dict] = []
+    pending = set()
+    next_idx = 0
+    hedged = 0
+
+    def ask_next():
+        nonlocal next_idx
+        url = replicas[next_idx]
+        next_idx += 1
+        if url == SELF_URL:
+            responses.append(node.local_get(key))
+        else:
+            pending.add(asyncio.ensure_future(replica_read(url, key, lease)))
+
+    while next_idx < r:
+        ask_next()
+
+    while len(responses) < r and pending:
+        done, pending = await asyncio.wait(
+            pending, timeout=node.HEDGE_DELAY_MS / 1000.0, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            if next_idx < len(replicas):
+                hedged += 1
+                ask_next()
+            continue
+        for task in done:
+            resp = task.result()
+            if resp is not None:
+                responses.append(resp)
+            elif next_idx < len(replicas):
+                ask_next()
+    for task in pending:
+        task.cancel()
+    return responses, owners, hedged
+
+
+# Health & Peer Info
+async def health(request: Request):
+    """Basic health check endpoint."""
+    log_request("GET /health from %s", request.client.host)
+    return JSONResponse({"status": "ok", "self": SELF_URL, "peers": node.PEERS, "mode": "async"})
+
+
+async def get_peers(request: Request):
+    """Return the peer list, ring and load report (same as the Flask mode)."""
+    log_info("GET /peers from %s", request.client.host)
+    return JSONResponse(
+        {
+            "self": SELF_URL,
+            "peers": node.PEERS,
+            "vnodes": node.VNODES,
+            "ring_version": node.RING_VERSION,
+            "replication": {"n": node.REPLICATION_FACTOR, "w": node.WRITE_QUORUM, "r": node.READ_QUORUM},
+            "ring": node.RING,
+            "load": node.ring_load_report(node.RING),
+            "local_keys": len(node.kv_store),
+        }
+    )
+
+
+async def persistence_stats(request: Request):
+    """Return write-ahead log, snapshot and recovery statistics."""
+    if node.persistence is None:
+        return JSONResponse({"enabled": False, "node": SELF_URL})
+    return JSONResponse({"enabled": True, "node": SELF_URL, **node.persistence.stats()})
+
+
+async def engine_stats(request: Request):
+    """Return the storage engine's key count and memory use."""
+    return JSONResponse({"node": SELF_URL, **node.kv_store.stats()})
+
+
+async def persistence_snapshot(request: Request):
+    """Write a compacted snapshot now instead of waiting for the next interval."""
+    if node.persistence is None:
+        return JSONResponse({"error": "Persistence is disabled"}, status_code=409)
+    return JSONResponse({"status": "ok", "node": SELF_URL, "snapshot": await run_blocking(node.persistence.snapshot)})
+
+
+async def pool_stats(request: Request):
+    """
+    Return peer connection statistics.
+
+    Peer calls share one httpx client, so there is a single connection
+    limit and a smoothed response time per peer instead of app.py's
+    per-peer pools. "pools" lists the blocking pools this node still uses
+    (lease revocations sent from its write threads).
+    """
+    return JSONResponse(
+        {
+            "self": SELF_URL,
+            "max_connections": ASYNC_MAX_CONNECTIONS,
+            "peers": {url: {"latency_ewma_s": round(seconds, 6)} for url, seconds in peer_latency.items()},
+            "pools": {url: pool.stats() for url, pool in node.peer_pools.items()},
+        }
+    )
+
+
+# File Upload & Download
+def _save_upload(upload, save_path: str) -> None:
+    out = tempfile.NamedTemporaryFile("wb", dir=node.STORAGE_DIR, prefix=".upload-", delete=False)
+    try:
+        with out:
+            node.copy_stream(upload.file.read, out.write)
+        node.publish_file(out.name, save_path)
+    finally:
+        node.remove_if_exists(out.name)
+
+
+async def _write_body(request: Request, out) -> int:
+    """Write the request body to an open file as it arrives; returns bytes written."""
+    written = 0
+    async for chunk in request.stream():
+        if chunk:
+            await run_blocking(out.write, chunk)
+            written += len(chunk)
+    return written
+
+
+async def upload_file(request: Request):
+    """Upload a file to this node's local storage directory. Expects form-data: file=@filename"""
+    log_info("POST /upload from %s", request.client.host)
+    form = await request.form()
+    try:
+        f = form.get("file")
+        if f is None or isinstance(f, str):
+            log_warn("Upload failed – no file part in request")
+            return JSONResponse({"error": "No file part"}, status_code=400)
+        if not f.filename:
+            log_warn("Upload failed – empty filename")
+            return JSONResponse({"error": "No selected file"}, status_code=400)
+        if node.is_internal_name(os.path.basename(f.filename)):
+            log_warn("Upload failed – reserved filename %s", f.filename)
+            return JSONResponse({"error": "Names starting with '.' or '_' are reserved"}, status_code=400)
+
+        filename = secure_filename(f.filename)
+        save_path = os.path.join(node.STORAGE_DIR, filename)
+        await run_blocking(_save_upload, f, save_path)
+    finally:
+        await form.close()  # every part's spooled temp file, not just "file"
+
+    log_info("File uploaded: %s -> %s", filename, save_path)
+    return JSONResponse({"status": "ok", "filename": filename, "stored_at": save_path, "node": SELF_URL})
+
+
+async def upload_stream(request: Request):
+    """
+    Stream a raw request body into storage, optionally resumable with
+    Content-Range (same contract as app.upload_stream).
+    """
+    if node.is_internal_name(request.path_params["filename"]):
+        return JSONResponse({"error": "Names starting with '.' or '_' are reserved"}, status_code=400)
+    filename = secure_filename(request.path_params["filename"])
+    if not filename:
+        return JSONResponse({"error": "Invalid filename"}, status_code=400)
+    log_info("PUT /upload/%s from %s", filename, request.client.host)
+
+    save_path = os.path.join(node.STORAGE_DIR, filename)
+    content_range = request.headers.get("content-range")
+
+    if content_range is None:
+        out = tempfile.NamedTemporaryFile("wb", dir=node.STORAGE_DIR, prefix=".upload-", delete=False)
+        try:
+            with out:
+                size = await _write_body(request, out)
+            node.publish_file(out.name, save_path)
+        finally:
+            node.remove_if_exists(out.name)  # the client went away mid-upload
+        log_info("File streamed: %s (%s bytes) -> %s", filename, size, save_path)
+        return JSONResponse({"status": "ok", "filename": filename, "size": size, "stored_at": save_path, "node": SELF_URL})
+
+    rng = parse_content_range_header(content_range)
+    if rng is None or rng.units != "bytes" or rng.length is None:
+        return JSONResponse({"error": "Content-Range must be 'bytes <start>-<end>/<total>'"}, status_code=400)
+
+    part = node.part_path(filename)
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if rng.start != offset:
+        log_warn("Resumable upload %s: got offset %s, expected %s", filename, rng.start, offset)
+        return JSONResponse(
+            {"error": "Unexpected offset", "upload_offset": offset},
+            status_code=416,
+            headers={"Upload-Offset": str(offset)},
+        )
+
+    with open(part, "ab") as out:
+        offset += await _write_body(request, out)
+
+    if offset >= rng.length:
+        node.publish_file(part, save_path)
+        log_info("Resumable upload complete: %s (%s bytes)", filename, offset)
+        return JSONResponse({"status": "ok", "filename": filename, "size": offset, "stored_at": save_path, "node": SELF_URL})
+
+    return JSONResponse(
+        {"status": "partial", "filename": filename, "upload_offset": offset, "total": rng.length},
+        status_code=202,
+        headers={"Upload-Offset": str(offset)},
+    )
+
+
+async def upload_offset(request: Request):
+    """Report how many bytes of a resumable upload are stored (Upload-Offset header)."""
+    if node.is_internal_name(request.path_params["filename"]):
+        return Response(status_code=400)
+    part = node.part_path(secure_filename(request.path_params["filename"]))
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    return Response(status_code=200, headers={"Upload-Offset": str(offset)})
+
+
+async def download_file(request: Request):
+    """
+    Download a file from this node's local storage directory.
+
+    FileResponse answers Range requests with 206 Partial Content and uses
+    the server's zero-copy path-send extension when available; If-None-Match
+    is checked here against the same ETag the Flask mode uses. Files that
+    are not stored locally are looked up as distributed files.
+    """
+    filename = request.path_params["filename"]
+    log_request("GET /download/%s from %s", filename, request.client.host)
+
+    if node.is_internal_name(filename):
+        log_warn("Refused download of internal file: %s", filename)
+        return JSONResponse({"error": "File not found"}, status_code=404)
+
+    storage = os.path.realpath(node.STORAGE_DIR)
+    full_path = os.path.realpath(os.path.join(storage, filename))
+    if not full_path.startswith(storage + os.sep) or not os.path.isfile(full_path):
+        # Not stored on this node – it may be a distributed file (see /files).
+        manifest = await load_manifest(secure_filename(filename))
+        if manifest is not None:
+            return await distributed_file_response(request, manifest)
+        log_warn("File not found: %s", filename)
+        return JSONResponse({"error": "File not found"}, status_code=404)
+
+    etag = node.file_etag(full_path)
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+
+    log_request("File sent: %s", filename)
+    return FileResponse(full_path, filename=os.path.basename(full_path), headers={"ETag": f'"{etag}"'})
+
+
+# Key-Value Endpoints with DHT Routing
+async def kv_put(request: Request):
+    """Store a key–value pair on its replicas; replies once WRITE_QUORUM acked."""
+    data = await read_json(request)
+    key = data.get("key")
+    value = data.get("value")
+
+    log_request("POST /kv from %s – key=%s, value=%s", request.client.host, key, value)
+
+    if key is None or value is None:
+        log_warn("KV PUT failed – JSON missing 'key' or 'value'")
+        return JSONResponse({"error": "JSON must contain 'key' and 'value'"}, status_code=400)
+
+    acks, replicas, version = await quorum_write(key, value)
+    w, _ = node.quorum_sizes(replicas)
+    if acks < w:
+        log_warn("Write quorum not reached for '%s' (%s/%s)", key, acks, w)
+        return JSONResponse(
+            {"error": "Write quorum not reached", "key": key, "acks": acks, "required": w, "replicas": replicas},
+            status_code=503,
+        )
+    return JSONResponse(
+        {
+            "status": "stored",
+            "key": key,
+            "value": value,
+            "node": SELF_URL,
+            "replicas": replicas,
+            "acks": acks,
+            "version": version,
+        }
+    )
+
+
+async def kv_get(request: Request):
+    """
+    Read a key from the fastest READ_QUORUM replicas with hedging. Keys this
+    node does not replicate are served from the read cache, as in app.kv_get.
+    """
+    key = request.path_params["key"]
+    log_request("GET /kv/%s from %s", key, request.client.host)
+
+    cacheable = node.read_cache.enabled and SELF_URL not in node.find_replica_nodes(key)
+    if cacheable:
+        cached = node.read_cache.get(key)
+        if cached is not None:
+            return JSONResponse(cached)
+
+    responses, replicas, hedged = await quorum_read(key, lease=cacheable)
+    _, r = node.quorum_sizes(replicas)
+    if len(responses) < r:
+        log_warn("Read quorum not reached for '%s' (%s/%s)", key, len(responses), r)
+        return JSONResponse(
+            {"error": "Read quorum not reached", "key": key, "responses": len(responses), "required": r,
+             "replicas": replicas},
+            status_code=503,
+        )
+
+    best = node.newest(responses)
+    if best is None:
+        # Keys may still be moving to the new replicas after a membership change.
+        previous = [url for url in node.rebalancer.previous_replicas(key) if url not in replicas]
+        for resp in await asyncio.gather(*(replica_read(url, key) for url in previous)):
+            if resp is not None:
+                responses.append(resp)
+        best = node.newest(responses)
+    if best is None:
+        return JSONResponse(
+            {"status": "not_found", "key": key, "node": SELF_URL, "replicas": replicas}, status_code=404
+        )
+
+    # Read repair in the background for replicas that answered with an older version.
+    for resp in responses:
+        if resp is not best and resp.get("version", 0) < best.get("version", 0):
+            in_background(replica_write(resp["node"], key, best["value"], best["version"]))
+
+    result = {
+        "status": "found",
+        "key": key,
+        "value": best["value"],
+        "node": best["node"],
+        "version": best.get("version", 0),
+        "replicas": replicas,
+        "hedged": hedged,
+    }
+    if cacheable:
+        node.read_cache.put(key, {**result, "hedged": 0, "cached": True}, best.get("lease", 0))
+    return JSONResponse(result)
+
+
+# Replica Endpoints (same contract as in app.py)
+async def kv_replica_put(request: Request):
+    data = await read_json(request)
+    key = data.get("key")
+    value = data.get("value")
+    version = data.get("version", 0)
+    if key is None or value is None or not isinstance(version, int):
+        return JSONResponse({"error": "JSON must contain 'key', 'value' and integer 'version'"}, status_code=400)
+    applied = await run_blocking(node.local_put, key, value, version)
+    return JSONResponse(
+        {"status": "stored" if applied else "stale", "key": key, "version": version, "node": SELF_URL}
+    )
+
+
+async def kv_replica_get(request: Request):
+    resp = node.local_get(request.path_params["key"], request.query_params.get("lease"))
+    return JSONResponse(resp, status_code=200 if resp["status"] == "found" else 404)
+
+
+async def kv_replica_batch_put(request: Request):
+    data = await read_json(request)
+    items = data.get("items")
+    version = data.get("version", 0)
+    versions = data.get("versions")
+    if not isinstance(items, dict) or not isinstance(version, int):
+        return JSONResponse({"error": "JSON must contain 'items' object and integer 'version'"}, status_code=400)
+    if versions is None:
+        versions = {key: version for key in items}
+    elif not isinstance(versions, dict):
+        return JSONResponse({"error": "'versions' must map keys to integer versions"}, status_code=400)
+    applied = set(await run_blocking(node.local_put_many, items, versions))
+    return JSONResponse(
+        {"node": SELF_URL, "results": {key: {"status": "stored" if key in applied else "stale"} for key in items}}
+    )
+
+
+async def kv_replica_batch_get(request: Request):
+    data = await read_json(request)
+    keys = data.get("keys")
+    if not isinstance(keys, list):
+        return JSONResponse({"error": "JSON must contain 'keys' list"}, status_code=400)
+    return JSONResponse({"node": SELF_URL, "results": {key: node.local_get(key) for key in keys}})
+
+
+async def kv_cache_invalidate(request: Request):
+    """Lease revocation from a replica. Expects JSON { "keys": {key: new version} }."""
+    data = await read_json(request)
+    keys = data.get("keys")
+    if not isinstance(keys, dict) or not all(isinstance(v, int) for v in keys.values()):
+        return JSONResponse({"error": "JSON must contain 'keys' mapping keys to integer versions"}, status_code=400)
+    for key, version in keys.items():
+        node.read_cache.invalidate(key, version)
+    return JSONResponse({"status": "invalidated", "keys": len(keys), "node": SELF_URL})
+
+
+async def cache_stats(request: Request):
+    """Return read cache hits, misses and evictions, and the leases this node granted."""
+    return JSONResponse({"node": SELF_URL, "cache": node.read_cache.stats(), "leases": node.leases.stats()})
+
+
+# Batch Key-Value Endpoints (scatter-gather, same contract as in app.py)
+async def scatter_gather(groups: Dict[str, List[str]], path: str, build_body, handle_local) -> Dict[str, Optional[Dict]]:
+    """
+    Async counterpart of app.scatter_gather: one sub-request per node, all
+    in flight at once. `handle_local` is a coroutine function for this
+    node's own keys. Returns { node_url: {key: result} or None if it failed }.
+    """
+    remote_urls = [url for url in groups if url != SELF_URL]
+    remote = asyncio.gather(
+        *(forward_request(url, "POST", path, json=build_body(groups[url])) for url in remote_urls)
+    )
+    node_results: Dict[str, Optional[Dict]] = {}
+    if SELF_URL in groups:
+        node_results[SELF_URL] = await handle_local(groups[SELF_URL])
+    for node_url, (json_resp, status) in zip(remote_urls, await remote):
+        results = json_resp.get("results") if isinstance(json_resp, dict) else None
+        if status != 200 or not isinstance(results, dict):
+            log_warn("Batch sub-request to %s failed with status %s", node_url, status)
+            results = None
+        node_results[node_url] = results
+    return node_results
+
+
+def batch_response(results: Dict[str, Dict], groups: Dict[str, List[str]]) -> JSONResponse:
+    failed = sum(1 for r in results.values() if r["status"] == "error")
+    return JSONResponse(
+        {
+            "status": "ok" if failed == 0 else "partial",
+            "node": SELF_URL,
+            "owners": {url: len(keys) for url, keys in groups.items()},  # node -> keys sent to it
+            "failed": failed,
+            "results": results,
+        }
+    )
+
+
+async def kv_batch_put(request: Request):
+    """Store many key–value pairs with one sub-request per replica node (see app.kv_batch_put)."""
+    data = await read_json(request)
+    items = data.get("items")
+    if not isinstance(items, dict) or any(v is None for v in items.values()):
+        log_warn("KV batch PUT failed – JSON missing 'items' object")
+        return JSONResponse({"error": "JSON must contain 'items' mapping keys to values"}, status_code=400)
+    if len(items) > node.BATCH_MAX_KEYS:
+        return JSONResponse({"error": f"Batch exceeds {node.BATCH_MAX_KEYS} keys"}, status_code=413)
+
+    log_request("POST /kv/batch from %s – %d keys", request.client.host, len(items))
+
+    version = time.time_ns()
+    groups: Dict[str, List[str]] = {}
+    required: Dict[str, int] = {}
+    for key in items:
+        node.read_cache.invalidate(key, version, fence=False)
+        replicas = node.find_replica_nodes(key)
+        required[key], _ = node.quorum_sizes(replicas)
+        for url in replicas:
+            groups.setdefault(url, []).append(key)
+
+    async def handle_local(keys):
+        await run_blocking(node.local_put_many, {key: items[key] for key in keys}, {key: version for key in keys})
+        return {key: {"status": "stored"} for key in keys}
+
+    node_results = await scatter_gather(
+        groups,
+        "/kv/replica/batch",
+        lambda keys: {"items": {key: items[key] for key in keys}, "version": version},
+        handle_local,
+    )
+
+    # Every reply for a key counts as an ack, including "stale".
+    acks = {key: 0 for key in items}
+    for node_url, results in node_results.items():
+        if results is None:
+            continue
+        for key in groups[node_url]:
+            if key in results:
+                acks[key] += 1
+
+    results = {
+        key: {"status": "stored" if acks[key] >= required[key] else "error", "acks": acks[key]}
+        for key in items
+    }
+    return batch_response(results, groups)
+
+
+async def kv_batch_get(request: Request):
+    """Read many keys from their fastest replicas, retrying on the next replica (see app.kv_batch_get)."""
+    data = await read_json(request)
+    keys = data.get("keys")
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        log_warn("KV batch GET failed – JSON missing 'keys' list")
+        return JSONResponse({"error": "JSON must contain 'keys' as a list of strings"}, status_code=400)
+    if len(keys) > node.BATCH_MAX_KEYS:
+        return JSONResponse({"error": f"Batch exceeds {node.BATCH_MAX_KEYS} keys"}, status_code=413)
+
+    log_request("POST /kv/batch/get from %s – %d keys", request.client.host, len(keys))
+
+    keys = list(dict.fromkeys(keys))
+    candidates = {key: by_latency(node.find_replica_nodes(key)) for key in keys}
+    needed = {key: node.quorum_sizes(candidates[key])[1] for key in keys}
+    tried = {key: 0 for key in keys}
+    responses: Dict[str, List[Dict]] = {key: [] for key in keys}
+    all_groups: Dict[str, List[str]] = {}
+
+    async def handle_local(local_keys):
+        return {key: node.local_get(key) for key in local_keys}
+
+    pending = keys
+    while pending:
+        groups: Dict[str, List[str]] = {}
+        for key in pending:
+            missing = needed[key] - len(responses[key])
+            for url in candidates[key][tried[key]:tried[key] + missing]:
+                groups.setdefault(url, []).append(key)
+            tried[key] += missing
+        for url, group_keys in groups.items():
+            all_groups.setdefault(url, []).extend(group_keys)
+
+        node_results = await scatter_gather(
+            groups, "/kv/replica/batch/get", lambda node_keys: {"keys": node_keys}, handle_local
+        )
+        for node_url, results in node_results.items():
+            if results is None:
+                continue
+            for key in groups[node_url]:
+                if key in results:
+                    responses[key].append(results[key])
+
+        pending = [
+            key for key in pending
+            if len(responses[key]) < needed[key] and tried[key] < len(candidates[key])
+        ]
+
+    results: Dict[str, Dict] = {}
+    for key in keys:
+        best = node.newest(responses[key])
+        if len(responses[key]) < needed[key]:
+            results[key] = {"status": "error", "responses": len(responses[key])}
+        elif best is None:
+            results[key] = {"status": "not_found"}
+        else:
+            results[key] = {"status": "found", "value": best["value"], "node": best["node"]}
+    return batch_response(results, all_groups)
+
+
+# Membership (join/leave are coordinated by Flask nodes; async nodes apply
+# the changes they are sent and rebalance like any other member)
+async def get_membership(request: Request):
+    return JSONResponse(node.membership_info())
+
+
+async def post_membership(request: Request):
+    data = await read_json(request)
+    peers = data.get("peers")
+    epoch = data.get("epoch")
+    previous = data.get("previous")
+    if not node.valid_membership(peers, epoch):
+        return JSONResponse({"error": "JSON must contain 'peers' list and integer 'epoch'"}, status_code=400)
+    previous = previous if isinstance(previous, list) and previous else None
+    if not await run_blocking(node.update_membership, peers, epoch, previous):
+        return JSONResponse({"error": f"Epoch {epoch} is not newer than {node.MEMBERSHIP_EPOCH}"}, status_code=409)
+    return JSONResponse(node.membership_info())
+
+
+# Distributed File Storage (same chunk and manifest layout as app.py)
+async def store_chunk_on(node_url: str, digest: str, data: bytes) -> Optional[str]:
+    """Store a chunk on one node unless it already has it. Returns "stored", "exists", or None on failure."""
+    if node_url == SELF_URL:
+        return await run_blocking(node.store_chunk_local, digest, data)
+    url = f"{node_url.rstrip('/')}/chunks/{digest}"
+    try:
+        if (await client.head(url)).status_code == 200:
+            return "exists"
+        resp = await client.put(url, content=data)
+        return resp.json().get("status") if resp.status_code == 200 else None
+    except (httpx.HTTPError, ValueError) as e:
+        log_error("Failed to store chunk %s on %s: %s", digest[:12], node_url, e)
+        return None
+
+
+def _read_chunk(digest: str) -> Optional[bytes]:
+    path = node.chunk_path(digest)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def fetch_chunk(digest: str) -> bytes:
+    """Fetch a chunk from the fastest replica that has it."""
+    for node_url in by_latency(node.find_replica_nodes(digest)):
+        if node_url == SELF_URL:
+            data = await run_blocking(_read_chunk, digest)
+            if data is not None:
+                return data
+            continue
+        try:
+            resp = await client.get(f"{node_url.rstrip('/')}/chunks/{digest}")
+        except httpx.HTTPError as e:
+            log_warn("Chunk %s unavailable on %s: %s", digest[:12], node_url, e)
+            continue
+        if resp.status_code == 200 and hashlib.sha256(resp.content).hexdigest() == digest:
+            return resp.content
+    raise IOError(f"Chunk {digest} not available on any replica")
+
+
+async def load_manifest(filename: str) -> Optional[Dict]:
+    """Read a file's manifest from the DHT, or None if there is none."""
+    responses, _, _ = await quorum_read(node.manifest_key(filename))
+    best = node.newest(responses)
+    return best["value"] if best is not None else None
+
+
+async def distributed_file_response(request: Request, manifest: Dict):
+    """
+    Stream a distributed file, fetching up to FILE_TRANSFER_WINDOW chunks
+    ahead of the one being sent. The first window is fetched before the
+    headers go out, as in app.distributed_file_response, so a missing chunk
+    there is a 502, not a truncated 200.
+    """
+    etag = manifest["sha256"]
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+
+    digests = iter(manifest["chunks"])
+    window = deque(
+        asyncio.ensure_future(fetch_chunk(digest))
+        for digest in itertools.islice(digests, node.FILE_TRANSFER_WINDOW)
+    )
+    try:
+        await asyncio.gather(*window)
+    except IOError as e:
+        for task in window:
+            task.cancel()
+        log_error("Cannot send distributed file %s: %s", manifest["filename"], e)
+        return JSONResponse({"error": "File chunk unavailable", "details": str(e)}, status_code=502)
+
+    async def body():
+        try:
+            while window:
+                data = await window.popleft()
+                next_digest = next(digests, None)
+                if next_digest is not None:
+                    window.append(asyncio.ensure_future(fetch_chunk(next_digest)))
+                yield data
+        finally:
+            for task in window:
+                task.cancel()
+
+    log_info("Sending distributed file %s (%d chunks)", manifest["filename"], len(manifest["chunks"]))
+    return StreamingResponse(
+        body(),
+        media_type="application/octet-stream",
+        headers={
+            "Content-Length": str(manifest["size"]),
+            "Content-Disposition": f"attachment; filename={manifest['filename']}",
+            "ETag": f'"{etag}"',
+        },
+    )
+
+
+async def chunk_put(request: Request):
+    """Store one chunk on this node. The body must hash to the digest."""
+    digest = request.path_params["digest"]
+    if not node.is_chunk_digest(digest):
+        return JSONResponse({"error": "Chunk name must be a SHA-256 hex digest"}, status_code=400)
+    data = await request.body()
+    if hashlib.sha256(data).hexdigest() != digest:
+        return JSONResponse({"error": "Chunk content does not match digest"}, status_code=400)
+    status = await run_blocking(node.store_chunk_local, digest, data)
+    return JSONResponse({"status": status, "digest": digest, "size": len(data), "node": SELF_URL})
+
+
+async def chunk_get(request: Request):
+    """Return one chunk stored on this node (HEAD: just whether it exists)."""
+    digest = request.path_params["digest"]
+    if not node.is_chunk_digest(digest) or not os.path.exists(node.chunk_path(digest)):
+        return JSONResponse({"error": "Chunk not found"}, status_code=404)
+    return FileResponse(node.chunk_path(digest), media_type="application/octet-stream")
+
+
+def _hash_chunk(whole, data: bytes) -> str:
+    whole.update(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+async def _body_chunks(request: Request, size: int):
+    """Yield the request body in pieces of exactly `size` bytes (the last may be shorter)."""
+    buf = bytearray()
+    async for part in request.stream():
+        buf += part
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+
+async def file_put(request: Request):
+    """Upload a file into distributed, deduplicated storage (see app.file_put)."""
+    if node.is_internal_name(request.path_params["filename"]):
+        return JSONResponse({"error": "Names starting with '.' or '_' are reserved"}, status_code=400)
+    filename = secure_filename(request.path_params["filename"])
+    if not filename:
+        return JSONResponse({"error": "Invalid filename"}, status_code=400)
+    log_info("PUT /files/%s from %s", filename, request.client.host)
+
+    digests: List[str] = []
+    whole = hashlib.sha256()
+    size = 0
+    pending = deque()  # (digest, required acks, task) in upload order
+    counts = {"stored": 0, "exists": 0}
+    failed: List[str] = []
+    seen = set()
+
+    async def settle(item) -> None:
+        digest, required, task = item
+        results = await task
+        if sum(1 for r in results if r is not None) < required:
+            failed.append(digest)
+        counts["stored" if "stored" in results else "exists"] += 1
+
+    async for data in _body_chunks(request, node.FILE_CHUNK_SIZE):
+        digest = await run_blocking(_hash_chunk, whole, data)
+        digests.append(digest)
+        size += len(data)
+        if digest in seen:
+            counts["exists"] += 1
+            continue
+        seen.add(digest)
+        replicas = node.find_replica_nodes(digest)
+        required, _ = node.quorum_sizes(replicas)
+        task = asyncio.gather(*(store_chunk_on(url, digest, data) for url in replicas))
+        pending.append((digest, required, task))
+        if len(pending) >= node.FILE_TRANSFER_WINDOW:
+            await settle(pending.popleft())
+    while pending:
+        await settle(pending.popleft())
+
+    if failed:
+        log_error("Upload of %s failed: %d chunks below write quorum", filename, len(failed))
+        return JSONResponse({"error": "Some chunks could not be stored", "failed_chunks": failed}, status_code=503)
+
+    manifest = {
+        "filename": filename,
+        "size": size,
+        "chunk_size": node.FILE_CHUNK_SIZE,
+        "chunks": digests,
+        "sha256": whole.hexdigest(),
+    }
+    acks, replicas, _ = await quorum_write(node.manifest_key(filename), manifest)
+    w, _ = node.quorum_sizes(replicas)
+    if acks < w:
+        return JSONResponse({"error": "Manifest write quorum not reached", "acks": acks, "required": w}, status_code=503)
+
+    log_info("Distributed file stored: %s (%d bytes, %d chunks, %d deduplicated)",
+             filename, size, len(digests), counts["exists"])
+    return JSONResponse(
+        {
+            "status": "ok",
+            "filename": filename,
+            "size": size,
+            "sha256": manifest["sha256"],
+            "chunks": len(digests),
+            "new_chunks": counts["stored"],
+            "deduplicated_chunks": counts["exists"],
+            "node": SELF_URL,
+        }
+    )
+
+
+async def file_get(request: Request):
+    """Download a distributed file, fetching its chunks from several nodes in parallel."""
+    if node.is_internal_name(request.path_params["filename"]):
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    filename = secure_filename(request.path_params["filename"])
+    log_info("GET /files/%s from %s", filename, request.client.host)
+    manifest = await load_manifest(filename)
+    if manifest is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    return await distributed_file_response(request, manifest)
+
+
+async def file_manifest(request: Request):
+    """Return a distributed file's manifest, with the nodes holding each chunk."""
+    if node.is_internal_name(request.path_params["filename"]):
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    manifest = await load_manifest(secure_filename(request.path_params["filename"]))
+    if manifest is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    return JSONResponse(
+        {
+            **manifest,
+            "placement": {digest: node.find_replica_nodes(digest) for digest in dict.fromkeys(manifest["chunks"])},
+        }
+    )
+
+
+class RingVersionMiddleware:
+    """Send X-Ring-Version on every response, like the Flask mode."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-ring-version", node.RING_VERSION.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_header)
+
+
+class RequestMetricsMiddleware:
+    """Record per-route request counts and latency in the node's /metrics registry."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                # The router stores the matched endpoint in the scope; label by its path template.
+                route = ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+                node.http_latency.observe(time.perf_counter() - start, scope["method"], route)
+                node.http_requests.inc(scope["method"], route, message["status"])
+            await send(message)
+
+        await self.app(scope, receive, send_and_record)
+
+
+async def get_metrics(request: Request):
+    """Prometheus-style metrics for this node."""
+    return Response(node.metrics.render(), headers={"Content-Type": node.METRICS_CONTENT_TYPE})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    """Open the shared peer client on startup and close it on shutdown."""
+    global client
+    limits = httpx.Limits(
+        max_connections=ASYNC_MAX_CONNECTIONS,
+        max_keepalive_connections=ASYNC_MAX_CONNECTIONS,
+    )
+    timeout = httpx.Timeout(node.FORWARD_READ_TIMEOUT, connect=node.FORWARD_CONNECT_TIMEOUT)
+    client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    yield
+    await client.aclose()
+
+
+routes = [
+    Route("/health", health, methods=["GET"]),
+    Route("/metrics", get_metrics, methods=["GET"]),
+    Route("/peers", get_peers, methods=["GET"]),
+    Route("/upload", upload_file, methods=["POST"]),
+    Route("/upload/{filename}", upload_stream, methods=["PUT"]),
+    Route("/upload/{filename}", upload_offset, methods=["HEAD"]),
+    Route("/download/{filename:path}", download_file, methods=["GET"]),
+    Route("/persistence", persistence_stats, methods=["GET"]),
+    Route("/persistence/snapshot", persistence_snapshot, methods=["POST"]),
+    Route("/engine-stats", engine_stats, methods=["GET"]),
+    Route("/pool-stats", pool_stats, methods=["GET"]),
+    Route("/cache-stats", cache_stats, methods=["GET"]),
+    Route("/kv", kv_put, methods=["POST"]),
+    Route("/kv/batch", kv_batch_put, methods=["POST"]),
+    Route("/kv/batch/get", kv_batch_get, methods=["POST"]),
+    Route("/kv/cache/invalidate", kv_cache_invalidate, methods=["POST"]),
+    Route("/kv/replica", kv_replica_put, methods=["POST"]),
+    Route("/kv/replica/batch", kv_replica_batch_put, methods=["POST"]),
+    Route("/kv/replica/batch/get", kv_replica_batch_get, methods=["POST"]),
+    Route("/kv/replica/{key}", kv_replica_get, methods=["GET"]),
+    Route("/kv/{key}", kv_get, methods=["GET"]),
+    Route("/chunks/{digest}", chunk_put, methods=["PUT"]),
+    Route("/chunks/{digest}", chunk_get, methods=["GET", "HEAD"]),
+    Route("/files/{filename}", file_put, methods=["PUT"]),
+    Route("/files/{filename}", file_get, methods=["GET"]),
+    Route("/files/{filename}/manifest", file_manifest, methods=["GET"]),
+    Route("/membership", get_membership, methods=["GET"]),
+    Route("/membership", post_membership, methods=["POST"]),
+]
+ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(RequestMetricsMiddleware), Middleware(RingVersionMiddleware)],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", "5000"))
+    log_info("Starting async DHT node at %s on port %s", SELF_URL, port)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        limit_concurrency=ASYNC_MAX_CONCURRENCY,
+        access_log=False,
+    )
@@ -0,0 +1,397 @@
+'''
+Load generator and benchmark harness for the DHT cluster.
+
+Starts N nodes (app.py or async_app.py) as local processes on consecutive
+ports, each with its own storage directory, preloads a key set and then
+drives a read/write mix against the cluster:
+
+- keys follow a uniform or Zipfian distribution (hot keys are spread over
+  the ring by shuffling the ranks with the run's seed);
+- load is closed-loop (--concurrency workers, each waiting for its reply) or
+  open-loop (--rate requests per second with Poisson arrivals). In open-loop
+  mode latency is measured from each request's scheduled start, so a slow
+  cluster shows up as queueing delay instead of silently lowering the load;
+- requests go to a random node (--routing entry, the node forwards to the
+  key's replicas) or straight to the key's owner (--routing direct, as
+  dht_client.DHTClient does).
+
+Reported per operation: throughput, p50/p99/p999/max latency, errors, and the
+forward-hop ratio (share of requests whose entry node was not one of the
+key's replicas, so every replica access was a network hop). Results are
+written as JSON; --compare flags throughput/p99 regressions against an
+earlier result file and exits with status 1.
+
+Usage:
+    python dht_bench.py --nodes 3 --duration 30 --distribution zipf --read-ratio 0.9 --out results.json
+    python dht_bench.py --nodes 3 --rate 2000 --compare results.json
+    python dht_bench.py --targets http://localhost:5001,http://localhost:5002 --duration 10
+
+Every run with the same arguments and --seed issues the same key and
+operation sequence.
+
+Citation(s):
+1) Cooper, B. F., et al. (2010). Benchmarking Cloud Serving Systems with YCSB. Proceedings of the 1st ACM Symposium on Cloud Computing. Retrieved from https://dl.acm.org/doi/10.1145/1807128.1807152
+2) Tene, G. (2015). How NOT to Measure Latency. Retrieved from https://www.infoq.com/presentations/latency-response-time/
+'''
+
+import argparse
+import bisect # Zipfian sampling from the cumulative weights.
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading # per-thread HTTP sessions, shared op stream and recorder.
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from dht_client import DHTClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Workload
+class KeyChooser:
+    """Picks key indexes 0..count-1 uniformly or with Zipf exponent `s`."""
+
+    def __init__(self, count: int, distribution: str, s: float, rng: random.Random):
+        self.count = count
+        self.distribution = distribution
+        self.rng = rng
+        if distribution == "zipf":
+            total = 0.0
+            self.cdf: List[float] = []
+            for rank in range(1, count + 1):
+                total += 1.0 / rank ** s
+                self.cdf.append(total)
+            self.ranks = list(range(count))
+            rng.shuffle(self.ranks) # rank 0 (the hottest key) lands on a random key
+        elif distribution != "uniform":
+            raise ValueError(f"Unknown distribution: {distribution}")
+
+    def next(self) -> int:
+        if self.distribution == "uniform":
+            return self.rng.randrange(self.count)
+        rank = bisect.bisect_left(self.cdf, self.rng.random() * self.cdf[-1])
+        return self.ranks[min(rank, self.count - 1)]
+
+
+class OpStream:
+    """Deterministic sequence of (op, key, node index) drawn from one seeded RNG."""
+
+    def __init__(self, keys: int, distribution: str, zipf_s: float, read_ratio: float, nodes: int, seed: int):
+        self.rng = random.Random(seed)
+        self.chooser = KeyChooser(keys, distribution, zipf_s, self.rng)
+        self.read_ratio = read_ratio
+        self.nodes = nodes
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            op = "get" if self.rng.random() < self.read_ratio else "put"
+            return op, f"key{self.chooser.next()}", self.rng.randrange(self.nodes)
+
+
+# Results
+class Recorder:
+    """Latency samples and counters per operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {"get": [], "put": []}
+        self.errors: Dict[str, int] = {"get": 0, "put": 0}
+        self.forwarded = 0
+        self.routed = 0
+        self.cached = 0
+
+    def record(self, op: str, seconds: float, ok: bool, forwarded: Optional[bool] = None, cached: bool = False):
+        with self._lock:
+            if not ok:
+                self.errors[op] += 1
+                return
+            self.latencies[op].append(seconds)
+            if forwarded is not None:
+                self.routed += 1
+                self.forwarded += forwarded
+            self.cached += cached
+
+    @staticmethod
+    def summary(samples: List[float], errors: int, elapsed: float) -> Dict:
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3) if ordered else None
+        return {
+            "count": len(ordered),
+            "errors": errors,
+            "throughput": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+            "p50_ms": pick(0.5),
+            "p99_ms": pick(0.99),
+            "p999_ms": pick(0.999),
+            "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+        }
+
+    def report(self, elapsed: float) -> Dict:
+        with self._lock:
+            ops = {op: self.summary(samples, self.errors[op], elapsed) for op, samples in self.latencies.items()}
+            ops["all"] = self.summary(self.latencies["get"] + self.latencies["put"], sum(self.errors.values()), elapsed)
+            return {
+                "elapsed_s": round(elapsed, 3),
+                "ops": ops,
+                "forward_hop_ratio": round(self.forwarded / self.routed, 4) if self.routed else None,
+                "cached_reads": self.cached,
+            }
+
+
+# Cluster
+class LocalCluster:
+    """N DHT nodes on 127.0.0.1:base_port.. as child processes, removed again on exit."""
+
+    def __init__(self, nodes: int, base_port: int, app: str = "app.py", env: Optional[Dict[str, str]] = None,
+                 startup_timeout: float = 30.0):
+        self.urls = [f"http://127.0.0.1:{base_port + i}" for i in range(nodes)]
+        self.app = app
+        self.env = env or {}
+        self.startup_timeout = startup_timeout
+        self.procs: List[subprocess.Popen] = []
+        self.workdir = ""
+
+    def __enter__(self) -> "LocalCluster":
+        self.workdir = tempfile.mkdtemp(prefix="dht-bench-")
+        try:
+            for i, url in enumerate(self.urls):
+                env = {
+                    **os.environ,
+                    "PORT": url.rsplit(":", 1)[1],
+                    "SELF_URL": url,
+                    "PEERS": ",".join(self.urls),
+                    "STORAGE_DIR": os.path.join(self.workdir, f"node{i + 1}"),
+                    "LOG_LEVEL": "WARNING",
+                    **self.env,
+                }
+                log = open(os.path.join(self.workdir, f"node{i + 1}.log"), "wb")
+                self.procs.append(subprocess.Popen([sys.executable, os.path.join(HERE, self.app)], env=env,
+                                                   stdout=log, stderr=subprocess.STDOUT, cwd=HERE))
+                log.close()
+            self.wait_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def wait_ready(self) -> None:
+        deadline = time.monotonic() + self.startup_timeout
+        for i, url in enumerate(self.urls):
+            while True:
+                if self.procs[i].poll() is not None:
+                    raise RuntimeError(f"Node {url} exited; see {self.workdir}/node{i + 1}.log")
+                try:
+                    if requests.get(url + "/health", timeout=1).status_code == 200:
+                        break
+                except requests.RequestException:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Node {url} did not start within {self.startup_timeout}s")
+                time.sleep(0.2)
+
+    def __exit__(self, *exc) -> None:
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# Load generation
+class Benchmark:
+    def __init__(self, urls: List[str], args):
+        self.urls = urls
+        self.args = args
+        self.value = "x" * args.value_size
+        self.timeout = (1.0, args.timeout)
+        self._local = threading.local()
+        self.router = DHTClient(urls) if args.routing == "direct" else None
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=4, max_retries=0)
+            session.mount("http://", adapter)
+        return session
+
+    def preload(self) -> None:
+        """Write every key once through /kv/batch so reads find values."""
+        batch = 1000
+        for start in range(0, self.args.keys, batch):
+            items = {f"key{i}": self.value for i in range(start, min(start + batch, self.args.keys))}
+            url = self.urls[(start // batch) % len(self.urls)]
+            resp = self.session().post(url + "/kv/batch", json={"items": items}, timeout=(1.0, 60.0))
+            resp.raise_for_status()
+
+    def execute(self, op: str, key: str, node: int, started: float, recorder: Optional[Recorder]) -> None:
+        url = self.router.owner_of(key) if self.router is not None else self.urls[node]
+        try:
+            if op == "get":
+                resp = self.session().get(f"{url}/kv/{key}", timeout=self.timeout)
+            else:
+                resp = self.session().post(url + "/kv", json={"key": key, "value": self.value}, timeout=self.timeout)
+            ok = resp.status_code in (200, 404)
+            body = resp.json() if resp.status_code == 200 else {}
+        except (requests.RequestException, ValueError):
+            ok, body = False, {}
+        elapsed = time.perf_counter() - started
+        if recorder is None:
+            return
+        replicas = body.get("replicas")
+        forwarded = url not in replicas if replicas else None
+        recorder.record(op, elapsed, ok, forwarded, bool(body.get("cached")))
+
+    def run_closed(self, stream: OpStream, duration: float, recorder: Optional[Recorder]) -> None:
+        """`concurrency` workers, each sending its next request once the previous one returned."""
+        end = time.perf_counter() + duration
+
+        def worker():
+            while time.perf_counter() < end:
+                op, key, node = stream.next()
+                self.execute(op, key, node, time.perf_counter(), recorder)
+
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for _ in range(self.args.concurrency):
+                pool.submit(worker)
+
+    def run_open(self, stream: OpStream, duration: float, recorder: Optional[Recorder]) -> Dict:
+        """
+        Poisson arrivals at `rate` per second, independent of how fast replies come back.
+        Latency counts from the scheduled arrival, including time spent waiting for a free worker.
+        """
+        arrivals = random.Random(self.args.seed + 1)
+        start = time.perf_counter()
+        next_at = start
+        sent = 0
+        with ThreadPoolExecutor(max_workers=self.args.max_inflight) as pool:
+            while next_at < start + duration:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                op, key, node = stream.next()
+                pool.submit(self.execute, op, key, node, next_at, recorder)
+                sent += 1
+                next_at += arrivals.expovariate(self.args.rate)
+        return {"offered_rate": self.args.rate, "sent": sent}
+
+    def run(self) -> Dict:
+        args = self.args
+        if args.keys and not args.no_preload:
+            self.preload()
+        stream = OpStream(args.keys, args.distribution, args.zipf_s, args.read_ratio, len(self.urls), args.seed)
+        load = self.run_open if args.rate else self.run_closed
+        if args.warmup:
+            load(stream, args.warmup, None)
+        recorder = Recorder()
+        start = time.perf_counter()
+        extra = load(stream, args.duration, recorder) or {}
+        result = recorder.report(time.perf_counter() - start)
+        result.update(extra)
+        return result
+
+
+# Regression check
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Throughput drops and p99 increases beyond `tolerance` (0.1 = 10%) against a baseline result."""
+    regressions = []
+    for op, now in current["results"]["ops"].items():
+        before = baseline.get("results", {}).get("ops", {}).get(op)
+        if not before or not before.get("count") or not now.get("count"):
+            continue
+        if now["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{op}: throughput {before['throughput']} -> {now['throughput']} ops/s")
+        if before["p99_ms"] and now["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{op}: p99 {before['p99_ms']} -> {now['p99_ms']} ms")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a local DHT cluster")
+    parser.add_argument("--nodes", type=int, default=3, help="Local nodes to start")
+    parser.add_argument("--targets", help="Comma-separated URLs of a running cluster (no nodes are started)")
+    parser.add_argument("--app", default="app.py", choices=["app.py", "async_app.py"])
+    parser.add_argument("--base-port", type=int, default=6001)
+    parser.add_argument("--node-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for every node, e.g. KV_CACHE_SIZE=10000 (repeatable)")
+    parser.add_argument("--keys", type=int, default=10000, help="Key space size")
+    parser.add_argument("--no-preload", action="store_true", help="Skip writing every key before the run")
+    parser.add_argument("--value-size", type=int, default=100, help="Value length in bytes")
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="uniform")
+    parser.add_argument("--zipf-s", type=float, default=0.99, help="Zipf exponent")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="Share of GETs (the rest are PUTs)")
+    parser.add_argument("--routing", choices=["entry", "direct"], default="entry",
+                        help="entry: random node forwards; direct: send to the key's owner")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop workers")
+    parser.add_argument("--rate", type=float, default=0.0, help="Open-loop arrival rate in requests/s (0 = closed loop)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Open-loop worker threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Request read timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Write the result JSON here")
+    parser.add_argument("--compare", help="Baseline result JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    node_env = dict(item.split("=", 1) for item in args.node_env)
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare", "tolerance")}
+    config["node_env"] = node_env
+
+    def bench(urls):
+        print(f"Benchmarking {len(urls)} nodes for {args.duration}s "
+              f"({'open loop at %g/s' % args.rate if args.rate else 'closed loop x%d' % args.concurrency}, "
+              f"{args.distribution} keys, {args.read_ratio:.0%} reads)", flush=True)
+        return Benchmark(urls, args).run()
+
+    if args.targets:
+        results = bench([u.strip().rstrip("/") for u in args.targets.split(",") if u.strip()])
+    else:
+        with LocalCluster(args.nodes, args.base_port, args.app, node_env) as cluster:
+            results = bench(cluster.urls)
+
+    report = {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config,
+              "results": results}
+    for op, s in results["ops"].items():
+        print(f"{op:>4}: {s['count']} ok, {s['errors']} errors, {s['throughput']} ops/s, "
+              f"p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms, p999 {s['p999_ms']} ms")
+    print(f"forward-hop ratio: {results['forward_hop_ratio']}, cached reads: {results['cached_reads']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
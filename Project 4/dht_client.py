@@ -0,0 +1,292 @@
+'''
+Smart client for the DHT.
+
+Instead of sending every request to one node and letting it forward the
+request to the key's owner, the client downloads the ring from /peers once,
+caches it, and computes the owner of each key itself (same SHA-1 virtual
+node ring as app.py). Requests then go straight to the owner, saving the
+forwarding hop.
+
+Every node answers with an X-Ring-Version header; when it differs from the
+cached ring's version (nodes joined or left) the client refreshes its ring.
+If an owner cannot be reached the ring is refreshed as well, the request is
+retried on the key's next replica, and the node is skipped for a short
+cooldown.
+
+Each node gets its own keep-alive connection pool.
+
+Usage:
+    from dht_client import DHTClient
+
+    client = DHTClient(["http://localhost:5001"])
+    client.put("user:42", {"name": "Ada"})
+    client.get("user:42")
+    client.put_many({"a": 1, "b": 2})
+    client.get_many(["a", "b"])
+
+Citation(s):
+1) Apache Software Foundation. (n.d.). Client drivers – token-aware routing. Apache Cassandra Documentation. Retrieved from https://cassandra.apache.org/doc/latest/cassandra/architecture/dynamo.html
+2) Python Software Foundation. (n.d.). Requests – Session objects. Retrieved from https://requests.readthedocs.io/en/latest/user/advanced/#session-objects
+'''
+
+import hashlib # SHA-1 ring positions, identical to app.py.
+import bisect # binary search over the cached ring tokens.
+import logging
+import threading # guards the cached ring and the per-node sessions.
+import time # cooldown for nodes that just failed.
+from concurrent.futures import ThreadPoolExecutor # parallel per-node batch requests.
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("DHT_Client")
+
+RING_VERSION_HEADER = "X-Ring-Version"
+
+
+class DHTError(Exception):
+    """Raised when no replica of a key could serve a request."""
+
+
+def sha1_to_int(value: str) -> int:
+    """Return SHA-1 hash of a string as an integer (same as app.sha1_to_int)."""
+    return int(hashlib.sha1(value.encode("utf-8")).hexdigest(), 16)
+
+
+class DHTClient:
+    """
+    Client that routes each request directly to the node owning the key.
+
+    Args:
+        seeds: URLs of one or more nodes used to download the ring.
+        pool_size: keep-alive connections kept per node.
+        connect_timeout / read_timeout: per-request timeouts in seconds.
+        workers: threads used to send batch sub-requests in parallel.
+        down_cooldown: seconds a node that failed is skipped in favour of
+            the next replica before it is tried again.
+    """
+
+    def __init__(
+        self,
+        seeds: List[str],
+        pool_size: int = 10,
+        connect_timeout: float = 1.0,
+        read_timeout: float = 5.0,
+        workers: int = 16,
+        down_cooldown: float = 5.0,
+    ):
+        if not seeds:
+            raise ValueError("At least one seed node URL is required")
+        self.seeds = [s.rstrip("/") for s in seeds]
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, requests.Session] = {}
+        self.down_cooldown = down_cooldown
+        self._down_until: Dict[str, float] = {}
+
+        self.peers: List[str] = []
+        self.replication_factor = 1
+        self.ring_version: Optional[str] = None
+        self._ring_urls: List[str] = []
+        self._ring_tokens: List[int] = []
+
+        self._stats = {"requests": 0, "ring_refreshes": 0, "stale_responses": 0, "fallbacks": 0}
+        self.refresh_ring()
+
+    # Ring cache
+    def refresh_ring(self) -> None:
+        """Download the ring from the first reachable seed or known peer."""
+        last_error: Optional[Exception] = None
+        for url in list(dict.fromkeys(self.peers + self.seeds)):
+            try:
+                resp = self._session(url).get(url + "/peers", timeout=self.timeout)
+                resp.raise_for_status()
+                info = resp.json()
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("Could not load ring from %s: %s", url, e)
+                last_error = e
+                continue
+            ring = sorted(info["ring"], key=lambda n: n["id"])
+            with self._lock:
+                self.peers = list(info["peers"])
+                self.replication_factor = info.get("replication", {}).get("n", 1)
+                self.ring_version = info.get("ring_version")
+                self._ring_urls = [n["url"] for n in ring]
+                self._ring_tokens = [int(n["id"]) for n in ring]
+                self._stats["ring_refreshes"] += 1
+            logger.info("Loaded ring %s from %s: %s nodes, %s vnodes", self.ring_version, url, len(self.peers), len(ring))
+            return
+        raise DHTError(f"No node reachable to load the ring: {last_error}")
+
+    def replicas_for(self, key: str) -> List[str]:
+        """Owner of a key followed by its replica nodes, in ring order (as app.find_replica_nodes)."""
+        with self._lock:
+            urls, tokens = self._ring_urls, self._ring_tokens
+            n = min(self.replication_factor, len(self.peers))
+        idx = bisect.bisect_left(tokens, sha1_to_int(key))
+        replicas: List[str] = []
+        for i in range(len(urls)):
+            url = urls[(idx + i) % len(urls)]
+            if url not in replicas:
+                replicas.append(url)
+                if len(replicas) == n:
+                    break
+        return replicas
+
+    def owner_of(self, key: str) -> str:
+        """URL of the node responsible for a key."""
+        return self.replicas_for(key)[0]
+
+    def _route(self, key: str) -> List[str]:
+        """Replicas of a key in the order to try them: nodes that failed recently go last."""
+        now = time.monotonic()
+        return sorted(self.replicas_for(key), key=lambda url: self._down_until.get(url, 0.0) > now)
+
+    def _mark_down(self, node_url: str) -> None:
+        """Skip a node for down_cooldown seconds; refresh the ring the first time it fails."""
+        now = time.monotonic()
+        with self._lock:
+            already_down = self._down_until.get(node_url, 0.0) > now
+            self._down_until[node_url] = now + self.down_cooldown
+            self._stats["fallbacks"] += 1
+        if not already_down:
+            try:
+                self.refresh_ring()
+            except DHTError:
+                pass
+
+    # HTTP
+    def _session(self, node_url: str) -> requests.Session:
+        """Return the keep-alive session (connection pool) for one node."""
+        with self._lock:
+            session = self._sessions.get(node_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[node_url] = session
+        return session
+
+    def _send(self, node_url: str, method: str, path: str, **kwargs) -> requests.Response:
+        """Send one request and refresh the ring if the node reports a newer one."""
+        with self._lock:
+            self._stats["requests"] += 1
+        resp = self._session(node_url).request(method, node_url + path, timeout=self.timeout, **kwargs)
+        version = resp.headers.get(RING_VERSION_HEADER)
+        if version and version != self.ring_version:
+            with self._lock:
+                self._stats["stale_responses"] += 1
+            logger.info("Ring changed (%s -> %s), refreshing", self.ring_version, version)
+            self.refresh_ring()
+        return resp
+
+    def _send_to_replicas(self, key: str, method: str, path: str, **kwargs) -> requests.Response:
+        """Send to the key's owner; on connection failure refresh the ring and try the next replica."""
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        while True:
+            candidates = [url for url in self._route(key) if url not in tried]
+            if not candidates:
+                raise DHTError(f"No replica of '{key}' reachable (tried {tried}): {last_error}")
+            node_url = candidates[0]
+            try:
+                return self._send(node_url, method, path, **kwargs)
+            except requests.RequestException as e:
+                logger.warning("Node %s failed for '%s': %s", node_url, key, e)
+                last_error = e
+                tried.append(node_url)
+                self._mark_down(node_url)
+
+    # Key-Value API
+    def put(self, key: str, value) -> Dict:
+        """Store a key on its owner. Returns the node's JSON response."""
+        resp = self._send_to_replicas(key, "POST", "/kv", json={"key": key, "value": value})
+        if resp.status_code != 200:
+            raise DHTError(f"PUT '{key}' failed with status {resp.status_code}: {resp.text}")
+        return resp.json()
+
+    def get(self, key: str, default=None):
+        """Return the value of a key, or `default` if it does not exist."""
+        resp = self._send_to_replicas(key, "GET", f"/kv/{key}")
+        if resp.status_code == 404:
+            return default
+        if resp.status_code != 200:
+            raise DHTError(f"GET '{key}' failed with status {resp.status_code}: {resp.text}")
+        return resp.json()["value"]
+
+    def _batch(self, keys: List[str], path: str, build_body) -> Dict[str, Dict]:
+        """Group keys by owner and send one batch request per owner in parallel."""
+        groups: Dict[str, List[str]] = {}
+        for key in keys:
+            groups.setdefault(self._route(key)[0], []).append(key)
+
+        def send_group(node_url: str, group_keys: List[str]) -> Dict[str, Dict]:
+            try:
+                resp = self._send(node_url, "POST", path, json=build_body(group_keys))
+                if resp.status_code == 200:
+                    return resp.json()["results"]
+                logger.warning("Batch to %s failed with status %s", node_url, resp.status_code)
+            except requests.RequestException as e:
+                logger.warning("Batch to %s failed: %s", node_url, e)
+                self._mark_down(node_url)
+            except (ValueError, KeyError) as e:
+                logger.warning("Batch to %s returned an invalid response: %s", node_url, e)
+            # Fall back to the key-by-key path, which retries on other replicas.
+            return {key: None for key in group_keys}
+
+        futures = [self._executor.submit(send_group, url, group_keys) for url, group_keys in groups.items()]
+        results: Dict[str, Dict] = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def put_many(self, items: Dict) -> Dict[str, Dict]:
+        """Store many keys, one /kv/batch request per owner. Returns per-key results."""
+        results = self._batch(list(items), "/kv/batch", lambda keys: {"items": {k: items[k] for k in keys}})
+        for key, result in results.items():
+            if result is None:
+                try:
+                    body = self.put(key, items[key])
+                    results[key] = {"status": "stored", "acks": body.get("acks")}
+                except DHTError as e:
+                    results[key] = {"status": "error", "error": str(e)}
+        return results
+
+    def get_many(self, keys: List[str]) -> Dict:
+        """Return {key: value} for the keys that exist, one /kv/batch/get request per owner."""
+        keys = list(dict.fromkeys(keys))
+        results = self._batch(keys, "/kv/batch/get", lambda group_keys: {"keys": group_keys})
+        values = {}
+        for key in keys:
+            result = results.get(key)
+            if result is None or result.get("status") == "error":
+                missing = object()
+                value = self.get(key, missing)
+                if value is not missing:
+                    values[key] = value
+            elif result["status"] == "found":
+                values[key] = result["value"]
+        return values
+
+    def stats(self) -> Dict:
+        """Request and routing counters."""
+        with self._lock:
+            return dict(self._stats, ring_version=self.ring_version, nodes=len(self.peers))
+
+    def close(self) -> None:
+        """Close all node connection pools."""
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,221 @@
+'''
+Hot-key read cache for the DHT node, and the leases that keep it fresh.
+
+A node that coordinates a GET for a key it does not replicate keeps the
+result in a ReadCache, so a popular key stops costing a round trip to its
+owner on every read. The replica that served the read grants the caching
+node a lease on the key (LeaseTable). When the replica later applies a
+write to that key it revokes the lease by telling the holder the new
+version, and the holder drops its entry.
+
+Entries are only trusted for the lease length (the TTL): a revocation lost
+because the replica or the network failed can keep a stale value for at
+most that long. The replica waits briefly for its revocations before it
+acknowledges the write; a holder that did not confirm keeps its lease on
+record, and no new lease on that key is granted until that lease ends.
+
+An invalidation leaves a fence (the new version, no value) in the cache, so
+a read that was already in flight when the write happened cannot put the
+older value back.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class ReadCache:
+    """
+    Bounded LRU cache of remote read responses with per-entry expiry.
+
+    Each entry is (expires, version, response); a fence is an entry whose
+    response is None. Fences take a slot like any entry and expire with it.
+    """
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response for a key, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, response: Dict, lease: float) -> bool:
+        """
+        Cache a response for the lease the replica granted (capped at the TTL).
+
+        Returns False if a newer version (or a fence) is already cached.
+        """
+        if not self.enabled or lease <= 0:
+            return False
+        version = response.get("version", 0)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] > version:
+                return False
+            self._store(key, (now + min(lease, self.ttl), version, response))
+        return True
+
+    def invalidate(self, key: str, version: int, fence: bool = True) -> None:
+        """
+        Drop a key because a write with `version` was applied to it.
+
+        With `fence`, the version is remembered so older responses still in
+        flight are not cached; without it, only an existing entry is dropped.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] > version:
+                return  # an even newer write is already fenced
+            if entry is not None and entry[2] is not None:
+                self.invalidations += 1
+            if fence:
+                self._store(key, (now + self.ttl, version, None))
+            elif entry is not None:
+                del self._entries[key]
+
+    def _store(self, key: str, entry: tuple) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class LeaseTable:
+    """
+    Leases this node granted on its keys: key -> {holder URL: expiry}.
+
+    At most `max_keys` keys carry leases; once full, expired leases are
+    purged and, if that frees nothing, no new lease is granted (the reader
+    then simply does not cache). Keys whose revocation failed are blocked
+    (key -> until) and get no new lease until then.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._leases: Dict[str, Dict[str, float]] = {}
+        self._blocked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.refused = 0
+        self.revoked = 0
+        self.revoke_failures = 0
+
+    def grant(self, key: str, holder: str, seconds: float) -> float:
+        """Grant `holder` a lease on `key`. Returns the lease length, 0 if refused."""
+        if seconds <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            blocked = self._blocked.get(key)
+            if blocked is not None:
+                if blocked > now:
+                    self.refused += 1
+                    return 0.0
+                del self._blocked[key]
+            holders = self._leases.get(key)
+            if holders is None:
+                if len(self._leases) >= self.max_keys:
+                    self._purge(now)
+                if len(self._leases) >= self.max_keys:
+                    self.refused += 1
+                    return 0.0
+                holders = self._leases[key] = {}
+            holders[holder] = now + seconds
+            self.granted += 1
+        return seconds
+
+    def revoke(self, key: str) -> Dict[str, float]:
+        """Remove the leases on a key and return the holders whose lease was still valid, with its expiry."""
+        with self._lock:
+            holders = self._leases.pop(key, None)
+            if not holders:
+                return {}
+            now = time.monotonic()
+            live = {holder: expires for holder, expires in holders.items() if expires > now}
+            self.revoked += len(live)
+        return live
+
+    def revoke_failed(self, key: str, holder: str, expires: float) -> None:
+        """
+        A revocation sent to `holder` was not confirmed. Keep its lease, so
+        the next write to the key tries again, and grant no new lease on the
+        key until it expires.
+        """
+        with self._lock:
+            holders = self._leases.setdefault(key, {})
+            holders[holder] = max(holders.get(holder, 0.0), expires)
+            self._blocked[key] = max(self._blocked.get(key, 0.0), expires)
+            self.revoke_failures += 1
+
+    def _purge(self, now: float) -> None:
+        for key in list(self._leases):
+            holders = {h: exp for h, exp in self._leases[key].items() if exp > now}
+            if holders:
+                self._leases[key] = holders
+            else:
+                del self._leases[key]
+        for key in [key for key, until in self._blocked.items() if until <= now]:
+            del self._blocked[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "leased_keys": len(self._leases),
+                "max_keys": self.max_keys,
+                "granted": self.granted,
+                "refused": self.refused,
+                "revoked": self.revoked,
+                "revoke_failures": self.revoke_failures,
+                "blocked_keys": len(self._blocked),
+            }
@@ -0,0 +1,494 @@
+'''
+Storage engines behind the DHT node's key-value store.
+
+An engine is a mutable mapping of key -> value (any JSON value accepted by
+/kv) with a `versions` mapping of key -> last-write-wins version next to
+it, so the rest of the node (and kv_persistence) can use it like the dict
+it replaces. Every engine also provides:
+
+    lookup(key)  -> (value, version), or None if the key is missing
+    stats()      -> engine name, key count and memory use
+
+Engines (KV_ENGINE):
+    dict    a plain dict plus a versions dict (default, fastest lookups)
+    arena   keys, values and versions packed into one append-only byte
+            arena, with an open-addressing hash index held in two flat
+            arrays; no per-key Python objects, so it uses a fraction of the
+            dict's memory per key, at the cost of slower lookups
+    mmap    the arena engine with the arena in a memory-mapped file, so the
+            data lives in the OS page cache instead of the Python heap
+
+Arena record layout (little-endian):
+    key length (u16) | value length (u32) | version (u64) | key | value
+String values are stored as raw UTF-8, anything else JSON-encoded (flagged
+by the top bit of the value length). An overwritten or deleted record
+becomes garbage; the arena is compacted once garbage makes up half of it.
+The mmap file is scratch space, recreated on every start: durability still
+comes from the write-ahead log.
+
+Run this file directly to compare memory per key and lookup speed:
+    python kv_engine.py --keys 1000000
+'''
+
+import os
+import json # values that are not strings are stored JSON-encoded.
+import mmap # file-backed arena for the mmap engine.
+import struct # packing record headers.
+import threading # engines are shared by request threads.
+from array import array # flat index arrays: 12 bytes per slot, no per-entry objects.
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+ENGINES = ("dict", "arena", "mmap")
+
+_JSON_FLAG = 1 << 31  # set in the value length when the value is JSON-encoded
+_MAX_KEY = 0xFFFF  # key bytes that fit the u16 length
+
+_REC = struct.Struct("<HIQ")  # key length, value length (| _JSON_FLAG), version
+_VERSION = struct.Struct("<Q")
+_VERSION_AT = 6  # offset of the version inside a record
+
+EMPTY = -1  # index slot never used
+DELETED = -2  # index slot whose key was deleted (probing continues past it)
+
+COMPACT_MIN_GARBAGE = 1 << 20  # don't compact for less than 1 MiB of garbage
+
+_MISSING = object()
+
+
+def _encode_value(value) -> Tuple[int, bytes]:
+    """Return (flags, bytes) for a value: raw UTF-8 for strings, JSON for anything else."""
+    if isinstance(value, str):
+        return 0, value.encode("utf-8")
+    return _JSON_FLAG, json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _hash(kb: bytes) -> int:
+    """32-bit hash of a key; the index stores it in 4 bytes per slot."""
+    return hash(kb) & 0xFFFFFFFF
+
+
+class DictEngine(dict):
+    """The original storage: a dict of values and a dict of versions."""
+
+    name = "dict"
+
+    def __init__(self):
+        super().__init__()
+        self.versions: Dict[str, int] = {}
+
+    def lookup(self, key: str) -> Optional[Tuple[object, int]]:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            return None
+        return value, self.versions.get(key, 0)
+
+    def records(self) -> List[Tuple[str, object, int]]:
+        """All (key, value, version) tuples."""
+        versions = self.versions
+        return [(key, value, versions.get(key, 0)) for key, value in self.items()]
+
+    def stats(self) -> Dict:
+        return {"engine": self.name, "keys": len(self)}
+
+    def close(self) -> None:
+        pass
+
+
+class BytesArena:
+    """Append-only arena in a bytearray (on the Python heap, but one object)."""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    @property
+    def used(self) -> int:
+        return len(self.buf)
+
+    def append(self, data: bytes) -> int:
+        offset = len(self.buf)
+        self.buf += data
+        return offset
+
+    def empty_like(self) -> "BytesArena":
+        return BytesArena()
+
+    def replace(self, other: "BytesArena") -> None:
+        """Take over the contents of `other` (used after compaction)."""
+        self.buf = other.buf
+
+    def close(self) -> None:
+        self.buf = bytearray()
+
+
+class MmapArena:
+    """Append-only arena in a memory-mapped file that doubles in size as it fills."""
+
+    def __init__(self, path: str, capacity: int = 64 << 20):
+        self.path = path
+        self.used = 0
+        self._file = open(path, "w+b")
+        self._file.truncate(capacity)
+        self.buf = mmap.mmap(self._file.fileno(), capacity)
+
+    def append(self, data: bytes) -> int:
+        offset = self.used
+        end = offset + len(data)
+        if end > len(self.buf):
+            self._grow(end)
+        self.buf[offset:end] = data
+        self.used = end
+        return offset
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.buf)
+        while capacity < needed:
+            capacity *= 2
+        self.buf.close()
+        self._file.truncate(capacity)
+        self.buf = mmap.mmap(self._file.fileno(), capacity)
+
+    def empty_like(self) -> "MmapArena":
+        return MmapArena(self.path + ".compact", max(len(self.buf) // 2, 1 << 20))
+
+    def replace(self, other: "MmapArena") -> None:
+        """Take over the contents (and file) of `other` (used after compaction)."""
+        self.buf.close()
+        self._file.close()
+        os.replace(other.path, self.path)
+        self._file, self.buf, self.used = other._file, other.buf, other.used
+
+    def close(self) -> None:
+        self.buf.close()
+        self._file.close()
+
+
+class ArenaEngine(MutableMapping):
+    """
+    Keys, values and versions packed into an arena, indexed by a hash table.
+
+    The index is open addressing with linear probing over two arrays: the
+    record offset of each slot and the key's 32-bit hash (compared before
+    the key bytes, so most probes never touch the arena). One lock guards
+    every operation, since a resize or compaction moves offsets.
+    """
+
+    name = "arena"
+
+    def __init__(self, arena=None, capacity: int = 1024, max_load: float = 0.7):
+        self._arena = arena if arena is not None else BytesArena()
+        size = 8
+        while size < capacity:
+            size <<= 1
+        self._offsets = array("q", [EMPTY]) * size
+        self._hashes = array("I", [0]) * size
+        self._mask = size - 1
+        self._len = 0
+        self._filled = 0  # live + deleted slots
+        self._garbage = 0  # arena bytes held by overwritten/deleted records
+        self._max_load = max_load
+        self._lock = threading.RLock()
+        self.versions = VersionView(self)
+
+    # Index
+    def _slot(self, kb: bytes, h: int) -> int:
+        """Return the slot holding the key, or ~slot (negative) of where to insert it."""
+        offsets, hashes, buf, mask = self._offsets, self._hashes, self._arena.buf, self._mask
+        i = h & mask
+        free = -1
+        while True:
+            off = offsets[i]
+            if off == EMPTY:
+                return ~(free if free >= 0 else i)
+            if off == DELETED:
+                if free < 0:
+                    free = i
+            elif hashes[i] == h:
+                klen = _REC.unpack_from(buf, off)[0]
+                start = off + _REC.size
+                if buf[start:start + klen] == kb:
+                    return i
+            i = (i + 1) & mask
+
+    def _resize(self) -> None:
+        """Rebuild the index, doubling it unless deleted slots were what filled it."""
+        size = self._mask + 1
+        if self._len * 2 > size * self._max_load:
+            size *= 2
+        offsets = array("q", [EMPTY]) * size
+        hashes = array("I", [0]) * size
+        mask = size - 1
+        for off, h in zip(self._offsets, self._hashes):
+            if off >= 0:
+                i = h & mask
+                while offsets[i] != EMPTY:
+                    i = (i + 1) & mask
+                offsets[i] = off
+                hashes[i] = h
+        self._offsets, self._hashes, self._mask = offsets, hashes, mask
+        self._filled = self._len
+
+    def _record_size(self, off: int) -> int:
+        klen, vlen, _ = _REC.unpack_from(self._arena.buf, off)
+        return _REC.size + klen + (vlen & ~_JSON_FLAG)
+
+    def _compact(self) -> None:
+        """Copy live records into a fresh arena; index slots keep their place."""
+        buf = self._arena.buf
+        new = self._arena.empty_like()
+        offsets = self._offsets
+        for i, off in enumerate(offsets):
+            if off >= 0:
+                offsets[i] = new.append(buf[off:off + self._record_size(off)])
+        self._arena.replace(new)
+        self._garbage = 0
+
+    def _read(self, off: int) -> Tuple[object, int]:
+        buf = self._arena.buf
+        klen, vlen, version = _REC.unpack_from(buf, off)
+        start = off + _REC.size + klen
+        if vlen & _JSON_FLAG:
+            return json.loads(buf[start:start + (vlen & ~_JSON_FLAG)]), version
+        return buf[start:start + vlen].decode("utf-8"), version
+
+    # Engine API
+    def put(self, key: str, value, version: Optional[int] = None) -> None:
+        """Store a value; keeps the key's current version if `version` is None."""
+        kb = key.encode("utf-8")
+        if len(kb) > _MAX_KEY:
+            raise ValueError(f"Key longer than {_MAX_KEY} bytes")
+        h = _hash(kb)
+        flags, vb = _encode_value(value)
+        with self._lock:
+            slot = self._slot(kb, h)
+            if slot >= 0:
+                old = self._offsets[slot]
+                if version is None:
+                    version = _VERSION.unpack_from(self._arena.buf, old + _VERSION_AT)[0]
+                self._garbage += self._record_size(old)
+            off = self._arena.append(_REC.pack(len(kb), len(vb) | flags, version or 0) + kb + vb)
+            if slot >= 0:
+                self._offsets[slot] = off
+            else:
+                slot = ~slot
+                if self._offsets[slot] == EMPTY:
+                    self._filled += 1
+                self._offsets[slot] = off
+                self._hashes[slot] = h
+                self._len += 1
+                if self._filled > self._max_load * (self._mask + 1):
+                    self._resize()
+            if self._garbage > COMPACT_MIN_GARBAGE and self._garbage * 2 > self._arena.used:
+                self._compact()
+
+    def lookup(self, key: str) -> Optional[Tuple[object, int]]:
+        kb = key.encode("utf-8")
+        with self._lock:
+            slot = self._slot(kb, _hash(kb))
+            if slot < 0:
+                return None
+            return self._read(self._offsets[slot])
+
+    def version_of(self, key: str) -> int:
+        kb = key.encode("utf-8")
+        with self._lock:
+            slot = self._slot(kb, _hash(kb))
+            if slot < 0:
+                raise KeyError(key)
+            return _VERSION.unpack_from(self._arena.buf, self._offsets[slot] + _VERSION_AT)[0]
+
+    def set_version(self, key: str, version: int) -> None:
+        """Overwrite a stored key's version in place."""
+        kb = key.encode("utf-8")
+        with self._lock:
+            slot = self._slot(kb, _hash(kb))
+            if slot < 0:
+                raise KeyError(key)
+            _VERSION.pack_into(self._arena.buf, self._offsets[slot] + _VERSION_AT, version)
+
+    def records(self) -> List[Tuple[str, object, int]]:
+        """All (key, value, version) tuples, read in one pass over the index."""
+        out = []
+        with self._lock:
+            buf = self._arena.buf
+            for off in self._offsets:
+                if off >= 0:
+                    klen = _REC.unpack_from(buf, off)[0]
+                    start = off + _REC.size
+                    value, version = self._read(off)
+                    out.append((bytes(buf[start:start + klen]).decode("utf-8"), value, version))
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            slots = self._mask + 1
+            index_bytes = slots * (self._offsets.itemsize + self._hashes.itemsize)
+            return {
+                "engine": self.name,
+                "keys": self._len,
+                "arena_bytes": self._arena.used,
+                "garbage_bytes": self._garbage,
+                "index_slots": slots,
+                "index_bytes": index_bytes,
+                "bytes_per_key": round((self._arena.used + index_bytes) / self._len, 1) if self._len else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._arena.close()
+
+    # MutableMapping
+    def __getitem__(self, key: str):
+        found = self.lookup(key)
+        if found is None:
+            raise KeyError(key)
+        return found[0]
+
+    def __setitem__(self, key: str, value) -> None:
+        self.put(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        kb = key.encode("utf-8")
+        with self._lock:
+            slot = self._slot(kb, _hash(kb))
+            if slot < 0:
+                raise KeyError(key)
+            self._garbage += self._record_size(self._offsets[slot])
+            self._offsets[slot] = DELETED
+            self._len -= 1
+
+    def __contains__(self, key) -> bool:
+        if not isinstance(key, str):
+            return False
+        kb = key.encode("utf-8")
+        with self._lock:
+            return self._slot(kb, _hash(kb)) >= 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        # Keys are collected under the lock so iterating is safe while writes continue.
+        keys = []
+        with self._lock:
+            buf = self._arena.buf
+            for off in self._offsets:
+                if off >= 0:
+                    klen = _REC.unpack_from(buf, off)[0]
+                    start = off + _REC.size
+                    keys.append(bytes(buf[start:start + klen]).decode("utf-8"))
+        return iter(keys)
+
+    def items(self):
+        return [(key, value) for key, value, _ in self.records()]
+
+
+class VersionView(MutableMapping):
+    """`versions` mapping of an ArenaEngine: reads and writes the version field of each record."""
+
+    def __init__(self, engine: ArenaEngine):
+        self._engine = engine
+
+    def __getitem__(self, key: str) -> int:
+        return self._engine.version_of(key)
+
+    def __setitem__(self, key: str, version: int) -> None:
+        self._engine.set_version(key, version)
+
+    def __delitem__(self, key: str) -> None:
+        self._engine.set_version(key, 0)
+
+    def __contains__(self, key) -> bool:
+        return key in self._engine
+
+    def __len__(self) -> int:
+        return len(self._engine)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._engine)
+
+
+class MmapEngine(ArenaEngine):
+    """Arena engine whose arena is a memory-mapped file in `directory`."""
+
+    name = "mmap"
+
+    def __init__(self, directory: str, capacity: int = 1024):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(MmapArena(os.path.join(directory, "arena.bin")), capacity)
+
+
+def open_engine(name: str, directory: str):
+    """Create the storage engine called `name` (see ENGINES)."""
+    if name == "dict":
+        return DictEngine()
+    if name == "arena":
+        return ArenaEngine()
+    if name == "mmap":
+        return MmapEngine(directory)
+    raise ValueError(f"Unknown storage engine {name!r}, expected one of {ENGINES}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import gc
+    import random
+    import shutil
+    import tempfile
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Compare memory per key and lookup speed of the storage engines")
+    parser.add_argument("--keys", type=int, default=1000000, help="Number of keys to store")
+    parser.add_argument("--value-size", type=int, default=16, help="Value size in characters")
+    parser.add_argument("--lookups", type=int, default=200000, help="Random lookups to time")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated engines to compare")
+    args = parser.parse_args()
+
+    keys = [f"user:{i:010d}" for i in range(args.keys)]
+    probe = random.sample(keys, min(args.lookups, len(keys)))
+    raw_bytes = sum(len(k) for k in keys) + args.keys * (args.value_size + 8)  # key + value + version
+
+    def fill(engine) -> None:
+        # Fresh key and value objects per entry, as when they come from parsed requests.
+        versions = engine.versions
+        for i in range(args.keys):
+            key = f"user:{i:010d}"
+            engine[key] = "v" * args.value_size
+            versions[key] = i + 1
+
+    print(f"{args.keys} keys, {args.value_size}-char values, raw data {raw_bytes / args.keys:.1f} bytes/key")
+    print(f"{'engine':8} {'heap B/key':>11} {'off-heap B/key':>15} {'insert k/s':>11} {'lookup k/s':>11}")
+    for name in args.engines.split(","):
+        directory = tempfile.mkdtemp(prefix="kvengine-")
+        try:
+            # Memory: traced Python heap (the mmap arena is outside it and reported separately).
+            gc.collect()
+            tracemalloc.start()
+            engine = open_engine(name, directory)
+            fill(engine)
+            heap = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            off_heap = engine._arena.used if isinstance(engine, MmapEngine) else 0
+            engine.close()
+            del engine
+            gc.collect()
+
+            # Speed, measured without tracemalloc.
+            engine = open_engine(name, directory)
+            start = time.perf_counter()
+            fill(engine)
+            insert_rate = args.keys / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for key in probe:
+                engine.lookup(key)
+            lookup_rate = len(probe) / (time.perf_counter() - start)
+            engine.close()
+            del engine
+            gc.collect()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print(
+            f"{name:8} {heap / args.keys:11.1f} {off_heap / args.keys:15.1f} "
+            f"{insert_rate / 1000:11.1f} {lookup_rate / 1000:11.1f}"
+        )
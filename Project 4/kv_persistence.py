@@ -0,0 +1,681 @@
+'''
+Durable, append-only persistence for the DHT node's key-value store.
+
+Every write is appended to a write-ahead log (WAL) before the client gets a
+reply. A background flusher writes and fsyncs pending records in groups
+(group commit), so many concurrent writers share one fsync. Periodically the
+whole store is written to a compacted snapshot and the log segments it covers
+are deleted. On startup the snapshot is loaded and the remaining log segments
+are replayed.
+
+Files (all inside the persistence directory):
+    snapshot.bin          latest compacted snapshot
+    wal.<segment>.log     log segments, replayed in ascending order
+
+File headers:
+    snapshot   "KVSNAP02" | format version (u8) | first WAL segment not covered (u64)
+    WAL        "KVWAL" | format version (u8)
+
+Record layout (little-endian), shared by the WAL and the snapshot:
+    crc32 (u32) | op (u8) | key length (u32) | value length (u32) | version (u64) | key | value
+Format version 3 added delete records (empty value), written when a node
+drops keys it no longer replicates; it reads version 2 files unchanged.
+Format version 1 (snapshots starting with "KVSNAP01", WAL segments without a
+header) had no version field in the record header. Such files are still read
+(every key gets version 0) and are rewritten as a version 2 snapshot right
+after recovery; files from a newer format version are refused.
+The CRC covers everything after it, so a torn write at the end of the log is
+detected and ignored during recovery. String values are stored as raw UTF-8;
+any other JSON value accepted by /kv is stored JSON-encoded, so it
+round-trips unchanged. The version is the write's last-write-wins version
+(0 for unversioned writes); a write older than the stored version is not
+applied or logged.
+
+Run this file directly to benchmark write throughput and recovery time:
+    python kv_persistence.py --keys 2000000 --threads 8
+'''
+
+import os # file paths, fsync, atomic rename.
+import json # encoding values so any JSON type round-trips.
+import mmap # zero-copy reads of large snapshot/log files during recovery.
+import struct # packing fixed-size record headers.
+import threading # background flusher/snapshot threads and locks.
+import time # fsync intervals and timing stats.
+import zlib # crc32 checksums for torn-write detection.
+import logging
+from typing import Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+logger = logging.getLogger("DHT_Node")
+
+OP_PUT = 1  # value stored as JSON
+OP_PUT_STR = 2  # value is a plain string stored as raw UTF-8 (skips JSON on the hot path)
+OP_DELETE = 3  # key removed; no value
+
+FORMAT_VERSION = 3
+
+_HEADER = struct.Struct("<IBIIQ")  # crc32, op, key length, value length, version
+_HEADER_V1 = struct.Struct("<IBII")  # format 1: crc32, op, key length, value length
+_SNAPSHOT_MAGIC = b"KVSNAP02"
+_SNAPSHOT_MAGIC_V1 = b"KVSNAP01"
+_SNAPSHOT_HEADER = struct.Struct("<BQ")  # format version, first WAL segment not covered by the snapshot
+_SNAPSHOT_HEADER_V1 = struct.Struct("<Q")
+_WAL_MAGIC = b"KVWAL"
+_WAL_HEADER = struct.Struct("<5sB")  # magic, format version
+SNAPSHOT_FILE = "snapshot.bin"
+
+SYNC_MODES = ("group", "async", "off")
+
+
+def encode_put(key: str, value, version: int = 0) -> bytes:
+    """Encode a put record, storing string values raw and anything else as JSON."""
+    if isinstance(value, str):
+        return encode_record(OP_PUT_STR, key, value, version)
+    return encode_record(OP_PUT, key, value, version)
+
+
+def encode_record(op: int, key: str, value, version: int = 0) -> bytes:
+    """Encode one record (header + key + value) as bytes."""
+    k = key.encode("utf-8")
+    if op == OP_PUT_STR:
+        v = value.encode("utf-8")
+    elif op == OP_DELETE:
+        v = b""
+    else:
+        v = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    body = struct.pack("<BIIQ", op, len(k), len(v), version) + k + v
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+def iter_records(buf, offset: int = 0, format_version: int = FORMAT_VERSION) -> Iterator[Tuple[int, str, object, int]]:
+    """
+    Yield (op, key, value, version) tuples from a buffer of encoded records.
+
+    Stops quietly at the first truncated or corrupt record, which is what a
+    crash in the middle of a write leaves at the end of a log segment.
+    Format 1 records have no version; they are yielded with version 0.
+    """
+    header = _HEADER if format_version >= 2 else _HEADER_V1
+    end = len(buf)
+    while offset + header.size <= end:
+        if format_version >= 2:
+            crc, op, klen, vlen, version = header.unpack_from(buf, offset)
+        else:
+            crc, op, klen, vlen = header.unpack_from(buf, offset)
+            version = 0
+        start = offset + 4
+        stop = offset + header.size + klen + vlen
+        if stop > end or zlib.crc32(buf[start:stop]) != crc:
+            logger.warning("Ignoring torn/corrupt record at offset %d", offset)
+            return
+        key_start = offset + header.size
+        key = buf[key_start:key_start + klen].decode("utf-8")
+        if op == OP_PUT_STR:
+            value = buf[key_start + klen:stop].decode("utf-8")
+        elif op == OP_DELETE:
+            value = None
+        else:
+            value = json.loads(buf[key_start + klen:stop])
+        yield op, key, value, version
+        offset = stop
+
+
+def wal_format(buf) -> Tuple[int, int]:
+    """Return (format version, offset of the first record) of a WAL segment's contents."""
+    if len(buf) >= _WAL_HEADER.size and buf[:len(_WAL_MAGIC)] == _WAL_MAGIC:
+        _, version = _WAL_HEADER.unpack_from(buf, 0)
+        return version, _WAL_HEADER.size
+    return 1, 0  # format 1 segments have no header
+
+
+def _open_segment(path: str):
+    """Open a WAL segment for appending, writing the file header if it is new."""
+    f = open(path, "ab")
+    if f.tell() == 0:
+        f.write(_WAL_HEADER.pack(_WAL_MAGIC, FORMAT_VERSION))
+    return f
+
+
+def _map_file(path: str):
+    """Return a read-only mmap of a file, or b"" if it is empty."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _fsync_dir(directory: str) -> None:
+    """fsync a directory so renames/creates inside it are durable."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform (e.g. Windows)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Segmented append-only log with group commit.
+
+    append() only buffers the record in memory and returns its log sequence
+    number (LSN); a background thread writes buffered records to the current
+    segment and fsyncs them in one go. wait_durable(lsn) blocks until that
+    record is on disk.
+
+    Sync modes:
+        group  – writers wait for the fsync covering their record (durable on reply)
+        async  – writers return immediately; records are fsynced within the interval
+        off    – records are written to the OS but never fsynced
+    """
+
+    def __init__(self, directory: str, segment: int, sync_mode: str = "group",
+                 fsync_interval: float = 0.002, fsync_batch: int = 1024):
+        if sync_mode not in SYNC_MODES:
+            raise ValueError(f"Unknown WAL sync mode {sync_mode!r}, expected one of {SYNC_MODES}")
+        self.directory = directory
+        self.sync_mode = sync_mode
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+
+        self.segment = segment
+        self._file = _open_segment(self.segment_path(segment))
+
+        # Lock order: _io_lock before _lock.
+        self._io_lock = threading.Lock()  # held while writing to / switching segment files
+        self._lock = threading.Lock()  # protects the buffer and LSN counters
+        self._has_data = threading.Condition(self._lock)
+        self._durable = threading.Condition(self._lock)
+        self._buffer: List[bytes] = []
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._closed = False
+
+        self.records = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.fsync_time = 0.0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal.{segment:08d}.log")
+
+    def append(self, data: bytes) -> int:
+        """Buffer an encoded record and return its LSN."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WAL is closed")
+            self._buffer.append(data)
+            lsn = self._next_lsn
+            self._next_lsn += 1
+            self._has_data.notify()
+            return lsn
+
+    def wait_durable(self, lsn: int) -> None:
+        """In group mode, block until the record with this LSN is fsynced; otherwise return at once."""
+        if self.sync_mode != "group":
+            return
+        with self._lock:
+            while self._durable_lsn < lsn and not self._closed:
+                self._durable.wait()
+
+    def _write_out(self, chunk: List[bytes], last_lsn: int) -> None:
+        """Write a group of records to the current segment. Caller holds _io_lock."""
+        data = b"".join(chunk)
+        self._file.write(data)
+        self._file.flush()
+        if self.sync_mode != "off":
+            start = time.perf_counter()
+            os.fsync(self._file.fileno())
+            self.fsync_time += time.perf_counter() - start
+            self.fsyncs += 1
+        with self._lock:
+            self.records += len(chunk)
+            self.bytes_written += len(data)
+            self._durable_lsn = max(self._durable_lsn, last_lsn)
+            self._durable.notify_all()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._has_data.wait()
+                if self._closed and not self._buffer:
+                    return
+                # Give a group time to form, unless the batch is already full.
+                deadline = time.monotonic() + self.fsync_interval
+                while len(self._buffer) < self.fsync_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._has_data.wait(remaining)
+            with self._io_lock:
+                with self._lock:
+                    chunk, self._buffer = self._buffer, []
+                    last_lsn = self._next_lsn - 1
+                if chunk:
+                    self._write_out(chunk, last_lsn)
+
+    def rotate(self) -> int:
+        """
+        Flush pending records, close the current segment and start a new one.
+
+        Returns the new segment number; every record appended after this call
+        goes to that segment or a later one.
+        """
+        with self._io_lock:
+            with self._lock:
+                chunk, self._buffer = self._buffer, []
+                last_lsn = self._next_lsn - 1
+                if chunk:
+                    # Written while still holding _lock so no record can be
+                    # appended between the flush and the segment switch.
+                    data = b"".join(chunk)
+                    self._file.write(data)
+                    self.records += len(chunk)
+                    self.bytes_written += len(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self.segment += 1
+                self._file = _open_segment(self.segment_path(self.segment))
+                self._durable_lsn = max(self._durable_lsn, last_lsn)
+                self._durable.notify_all()
+            _fsync_dir(self.directory)
+            return self.segment
+
+    def remove_segments_before(self, segment: int) -> int:
+        """Delete log segments older than `segment`. Returns how many were removed."""
+        removed = 0
+        for seg in list_segments(self.directory):
+            if seg < segment:
+                os.remove(self.segment_path(seg))
+                removed += 1
+        return removed
+
+    def close(self) -> None:
+        """Flush everything still buffered and stop the flusher thread."""
+        with self._lock:
+            self._closed = True
+            self._has_data.notify_all()
+        self._flusher.join()
+        with self._io_lock:
+            self._file.flush()
+            if self.sync_mode != "off":
+                os.fsync(self._file.fileno())
+            self._file.close()
+        with self._lock:
+            self._durable.notify_all()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sync_mode": self.sync_mode,
+                "segment": self.segment,
+                "records": self.records,
+                "bytes": self.bytes_written,
+                "pending": len(self._buffer),
+                "fsyncs": self.fsyncs,
+                "avg_group_size": round(self.records / self.fsyncs, 2) if self.fsyncs else 0.0,
+                "avg_fsync_ms": round(1000 * self.fsync_time / self.fsyncs, 3) if self.fsyncs else 0.0,
+            }
+
+
+def list_segments(directory: str) -> List[int]:
+    """Return the numbers of all WAL segments in a directory, ascending."""
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith("wal.") and name.endswith(".log"):
+            try:
+                segments.append(int(name[4:-4]))
+            except ValueError:
+                continue
+    return sorted(segments)
+
+
+def _drop(store: MutableMapping, versions: MutableMapping, key: str) -> None:
+    store.pop(key, None)
+    if key in versions:  # an engine's version view already lost it with the key
+        del versions[key]
+
+
+def write_snapshot(directory: str, items, next_segment: int) -> int:
+    """
+    Atomically write a compacted snapshot of `items` ((key, value, version) tuples).
+
+    `next_segment` is the first WAL segment whose records are NOT included,
+    i.e. where replay has to start after loading this snapshot. The snapshot
+    is written to a temp file, fsynced and renamed over the old one.
+    Returns the number of keys written.
+    """
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "wb", buffering=1 << 20) as f:
+        f.write(_SNAPSHOT_MAGIC + _SNAPSHOT_HEADER.pack(FORMAT_VERSION, next_segment))
+        for key, value, version in items:
+            f.write(encode_put(key, value, version))
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(directory)
+    return count
+
+
+def recover(directory: str, store: MutableMapping, versions: MutableMapping) -> Dict:
+    """
+    Rebuild `store` (and `versions`) from the snapshot and the WAL segments
+    written after it.
+
+    Returns recovery stats including the next free segment number and the
+    number of format 1 files read ("legacy_files"). Raises ValueError for a
+    file that is not a snapshot/segment or has a newer format version.
+    """
+    start = time.perf_counter()
+    snapshot_keys = 0
+    replay_from = 0
+    legacy_files = 0
+
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(path):
+        buf = _map_file(path)
+        magic = bytes(buf[:len(_SNAPSHOT_MAGIC)])
+        if magic == _SNAPSHOT_MAGIC:
+            file_version, replay_from = _SNAPSHOT_HEADER.unpack_from(buf, len(magic))
+            header_size = len(magic) + _SNAPSHOT_HEADER.size
+        elif magic == _SNAPSHOT_MAGIC_V1:
+            file_version = 1
+            (replay_from,) = _SNAPSHOT_HEADER_V1.unpack_from(buf, len(magic))
+            header_size = len(magic) + _SNAPSHOT_HEADER_V1.size
+            legacy_files += 1
+        else:
+            raise ValueError(f"{path} is not a KV snapshot")
+        if file_version > FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {file_version}, this node reads up to {FORMAT_VERSION}")
+        for _, key, value, version in iter_records(buf, header_size, file_version):
+            store[key] = value
+            if version:
+                versions[key] = version
+            snapshot_keys += 1
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+    replayed = 0
+    segments = [seg for seg in list_segments(directory) if seg >= replay_from]
+    for seg in segments:
+        seg_path = os.path.join(directory, f"wal.{seg:08d}.log")
+        buf = _map_file(seg_path)
+        file_version, offset = wal_format(buf)
+        if file_version > FORMAT_VERSION:
+            raise ValueError(f"{seg_path} has format version {file_version}, this node reads up to {FORMAT_VERSION}")
+        if file_version < 2 and len(buf):
+            legacy_files += 1
+        for op, key, value, version in iter_records(buf, offset, file_version):
+            if op in (OP_PUT, OP_PUT_STR):
+                store[key] = value
+                if version:
+                    versions[key] = version
+            elif op == OP_DELETE:
+                _drop(store, versions, key)
+            replayed += 1
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+    last_segment = max(list_segments(directory) + [replay_from - 1, 0])
+    return {
+        "snapshot_keys": snapshot_keys,
+        "replayed_records": replayed,
+        "replayed_segments": len(segments),
+        "keys": len(store),
+        "seconds": round(time.perf_counter() - start, 3),
+        "next_segment": last_segment + 1,
+        "legacy_files": legacy_files,
+    }
+
+
+class KVPersistence:
+    """
+    Ties the WAL and periodic snapshots to an in-memory store.
+
+    All writes to the store must go through put()/put_many(): the record is
+    appended to the log and applied to the store under one lock, so the log
+    order always matches the order the store saw, and the caller then waits
+    for the group commit outside the lock.
+
+    `versions` holds the last-write-wins version of each key (missing = 0).
+    A write with an older version than the stored one is skipped.
+    """
+
+    def __init__(self, directory: str, store: MutableMapping, versions: Optional[MutableMapping] = None,
+                 sync_mode: str = "group",
+                 fsync_interval: float = 0.002, fsync_batch: int = 1024,
+                 snapshot_interval: float = 60.0, snapshot_min_records: int = 100000):
+        self.directory = directory
+        self.store = store
+        self.versions = versions if versions is not None else {}
+        self.sync_mode = sync_mode
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_min_records = snapshot_min_records
+        self.lock = threading.Lock()
+        self.wal: Optional[WriteAheadLog] = None
+        self.recovery_stats: Dict = {}
+        self.last_snapshot: Dict = {}
+        self._records_at_snapshot = 0
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(self) -> Dict:
+        """
+        Load snapshot + log into the store and open a fresh log segment.
+
+        If any file was in the old format 1, a snapshot is written right away
+        so the data is kept in the current format and the old files go away.
+        """
+        self.recovery_stats = recover(self.directory, self.store, self.versions)
+        # Always write to a new segment so we never append after a torn tail.
+        self.wal = WriteAheadLog(
+            self.directory,
+            self.recovery_stats["next_segment"],
+            sync_mode=self.sync_mode,
+            fsync_interval=self.fsync_interval,
+            fsync_batch=self.fsync_batch,
+        )
+        if self.recovery_stats["legacy_files"]:
+            logger.info("Converting %d format 1 persistence files", self.recovery_stats["legacy_files"])
+            self.snapshot()
+        return self.recovery_stats
+
+    def start(self) -> None:
+        """Start the periodic snapshot thread."""
+        if self.snapshot_interval > 0:
+            threading.Thread(target=self._snapshot_loop, name="kv-snapshot", daemon=True).start()
+
+    def put(self, key: str, value, version: int = 0) -> bool:
+        """Log and apply one write. Returns False if a newer version is already stored."""
+        record = encode_put(key, value, version)
+        with self.lock:
+            if version < self.versions.get(key, 0):
+                return False
+            lsn = self.wal.append(record)
+            self.store[key] = value
+            if version:
+                self.versions[key] = version
+        self.wal.wait_durable(lsn)
+        return True
+
+    def put_many(self, items: Dict, versions: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        Log and apply many writes; waits for a single group commit.
+
+        `versions` optionally maps each key to its write version.
+        Returns the keys that were applied (not superseded by a newer version).
+        """
+        versions = versions or {}
+        records = [
+            (key, value, versions.get(key, 0), encode_put(key, value, versions.get(key, 0)))
+            for key, value in items.items()
+        ]
+        applied = []
+        lsn = 0
+        with self.lock:
+            for key, value, version, record in records:
+                if version < self.versions.get(key, 0):
+                    continue
+                lsn = self.wal.append(record)
+                self.store[key] = value
+                if version:
+                    self.versions[key] = version
+                applied.append(key)
+        if lsn:
+            self.wal.wait_durable(lsn)
+        return applied
+
+    def delete_many(self, versions: Dict[str, int]) -> List[str]:
+        """
+        Log and apply deletes of keys still stored at the given version; a
+        key written since then is kept. Waits for a single group commit.
+        Returns the keys deleted.
+        """
+        deleted = []
+        lsn = 0
+        with self.lock:
+            for key, version in versions.items():
+                if key not in self.store or self.versions.get(key, 0) != version:
+                    continue
+                lsn = self.wal.append(encode_record(OP_DELETE, key, None, version))
+                _drop(self.store, self.versions, key)
+                deleted.append(key)
+        if lsn:
+            self.wal.wait_durable(lsn)
+        return deleted
+
+    def snapshot(self) -> Dict:
+        """
+        Write a compacted snapshot and drop the log segments it covers.
+
+        The store is copied under the write lock (a short pause for writers);
+        the copy is then written to disk without blocking anyone.
+        """
+        with self._snapshot_lock:
+            start = time.perf_counter()
+            with self.lock:
+                next_segment = self.wal.rotate()
+                records = getattr(self.store, "records", None)  # storage engines read all three in one pass
+                if records is not None:
+                    items = records()
+                else:
+                    items = [(key, value, self.versions.get(key, 0)) for key, value in self.store.items()]
+                self._records_at_snapshot = self.wal.records
+            pause = time.perf_counter() - start
+            count = write_snapshot(self.directory, items, next_segment)
+            removed = self.wal.remove_segments_before(next_segment)
+            self.last_snapshot = {
+                "keys": count,
+                "segments_removed": removed,
+                "write_pause_s": round(pause, 3),
+                "seconds": round(time.perf_counter() - start, 3),
+                "at": time.time(),
+            }
+            logger.info("Snapshot written: %s keys in %ss", count, self.last_snapshot['seconds'])
+            return self.last_snapshot
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self.snapshot_interval):
+            if self.wal.records - self._records_at_snapshot >= self.snapshot_min_records:
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    logger.error("Snapshot failed: %s", e)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self.wal is not None:
+            self.wal.close()
+
+    def stats(self) -> Dict:
+        return {
+            "directory": self.directory,
+            "wal": self.wal.stats() if self.wal else {},
+            "recovery": self.recovery_stats,
+            "last_snapshot": self.last_snapshot,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark WAL write throughput and recovery time")
+    parser.add_argument("--keys", type=int, default=1000000, help="Number of keys to write")
+    parser.add_argument("--value-size", type=int, default=32, help="Value size in characters")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent writer threads")
+    parser.add_argument("--sync-mode", choices=SYNC_MODES, default="group")
+    parser.add_argument("--fsync-interval-ms", type=float, default=2.0)
+    parser.add_argument("--fsync-batch", type=int, default=1024)
+    parser.add_argument("--batch", type=int, default=1, help="Keys per put_many call (1 = single puts)")
+    parser.add_argument("--dir", default=None, help="Directory to use (default: temp dir, removed afterwards)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="kvwal-")
+    value = "x" * args.value_size
+
+    def open_persistence(store):
+        p = KVPersistence(directory, store, sync_mode=args.sync_mode,
+                          fsync_interval=args.fsync_interval_ms / 1000.0,
+                          fsync_batch=args.fsync_batch, snapshot_interval=0)
+        p.recover()
+        return p
+
+    try:
+        p = open_persistence({})
+
+        def writer(worker: int) -> None:
+            keys = range(worker, args.keys, args.threads)
+            if args.batch <= 1:
+                for i in keys:
+                    p.put(f"key-{i}", value)
+            else:
+                batch = {}
+                for i in keys:
+                    batch[f"key-{i}"] = value
+                    if len(batch) >= args.batch:
+                        p.put_many(batch)
+                        batch = {}
+                if batch:
+                    p.put_many(batch)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        wal_stats = p.wal.stats()
+        print(f"writes:   {args.keys} keys in {elapsed:.2f}s -> {args.keys / elapsed:,.0f} writes/s "
+              f"({wal_stats['fsyncs']} fsyncs, avg group {wal_stats['avg_group_size']})")
+
+        p.close()
+        store: Dict = {}
+        p = open_persistence(store)
+        print(f"recovery (log only):      {p.recovery_stats['seconds']}s for {len(store)} keys")
+
+        snap = p.snapshot()
+        print(f"snapshot: {snap['keys']} keys in {snap['seconds']}s (writer pause {snap['write_pause_s']}s)")
+        p.close()
+
+        store = {}
+        p = open_persistence(store)
+        print(f"recovery (snapshot):      {p.recovery_stats['seconds']}s for {len(store)} keys")
+        p.close()
+    finally:
+        if args.dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,128 @@
+'''
+Minimal Prometheus-style metrics for the DHT node.
+
+Counters and histograms are plain dicts keyed by label values, updated under
+one lock, so recording a sample costs a dict lookup and a few additions.
+`render()` produces the Prometheus text exposition format served at
+/metrics; gauges (e.g. kv_store size), and counters that another object
+already keeps (e.g. read cache hits), are read by callbacks at scrape time
+instead of being updated on the hot path.
+
+Citation(s):
+1) Prometheus Authors. (n.d.). Exposition formats. Prometheus. Retrieved from https://prometheus.io/docs/instrumenting/exposition_formats/
+2) Prometheus Authors. (n.d.). Histograms and summaries. Prometheus. Retrieved from https://prometheus.io/docs/practices/histograms/
+'''
+
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple
+
+# Latency buckets in seconds (upper bounds), from sub-millisecond local hits
+# up to forwarded requests that hit the read timeout.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {total:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last = +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values) -> None:
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, (list(counts), total)) for values, (counts, total) in self._values.items())
+        names = self.label_names + ("le",)
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds the node's metrics and renders them for /metrics."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._callbacks: List[Tuple[str, str, str, Callable[[], float]]] = []  # (name, help, type, read)
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Register a gauge whose value is read by `read()` at scrape time."""
+        self._callbacks.append((name, help_text, "gauge", read))
+
+    def counter_func(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Register a counter whose running total is read by `read()` at scrape time."""
+        self._callbacks.append((name, help_text, "counter", read))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, kind, read in self._callbacks:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {read():g}"]
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,140 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+import requests
+
+# The node's modules are imported as top-level modules (run from Project 4/).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py configures itself from the environment when it is first imported:
+# keep its files out of the checkout and its keys in memory.
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp(prefix="dht-tests-"))
+os.environ.setdefault("KV_PERSISTENCE", "0")
+
+SELF_URL = "http://localhost:5000"
+PEER_URLS = ["http://node2:5000", "http://node3:5000"]
+CLUSTER_URLS = [f"http://node{i}:5000" for i in range(2, 6)]
+
+
+class FakePeer:
+    """
+    Another node's replica routes, answered from memory.
+
+    Set `down` to make it unreachable or `delay` (seconds) to make it slow;
+    `calls` records (method, path) of every request it received. It also
+    stands in for the peer's PeerPool, for the /chunks routes.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.store = {}  # key -> (value, version)
+        self.chunks = {}  # digest -> bytes
+        self.membership = None  # last body POSTed to /membership
+        self.down = False
+        self.delay = 0.0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def put(self, key, value, version):
+        with self._lock:
+            if version < self.store.get(key, (None, 0))[1]:
+                return False
+            self.store[key] = (value, version)
+            return True
+
+    def get(self, key):
+        with self._lock:
+            if key not in self.store:
+                return {"status": "not_found", "key": key, "version": 0, "node": self.url}
+            value, version = self.store[key]
+        return {"status": "found", "key": key, "value": value, "version": version, "node": self.url}
+
+    def forward(self, method, path, json=None, params=None):
+        self.calls.append((method, path))
+        time.sleep(self.delay)
+        if self.down:
+            return {"error": f"Failed to contact node {self.url}"}, 502
+        if path == "/kv/replica":
+            applied = self.put(json["key"], json["value"], json["version"])
+            return {"status": "stored" if applied else "stale", "node": self.url}, 200
+        if path == "/kv/replica/batch":
+            versions = json.get("versions") or {key: json.get("version", 0) for key in json["items"]}
+            results = {
+                key: {"status": "stored" if self.put(key, value, versions[key]) else "stale"}
+                for key, value in json["items"].items()
+            }
+            return {"node": self.url, "results": results}, 200
+        if path == "/kv/replica/batch/get":
+            return {"node": self.url, "results": {key: self.get(key) for key in json["keys"]}}, 200
+        if path.startswith("/kv/replica/"):
+            resp = self.get(path[len("/kv/replica/"):])
+            return resp, 200 if resp["status"] == "found" else 404
+        if path == "/kv/cache/invalidate":
+            return {"status": "invalidated", "node": self.url}, 200
+        if path == "/membership" and method == "POST":
+            self.membership = json
+            return {"self": self.url, "epoch": json["epoch"], "peers": json["peers"]}, 200
+        if path == "/health":
+            return {"status": "ok", "node": self.url}, 200
+        return {"error": "Not found"}, 404
+
+    def request(self, method, url, data=None, **kwargs):
+        path = url[len(self.url):]
+        self.calls.append((method, path))
+        if self.down:
+            raise requests.ConnectionError(f"{self.url} is down")
+        digest = path[len("/chunks/"):]
+        resp = requests.Response()
+        resp.status_code, resp._content = 404, b'{"error": "Chunk not found"}'
+        if method == "PUT":
+            status = "exists" if digest in self.chunks else "stored"
+            self.chunks[digest] = data
+            resp.status_code, resp._content = 200, f'{{"status": "{status}"}}'.encode()
+        elif digest in self.chunks:
+            resp.status_code, resp._content = 200, self.chunks[digest] if method == "GET" else b""
+        return resp
+
+
+@pytest.fixture
+def node(monkeypatch):
+    """The app module on an empty store, on a ring of this node and PEER_URLS."""
+    pytest.importorskip("flask")
+    import app
+
+    peers = sorted([SELF_URL] + PEER_URLS)
+    ring = app.build_ring(peers)
+    monkeypatch.setattr(app, "SELF_URL", SELF_URL)
+    monkeypatch.setattr(app, "PEERS", peers)
+    monkeypatch.setattr(app, "RING", ring)
+    monkeypatch.setattr(app, "RING_TOKENS", [n["id"] for n in ring])
+    monkeypatch.setattr(app, "_ring_snapshot", (ring, [n["id"] for n in ring]))
+    app.kv_store.clear()
+    app.kv_versions.clear()
+    app.read_cache.clear()
+    yield app
+    app.kv_store.clear()
+    app.kv_versions.clear()
+
+
+@pytest.fixture
+def cluster(node, monkeypatch):
+    """
+    Put `node` on a ring with four FakePeers (N=3 of 5 nodes, so keys are
+    spread) and send its forwarded requests to them. Returns {url: FakePeer}.
+    """
+    peers = {url: FakePeer(url) for url in CLUSTER_URLS}
+    urls = sorted([SELF_URL] + CLUSTER_URLS)
+    ring = node.build_ring(urls)
+    monkeypatch.setattr(node, "PEERS", urls)
+    monkeypatch.setattr(node, "RING", ring)
+    monkeypatch.setattr(node, "RING_TOKENS", [n["id"] for n in ring])
+    monkeypatch.setattr(node, "_ring_snapshot", (ring, [n["id"] for n in ring]))
+    monkeypatch.setattr(
+        node, "forward_request", lambda url, method, path, **kwargs: peers[url].forward(method, path, **kwargs)
+    )
+    monkeypatch.setattr(node, "get_peer_pool", lambda url: peers[url])
+    return peers
@@ -0,0 +1,72 @@
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture
+def client(node, cluster, tmp_path, monkeypatch):
+    monkeypatch.setattr(node, "STORAGE_DIR", str(tmp_path))
+    return node.app.test_client()
+
+
+def test_streamed_upload_and_download(client, tmp_path):
+    assert client.put("/upload/a.txt", data=b"0123456789").get_json()["size"] == 10
+    assert (tmp_path / "a.txt").read_bytes() == b"0123456789"
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".")]
+
+    resp = client.get("/download/a.txt")
+    assert resp.status_code == 200 and resp.data == b"0123456789"
+    assert resp.headers["ETag"]
+
+
+def test_multipart_upload(client, tmp_path):
+    resp = client.post("/upload", data={"file": (io.BytesIO(b"hello"), "../b.txt"), "note": "x"})
+    assert resp.get_json()["filename"] == "b.txt"
+    assert os.listdir(tmp_path) == ["b.txt"]
+
+
+def test_range_and_etag(client):
+    client.put("/upload/a.txt", data=b"0123456789")
+    resp = client.get("/download/a.txt", headers={"Range": "bytes=2-5"})
+    assert resp.status_code == 206 and resp.data == b"2345"
+    assert resp.headers["Content-Range"] == "bytes 2-5/10"
+
+    etag = client.get("/download/a.txt").headers["ETag"]
+    assert client.get("/download/a.txt", headers={"If-None-Match": etag}).status_code == 304
+    client.put("/upload/a.txt", data=b"changed")
+    assert client.get("/download/a.txt", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_resumable_upload(client, tmp_path):
+    resp = client.put("/upload/big.bin", data=b"01234", headers={"Content-Range": "bytes 0-4/10"})
+    assert resp.status_code == 202 and resp.headers["Upload-Offset"] == "5"
+    assert not (tmp_path / "big.bin").exists()
+    assert client.head("/upload/big.bin").headers["Upload-Offset"] == "5"
+
+    # A piece that does not continue the stored part is refused.
+    resp = client.put("/upload/big.bin", data=b"56789", headers={"Content-Range": "bytes 4-8/10"})
+    assert resp.status_code == 416 and resp.headers["Upload-Offset"] == "5"
+    assert client.put("/upload/big.bin", data=b"x", headers={"Content-Range": "bytes 5-9"}).status_code == 400
+
+    resp = client.put("/upload/big.bin", data=b"56789", headers={"Content-Range": "bytes 5-9/10"})
+    assert resp.status_code == 200 and resp.get_json()["size"] == 10
+    assert (tmp_path / "big.bin").read_bytes() == b"0123456789"
+    assert os.listdir(tmp_path) == ["big.bin"]
+
+
+def test_internal_files_are_not_served(client, tmp_path):
+    client.put("/upload/big.bin", data=b"01234", headers={"Content-Range": "bytes 0-4/10"})
+    (tmp_path / "_kv").mkdir()
+    (tmp_path / "_kv" / "wal.log").write_bytes(b"secret")
+    (tmp_path / "_membership.json").write_text("{}")
+
+    for path in ("/download/.big.bin.part", "/download/_kv/wal.log", "/download/_membership.json"):
+        assert client.get(path).status_code == 404
+    assert client.put("/files/_kv", data=b"x").status_code == 400
+    assert client.get("/files/.big.bin.part").status_code == 404
+    assert client.get("/files/_kv/manifest").status_code == 404
+
+
+def test_missing_file(client):
+    assert client.get("/download/nothing.txt").status_code == 404
@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+import pytest
+
+
+@pytest.fixture
+def client(node, cluster, tmp_path, monkeypatch):
+    monkeypatch.setattr(node, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(node, "CHUNK_DIR", str(tmp_path / "_chunks"))
+    monkeypatch.setattr(node, "FILE_CHUNK_SIZE", 4)
+    return node.app.test_client()
+
+
+def holds_chunk(node, cluster, url, digest):
+    if url == node.SELF_URL:
+        return os.path.exists(node.chunk_path(digest))
+    return digest in cluster[url].chunks
+
+
+def test_manifest_and_placement(node, cluster, client):
+    data = b"0123456789"
+    body = client.put("/files/f.bin", data=data).get_json()
+    assert body["status"] == "ok" and body["chunks"] == 3 and body["new_chunks"] == 3
+
+    manifest = client.get("/files/f.bin/manifest").get_json()
+    assert manifest["size"] == 10 and manifest["chunk_size"] == 4
+    assert manifest["sha256"] == hashlib.sha256(data).hexdigest()
+    assert manifest["chunks"] == [hashlib.sha256(data[i:i + 4]).hexdigest() for i in (0, 4, 8)]
+    for digest, replicas in manifest["placement"].items():
+        assert replicas == node.find_replica_nodes(digest)
+        assert all(holds_chunk(node, cluster, url, digest) for url in replicas)
+
+
+def test_download(client):
+    data = bytes(range(256)) * 3
+    client.put("/files/f.bin", data=data)
+    for path in ("/files/f.bin", "/download/f.bin"):
+        resp = client.get(path)
+        assert resp.status_code == 200 and resp.data == data
+        assert resp.headers["ETag"] == f'"{hashlib.sha256(data).hexdigest()}"'
+        assert client.get(path, headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+
+
+def test_chunks_are_deduplicated(client):
+    body = client.put("/files/a.bin", data=b"abcdabcdxy").get_json()
+    assert body["chunks"] == 3 and body["new_chunks"] == 2 and body["deduplicated_chunks"] == 1
+    body = client.put("/files/b.bin", data=b"abcdxy").get_json()
+    assert body["new_chunks"] == 0 and body["deduplicated_chunks"] == 2
+    assert client.get("/files/a.bin").data == b"abcdabcdxy"
+
+
+def drop_chunk(node, cluster, digest, urls):
+    for url in urls:
+        if url == node.SELF_URL:
+            os.remove(node.chunk_path(digest))
+        else:
+            del cluster[url].chunks[digest]
+
+
+def test_chunk_read_from_another_replica(node, cluster, client):
+    client.put("/files/f.bin", data=b"0123456789")
+    for digest in client.get("/files/f.bin/manifest").get_json()["chunks"]:
+        drop_chunk(node, cluster, digest, node.find_replica_nodes(digest)[:-1])
+    assert client.get("/files/f.bin").data == b"0123456789"
+
+
+def test_missing_chunk_is_502(node, cluster, client):
+    client.put("/files/f.bin", data=b"0123456789")
+    lost = client.get("/files/f.bin/manifest").get_json()["chunks"][1]
+    drop_chunk(node, cluster, lost, node.find_replica_nodes(lost))
+
+    resp = client.get("/files/f.bin")
+    assert resp.status_code == 502
+    assert resp.get_json()["error"] == "File chunk unavailable"
+
+
+def test_missing_file(client):
+    assert client.get("/files/none.bin").status_code == 404
+    assert client.get("/files/none.bin/manifest").status_code == 404
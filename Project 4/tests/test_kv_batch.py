@@ -0,0 +1,88 @@
+def stored_on(node, cluster, url, key):
+    """The value of a key on one replica, or None."""
+    if url == node.SELF_URL:
+        return node.kv_store.get(key)
+    return cluster[url].store.get(key, (None, 0))[0]
+
+
+def batch_calls(peer, path):
+    return sum(1 for call in peer.calls if call == ("POST", path))
+
+
+def test_batch_put_sends_one_request_per_node(node, cluster):
+    items = {f"key-{i}": f"value-{i}" for i in range(200)}
+    resp = node.app.test_client().post("/kv/batch", json={"items": items})
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["status"] == "ok" and body["failed"] == 0
+    assert all(r == {"status": "stored", "acks": 3} for r in body["results"].values())
+    for peer in cluster.values():
+        assert batch_calls(peer, "/kv/replica/batch") == 1
+    for key, value in items.items():
+        replicas = node.find_replica_nodes(key)
+        assert all(stored_on(node, cluster, url, key) == value for url in replicas)
+    assert sum(body["owners"].values()) == 3 * len(items)
+
+
+def test_batch_put_with_a_node_down(node, cluster):
+    down = sorted(cluster)[0]
+    cluster[down].down = True
+    items = {f"key-{i}": i for i in range(100)}
+    body = node.app.test_client().post("/kv/batch", json={"items": items}).get_json()
+
+    # One missing replica of three still leaves the write quorum (2).
+    assert body["status"] == "ok"
+    for key in items:
+        expected = 2 if down in node.find_replica_nodes(key) else 3
+        assert body["results"][key]["acks"] == expected
+
+
+def test_batch_put_reports_keys_below_quorum(node, cluster):
+    for peer in cluster.values():
+        peer.down = True
+    body = node.app.test_client().post("/kv/batch", json={"items": {"a": 1, "b": 2}}).get_json()
+    assert body["status"] == "partial" and body["failed"] == 2
+    for key in ("a", "b"):
+        acks = 1 if node.SELF_URL in node.find_replica_nodes(key) else 0
+        assert body["results"][key] == {"status": "error", "acks": acks}
+
+
+def test_batch_get(node, cluster):
+    client = node.app.test_client()
+    items = {f"key-{i}": f"value-{i}" for i in range(200)}
+    client.post("/kv/batch", json={"items": items})
+    for peer in cluster.values():
+        peer.calls.clear()
+
+    body = client.post("/kv/batch/get", json={"keys": list(items) + ["missing", "key-0"]}).get_json()
+    assert body["status"] == "ok"
+    assert {key: r.get("value") for key, r in body["results"].items() if key != "missing"} == items
+    assert body["results"]["missing"] == {"status": "not_found"}
+    for peer in cluster.values():
+        assert batch_calls(peer, "/kv/replica/batch/get") <= 1
+
+
+def test_batch_get_retries_on_next_replica(node, cluster, monkeypatch):
+    client = node.app.test_client()
+    items = {f"key-{i}": i for i in range(100)}
+    client.post("/kv/batch", json={"items": items})
+    # Read from the remote replicas only, and take one of them down.
+    monkeypatch.setattr(node, "by_latency", lambda urls: [u for u in urls if u != node.SELF_URL] + [node.SELF_URL])
+    down = sorted(cluster)[0]
+    cluster[down].down = True
+
+    body = client.post("/kv/batch/get", json={"keys": list(items)}).get_json()
+    assert body["status"] == "ok"
+    assert {key: r["value"] for key, r in body["results"].items()} == items
+
+
+def test_batch_rejects_bad_requests(node, cluster, monkeypatch):
+    client = node.app.test_client()
+    assert client.post("/kv/batch", json={"items": ["a"]}).status_code == 400
+    assert client.post("/kv/batch", json={"items": {"a": None}}).status_code == 400
+    assert client.post("/kv/batch/get", json={"keys": "a"}).status_code == 400
+    assert client.post("/kv/batch/get", json={"keys": [1]}).status_code == 400
+    monkeypatch.setattr(node, "BATCH_MAX_KEYS", 2)
+    assert client.post("/kv/batch", json={"items": {"a": 1, "b": 2, "c": 3}}).status_code == 413
+    assert client.post("/kv/batch/get", json={"keys": ["a", "b", "c"]}).status_code == 413
@@ -0,0 +1,92 @@
+import kv_cache
+from kv_cache import LeaseTable, ReadCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def patch_clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(kv_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_hit_miss_and_expiry(monkeypatch):
+    clock = patch_clock(monkeypatch)
+    cache = ReadCache(capacity=10, ttl=5)
+    assert cache.get("k") is None
+    assert cache.put("k", {"value": 1, "version": 1}, lease=30)  # capped at the TTL
+    assert cache.get("k") == {"value": 1, "version": 1}
+    clock.now += 5
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (1, 2, 1)
+
+
+def test_lru_eviction():
+    cache = ReadCache(capacity=2, ttl=5)
+    cache.put("a", {"version": 1}, 5)
+    cache.put("b", {"version": 1}, 5)
+    cache.get("a")
+    cache.put("c", {"version": 1}, 5)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_fence_blocks_older_response():
+    cache = ReadCache(capacity=10, ttl=5)
+    cache.put("k", {"value": "old", "version": 1}, 5)
+    cache.invalidate("k", 2)
+    assert cache.get("k") is None
+    # A read that started before the write must not put the old value back.
+    assert not cache.put("k", {"value": "old", "version": 1}, 5)
+    assert cache.put("k", {"value": "new", "version": 2}, 5)
+    assert cache.get("k")["value"] == "new"
+    # An older invalidation does not remove a newer entry.
+    cache.put("k", {"value": "newer", "version": 3}, 5)
+    cache.invalidate("k", 2)
+    assert cache.get("k")["value"] == "newer"
+
+
+def test_invalidate_without_fence():
+    cache = ReadCache(capacity=10, ttl=5)
+    cache.put("k", {"version": 1}, 5)
+    cache.invalidate("k", 2, fence=False)
+    assert cache.put("k", {"version": 1}, 5)
+
+
+def test_disabled_cache():
+    cache = ReadCache(capacity=0, ttl=5)
+    assert not cache.put("k", {"version": 1}, 5)
+    cache.invalidate("k", 1)
+    assert cache.get("k") is None
+
+
+def test_leases_revoke_and_limit(monkeypatch):
+    clock = patch_clock(monkeypatch)
+    leases = LeaseTable(max_keys=1)
+    assert leases.grant("a", "n1", 2) == 2
+    assert leases.grant("b", "n1", 2) == 0  # table full
+    clock.now += 3
+    assert leases.grant("b", "n2", 2) == 2  # the expired lease on "a" was purged
+    assert leases.revoke("b") == {"n2": clock.now + 2}
+    assert leases.revoke("b") == {}
+
+
+def test_failed_revocation_blocks_new_leases(monkeypatch):
+    clock = patch_clock(monkeypatch)
+    leases = LeaseTable(max_keys=10)
+    leases.grant("k", "n1", 2)
+    expires = leases.revoke("k")["n1"]
+    leases.revoke_failed("k", "n1", expires)
+    assert leases.grant("k", "n2", 2) == 0
+    assert leases.revoke("k") == {"n1": expires}  # the next write tries again
+    clock.now = expires
+    assert leases.grant("k", "n2", 2) == 2
+    assert leases.stats()["revoke_failures"] == 1
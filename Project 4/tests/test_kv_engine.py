@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+import kv_engine
+from kv_engine import ArenaEngine, DictEngine, MmapEngine, open_engine
+
+
+@pytest.fixture(params=["arena", "mmap"])
+def engine(request, tmp_path):
+    if request.param == "arena":
+        e = ArenaEngine(capacity=8)
+    else:
+        e = MmapEngine(str(tmp_path), capacity=8)
+    yield e
+    e.close()
+
+
+def check_same(engine, model, versions):
+    assert len(engine) == len(model)
+    assert sorted(engine) == sorted(model)
+    for key, value in model.items():
+        assert engine.lookup(key) == (value, versions.get(key, 0))
+    assert sorted(engine.records()) == sorted((k, v, versions.get(k, 0)) for k, v in model.items())
+
+
+def test_random_ops_match_dict(engine, monkeypatch):
+    # Compact as soon as garbage is half the arena, so compaction runs many times.
+    monkeypatch.setattr(kv_engine, "COMPACT_MIN_GARBAGE", 0)
+    rng = random.Random(327)
+    keys = [f"k{i}" for i in range(300)] + ["", "ключ", "k" * 300]
+    values = ["", "v", "x" * 100, 0, 1.5, None, True, [1, "a"], {"n": {"m": [None]}}]
+    model, versions = {}, {}
+    slots_seen = set()
+    for step in range(20000):
+        key = rng.choice(keys)
+        op = rng.random()
+        if op < 0.5:
+            value = rng.choice(values)
+            version = rng.choice([None, rng.randrange(1, 2 ** 63)])
+            engine.put(key, value, version)
+            model[key] = value
+            if version is not None:
+                versions[key] = version
+            else:
+                versions.setdefault(key, 0)
+        elif op < 0.8:
+            if key in model:
+                del engine[key]
+                del model[key]
+                versions.pop(key, None)
+            else:
+                with pytest.raises(KeyError):
+                    del engine[key]
+        elif op < 0.9 and key in model:
+            version = rng.randrange(2 ** 63)
+            engine.versions[key] = version
+            versions[key] = version
+        else:
+            assert (key in engine) == (key in model)
+            assert engine.get(key) == model.get(key)
+        slots_seen.add(engine.stats()["index_slots"])
+        if step % 1000 == 0:
+            check_same(engine, model, versions)
+    check_same(engine, model, versions)
+    assert len(slots_seen) > 1  # the index was resized
+
+
+def test_probing_past_deleted_slots(engine):
+    for i in range(5):
+        engine[f"k{i}"] = i
+    for i in range(4):
+        del engine[f"k{i}"]
+    # Churn through deletes without growing: the index is rebuilt in place.
+    for n in range(200):
+        engine[f"t{n}"] = n
+        del engine[f"t{n}"]
+    assert engine.lookup("k4") == (4, 0)
+    assert "k0" not in engine
+    assert engine.stats()["index_slots"] == 8
+
+
+def test_compaction_keeps_live_records(engine, monkeypatch):
+    monkeypatch.setattr(kv_engine, "COMPACT_MIN_GARBAGE", 0)
+    for round_ in range(50):
+        for i in range(20):
+            engine.put(f"k{i}", f"value {round_}", round_)
+    stats = engine.stats()
+    assert stats["garbage_bytes"] * 2 <= stats["arena_bytes"]
+    assert engine.lookup("k7") == ("value 49", 49)
+
+
+def test_put_keeps_version_when_none(engine):
+    engine.put("k", "a", 5)
+    engine.put("k", "b")
+    assert engine.lookup("k") == ("b", 5)
+    engine["k"] = "c"
+    assert engine.versions["k"] == 5
+
+
+def test_key_too_long(engine):
+    with pytest.raises(ValueError):
+        engine.put("k" * 70000, "v")
+
+
+def test_open_engine(tmp_path):
+    assert isinstance(open_engine("dict", str(tmp_path)), DictEngine)
+    assert isinstance(open_engine("arena", str(tmp_path)), ArenaEngine)
+    open_engine("mmap", str(tmp_path)).close()
+    with pytest.raises(ValueError):
+        open_engine("lsm", str(tmp_path))
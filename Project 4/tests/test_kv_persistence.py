@@ -0,0 +1,140 @@
+import os
+import struct
+import zlib
+
+import pytest
+
+import kv_persistence
+from kv_engine import ArenaEngine
+from kv_persistence import (
+    KVPersistence, OP_DELETE, OP_PUT, OP_PUT_STR, encode_put, encode_record, iter_records, list_segments, recover,
+)
+
+
+def open_store(directory, store=None, versions=None):
+    store = {} if store is None else store
+    p = KVPersistence(str(directory), store, versions, sync_mode="off", snapshot_interval=0)
+    p.recover()
+    return p
+
+
+def segment_path(directory, segment):
+    return os.path.join(str(directory), f"wal.{segment:08d}.log")
+
+
+def test_records_round_trip():
+    buf = encode_put("a", "text", 3) + encode_put("b", {"x": [1, None]})
+    assert list(iter_records(buf)) == [
+        (OP_PUT_STR, "a", "text", 3),
+        (OP_PUT, "b", {"x": [1, None]}, 0),
+    ]
+
+
+@pytest.mark.parametrize("cut", [1, 5, 20, -1])
+def test_torn_tail_is_ignored(cut):
+    good = encode_put("a", "1") + encode_put("b", "2")
+    torn = encode_put("c", "3")
+    buf = good + torn[:cut]
+    assert [r[1] for r in iter_records(buf)] == ["a", "b"]
+
+
+def test_corrupt_record_stops_replay():
+    first, second, third = encode_put("a", "1"), bytearray(encode_put("b", "2")), encode_put("c", "3")
+    second[-1] ^= 0xFF
+    assert [r[1] for r in iter_records(first + bytes(second) + third)] == ["a"]
+
+
+def test_recover_after_torn_write(tmp_path):
+    p = open_store(tmp_path)
+    p.put("a", "1", 1)
+    p.put_many({"b": [2], "c": "3"}, {"b": 2})
+    p.close()
+    with open(segment_path(tmp_path, 1), "ab") as f:
+        f.write(encode_put("d", "4")[:-2])  # crash in the middle of a write
+
+    store, versions = {}, {}
+    p = open_store(tmp_path, store, versions)
+    assert store == {"a": "1", "b": [2], "c": "3"}
+    assert versions == {"a": 1, "b": 2}
+    # New writes go to a new segment, never after the torn tail.
+    assert p.wal.segment == 2
+    p.put("d", "4")
+    p.close()
+    store = {}
+    open_store(tmp_path, store).close()
+    assert store["d"] == "4"
+
+
+def test_older_version_is_not_applied(tmp_path):
+    store = {}
+    p = open_store(tmp_path, store)
+    assert p.put("k", "new", 5)
+    assert not p.put("k", "old", 4)
+    assert p.put_many({"k": "older", "j": "x"}, {"k": 3}) == ["j"]
+    assert store["k"] == "new"
+    p.close()
+
+
+def test_delete_record_round_trip():
+    buf = encode_put("a", "text", 3) + encode_record(OP_DELETE, "a", None, 3)
+    assert list(iter_records(buf)) == [(OP_PUT_STR, "a", "text", 3), (OP_DELETE, "a", None, 3)]
+
+
+def test_delete_many_is_replayed(tmp_path):
+    store, versions = {}, {}
+    p = open_store(tmp_path, store, versions)
+    p.put_many({"a": "1", "b": "2", "c": "3"}, {"a": 1, "b": 1, "c": 1})
+    p.put("b", "2'", 2)  # written since: must survive a delete at version 1
+    assert p.delete_many({"a": 1, "b": 1, "missing": 1}) == ["a"]
+    p.close()
+    store, versions = {}, {}
+    open_store(tmp_path, store, versions).close()
+    assert store == {"b": "2'", "c": "3"}
+    assert versions == {"b": 2, "c": 1}
+
+
+def test_snapshot_and_replay_with_engine(tmp_path):
+    engine = ArenaEngine()
+    p = open_store(tmp_path, engine, engine.versions)
+    p.put_many({f"k{i}": i for i in range(100)}, {f"k{i}": i + 1 for i in range(100)})
+    p.snapshot()
+    p.delete_many({"k0": 1})
+    p.put("k1", "after", 50)
+    p.close()
+    assert list_segments(str(tmp_path)) == [2]
+
+    engine = ArenaEngine()
+    stats = open_store(tmp_path, engine, engine.versions).recovery_stats
+    assert stats["snapshot_keys"] == 100
+    assert stats["replayed_records"] == 2
+    assert len(engine) == 99 and "k0" not in engine
+    assert engine.lookup("k1") == ("after", 50)
+    assert engine.lookup("k99") == (99, 100)
+
+
+def test_format1_files_are_converted(tmp_path):
+    def v1_record(op, key, value):
+        k, v = key.encode(), value.encode()
+        body = struct.pack("<BII", op, len(k), len(v)) + k + v
+        return struct.pack("<I", zlib.crc32(body)) + body
+
+    with open(tmp_path / "snapshot.bin", "wb") as f:
+        f.write(b"KVSNAP01" + struct.pack("<Q", 1) + v1_record(OP_PUT_STR, "a", "1"))
+    with open(segment_path(tmp_path, 1), "wb") as f:
+        f.write(v1_record(OP_PUT, "b", "[2]"))
+
+    store = {}
+    p = open_store(tmp_path, store)
+    p.close()
+    assert store == {"a": "1", "b": [2]}
+    assert p.recovery_stats["legacy_files"] == 2
+    with open(tmp_path / "snapshot.bin", "rb") as f:
+        assert f.read(8) == b"KVSNAP02"
+    assert 1 not in list_segments(str(tmp_path))  # the format 1 segment is covered by the snapshot
+
+
+def test_newer_format_is_refused(tmp_path):
+    with open(segment_path(tmp_path, 1), "wb") as f:
+        f.write(kv_persistence._WAL_HEADER.pack(b"KVWAL", kv_persistence.FORMAT_VERSION + 1))
+    with pytest.raises(ValueError):
+        recover(str(tmp_path), {}, {})
@@ -0,0 +1,131 @@
+import io
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def meta(node, tmp_path, monkeypatch):
+    """Membership files under tmp_path; the module's membership is restored afterwards."""
+    monkeypatch.setattr(node, "MEMBERSHIP_FILE", str(tmp_path / "membership.json"))
+    monkeypatch.setattr(node, "LEGACY_MEMBERSHIP_FILE", str(tmp_path / "_membership.json"))
+    monkeypatch.setattr(node, "CHUNK_DIR", str(tmp_path / "_chunks"))
+    for name in ("PEERS", "RING", "RING_TOKENS", "RING_VERSION", "MEMBERSHIP_EPOCH", "_ring_snapshot"):
+        monkeypatch.setattr(node, name, getattr(node, name))
+    return tmp_path
+
+
+def wait_for_rebalance(rebalancer, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while rebalancer.status()["state"] == "running":
+        assert time.monotonic() < deadline, "rebalance did not finish"
+        time.sleep(0.01)
+    return rebalancer.status()
+
+
+def test_load_membership(node, meta):
+    (meta / "membership.json").write_text(json.dumps({"peers": ["http://b:1", "http://a:1"], "epoch": 4}))
+    node.load_membership()
+    assert node.PEERS == ["http://a:1", "http://b:1"] and node.MEMBERSHIP_EPOCH == 4
+
+
+def test_legacy_membership_file_is_moved(node, meta):
+    (meta / "_membership.json").write_text(json.dumps({"peers": ["http://a:1"], "epoch": 2}))
+    node.load_membership()
+    assert node.PEERS == ["http://a:1"] and node.MEMBERSHIP_EPOCH == 2
+    assert not (meta / "_membership.json").exists() and (meta / "membership.json").exists()
+
+
+@pytest.mark.parametrize("saved", [
+    "not json",
+    "[]",
+    '{"epoch": 1}',
+    '{"peers": "http://a:1", "epoch": 1}',
+    '{"peers": [], "epoch": 1}',
+    '{"peers": [1], "epoch": 1}',
+    '{"peers": ["http://a:1"], "epoch": "1"}',
+    '{"peers": ["http://a:1"], "epoch": true}',
+    '{"peers": ["http://a:1"], "epoch": -1}',
+])
+def test_malformed_membership_is_ignored(node, meta, saved):
+    peers = node.PEERS
+    (meta / "membership.json").write_text(saved)
+    node.load_membership()
+    assert node.PEERS == peers and node.MEMBERSHIP_EPOCH == 0
+
+
+def test_membership_post_is_validated(node, meta):
+    client = node.app.test_client()
+    assert client.post("/membership", json={"peers": [""], "epoch": 1}).status_code == 400
+    assert client.post("/membership", json={"peers": ["http://a:1"], "epoch": False}).status_code == 400
+
+
+def test_reserved_upload_names_are_rejected(node, meta, monkeypatch):
+    monkeypatch.setattr(node, "STORAGE_DIR", str(meta))
+    client = node.app.test_client()
+    assert client.put("/upload/_meta", data=b"x").status_code == 400
+    assert client.put("/upload/.x.part", data=b"x", headers={"Content-Range": "bytes 0-0/2"}).status_code == 400
+    assert client.head("/upload/.x.part").status_code == 400
+    resp = client.post("/upload", data={"file": (io.BytesIO(b"{}"), "_membership.json")})
+    assert resp.status_code == 400
+    assert list(meta.iterdir()) == []
+
+
+def test_rebalance_moves_then_drops_keys(node, cluster, meta, monkeypatch):
+    # This node held every key alone; the four fake peers then joined.
+    items = {f"key-{i}": i for i in range(300)}
+    node.local_put_many(items, {key: 1 for key in items})
+    rebalancer = node.Rebalancer([node.SELF_URL])
+    monkeypatch.setattr(node, "rebalancer", rebalancer)
+    rebalancer.start([node.SELF_URL])
+
+    status = wait_for_rebalance(rebalancer)
+    assert status["state"] == "done" and status["errors"] == 0
+    not_owned = [key for key in items if node.SELF_URL not in node.find_replica_nodes(key)]
+    assert status["keys_no_longer_owned"] == status["keys_dropped"] == len(not_owned) > 0
+    for key, value in items.items():
+        replicas = node.find_replica_nodes(key)
+        assert all(cluster[url].store[key] == (value, 1) for url in replicas if url != node.SELF_URL)
+        assert (key in node.kv_store) == (node.SELF_URL in replicas)
+    assert rebalancer.stable_peers == node.PEERS
+    # Reads that find nothing may still ask the previous ring for a while.
+    assert rebalancer.previous_replicas("key-0") == [node.SELF_URL]
+
+
+def test_failed_rebalance_keeps_keys(node, cluster, meta, monkeypatch):
+    items = {f"key-{i}": i for i in range(100)}
+    node.local_put_many(items, {key: 1 for key in items})
+    down = sorted(cluster)[0]
+    cluster[down].down = True
+    rebalancer = node.Rebalancer([node.SELF_URL])
+    monkeypatch.setattr(node, "rebalancer", rebalancer)
+    rebalancer.start([node.SELF_URL])
+
+    assert wait_for_rebalance(rebalancer)["state"] == "failed"
+    assert rebalancer.stable_peers == [node.SELF_URL]
+    for key in items:
+        if down in node.find_replica_nodes(key):
+            assert key in node.kv_store
+
+
+def test_leave_and_join(node, cluster, meta, monkeypatch):
+    monkeypatch.setattr(node, "rebalancer", node.Rebalancer(node.PEERS))
+    client = node.app.test_client()
+    leaving = sorted(cluster)[-1]
+
+    body = client.post("/membership/leave", json={"url": leaving}).get_json()
+    assert body["status"] == "ok" and body["epoch"] == 1
+    assert node.PEERS == sorted(set(node.PEERS)) and leaving not in node.PEERS
+    assert all(peer.membership["epoch"] == 1 for peer in cluster.values())
+    assert cluster[leaving].membership["previous"] == sorted([node.SELF_URL, *cluster])
+    assert json.loads((meta / "membership.json").read_text()) == {"peers": node.PEERS, "epoch": 1}
+    wait_for_rebalance(node.rebalancer)
+
+    assert client.post("/membership/leave", json={"url": leaving}).status_code == 404
+    assert client.post("/membership/join", json={"url": node.SELF_URL}).status_code == 409
+    body = client.post("/membership/join", json={"url": leaving + "/"}).get_json()
+    assert body["epoch"] == 2 and leaving in node.PEERS
+    # An update from an older epoch is refused.
+    assert client.post("/membership", json={"peers": [node.SELF_URL], "epoch": 2}).status_code == 409
+    wait_for_rebalance(node.rebalancer)
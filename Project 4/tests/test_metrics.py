@@ -0,0 +1,26 @@
+from metrics import Registry
+
+
+def test_render():
+    registry = Registry()
+    requests = registry.counter("dht_requests_total", "Requests.", ("route",))
+    latency = registry.histogram("dht_latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    registry.gauge("dht_keys", "Keys.", lambda: 7)
+    registry.counter_func("dht_cache_hits_total", "Hits.", lambda: 3)
+    requests.inc("/kv")
+    requests.inc("/kv", amount=2)
+    requests.inc('a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    lines = registry.render().splitlines()
+    assert 'dht_requests_total{route="/kv"} 3' in lines
+    assert 'dht_requests_total{route="a\\"b"} 1' in lines
+    assert 'dht_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'dht_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'dht_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "dht_latency_seconds_count 3" in lines
+    assert "dht_latency_seconds_sum 5.550000" in lines
+    assert "# TYPE dht_keys gauge" in lines and "dht_keys 7" in lines
+    assert "# TYPE dht_cache_hits_total counter" in lines and "dht_cache_hits_total 3" in lines
@@ -0,0 +1,75 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+
+class FlakySession:
+    """Stands in for requests.Session: raises the queued errors, then answers 200."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        resp = requests.Response()
+        resp.status_code = 200
+        return resp
+
+
+def refused():
+    """A ConnectionError the way requests reports a refused connection."""
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "/", reason))
+
+
+@pytest.fixture
+def pool(node, monkeypatch):
+    monkeypatch.setattr(node, "FORWARD_BACKOFF", 0)
+    monkeypatch.setattr(node, "FORWARD_RETRIES", 2)
+    return node.PeerPool("http://node2:5000", size=2)
+
+
+def test_connect_failed(node):
+    assert node.connect_failed(requests.ConnectTimeout())
+    assert node.connect_failed(refused())
+    assert not node.connect_failed(requests.ConnectionError("Connection reset by peer"))
+    assert not node.connect_failed(requests.ConnectionError())
+
+
+@pytest.mark.parametrize("method", ["GET", "PUT", "DELETE"])
+def test_idempotent_methods_retry_broken_connections(pool, method):
+    pool.session = FlakySession([requests.ConnectionError("reset"), requests.ConnectionError("reset")])
+    assert pool.request(method, "http://node2:5000/kv/a").status_code == 200
+    assert pool.session.calls == 3
+    assert pool.stats()["retries"] == 2 and pool.stats()["errors"] == 0
+
+
+def test_post_retries_only_if_never_connected(pool):
+    pool.session = FlakySession([requests.ConnectTimeout(), refused()])
+    assert pool.request("POST", "http://node2:5000/kv/replica").status_code == 200
+    assert pool.session.calls == 3
+
+    # The peer may already have applied a POST whose connection broke.
+    pool.session = FlakySession([requests.ConnectionError("reset")])
+    with pytest.raises(requests.ConnectionError):
+        pool.request("POST", "http://node2:5000/kv/replica")
+    assert pool.session.calls == 1
+
+
+def test_read_timeouts_never_retry(pool):
+    pool.session = FlakySession([requests.ReadTimeout()])
+    with pytest.raises(requests.ReadTimeout):
+        pool.request("GET", "http://node2:5000/kv/a")
+    assert pool.session.calls == 1
+    assert pool.stats()["errors"] == 1
+
+
+def test_retries_are_bounded(pool):
+    pool.session = FlakySession([requests.ConnectTimeout()] * 5)
+    with pytest.raises(requests.ConnectTimeout):
+        pool.request("GET", "http://node2:5000/kv/a")
+    assert pool.session.calls == 3
+    assert pool.stats()["in_flight"] == 0
@@ -0,0 +1,121 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def local_key(node, i=0):
+    """A key this node replicates, and its two remote replicas."""
+    keys = (f"key-{n}" for n in range(10000))
+    key = [k for k in keys if node.SELF_URL in node.find_replica_nodes(k)][i]
+    return key, [url for url in node.find_replica_nodes(key) if url != node.SELF_URL]
+
+
+def eventually(check, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_defaults_overlap_reads_and_writes(node):
+    assert node.READ_QUORUM + node.WRITE_QUORUM > node.REPLICATION_FACTOR
+
+
+def test_write_then_read(node, cluster):
+    client = node.app.test_client()
+    key, remotes = local_key(node)
+    body = client.post("/kv", json={"key": key, "value": "v1"}).get_json()
+    assert body["status"] == "stored" and body["acks"] >= node.WRITE_QUORUM
+    eventually(lambda: all(key in cluster[url].store for url in remotes))
+    assert node.kv_store[key] == "v1"
+
+    body = client.get(f"/kv/{key}").get_json()
+    assert body["value"] == "v1" and body["version"] == node.kv_versions[key]
+
+
+def test_write_quorum_not_reached(node, cluster):
+    key, remotes = local_key(node)
+    for url in remotes:
+        cluster[url].down = True
+    resp = node.app.test_client().post("/kv", json={"key": key, "value": "v1"})
+    assert resp.status_code == 503
+    assert resp.get_json()["acks"] == 1
+
+
+def test_read_sees_write_this_replica_missed(node, cluster):
+    # The write reached W=2 replicas, not this one: R=2 still finds it.
+    key, remotes = local_key(node)
+    for url in remotes:
+        cluster[url].put(key, "v1", 5)
+
+    resp = node.app.test_client().get(f"/kv/{key}")
+    assert resp.status_code == 200
+    assert resp.get_json()["value"] == "v1"
+    # Read repair copies it to this node in the background.
+    eventually(lambda: node.kv_store.lookup(key) == ("v1", 5))
+
+
+def test_read_returns_newest_version(node, cluster):
+    key, remotes = local_key(node)
+    node.local_put(key, "old", 1)
+    for url in remotes:
+        cluster[url].put(key, "new", 2)
+
+    body = node.app.test_client().get(f"/kv/{key}").get_json()
+    assert body["value"] == "new" and body["version"] == 2
+    eventually(lambda: node.kv_store.lookup(key) == ("new", 2))
+
+
+def test_slow_replica_is_hedged(node, cluster, monkeypatch):
+    monkeypatch.setattr(node, "HEDGE_DELAY_MS", 10)
+    key, remotes = local_key(node)
+    node.local_put(key, "v1", 1)
+    for url in remotes:
+        cluster[url].put(key, "v1", 1)
+    first = node.by_latency(remotes)[0]
+    cluster[first].delay = 0.5
+
+    start = time.perf_counter()
+    body = node.app.test_client().get(f"/kv/{key}").get_json()
+    assert time.perf_counter() - start < 0.4
+    assert body["value"] == "v1" and body["hedged"] == 1
+    assert ("GET", f"/kv/replica/{key}") in cluster[[u for u in remotes if u != first][0]].calls
+
+
+def test_failed_replica_is_replaced(node, cluster):
+    key, remotes = local_key(node)
+    node.local_put(key, "v1", 1)
+    cluster[node.by_latency(remotes)[0]].down = True
+    body = node.app.test_client().get(f"/kv/{key}").get_json()
+    assert body["value"] == "v1"
+
+
+def test_read_quorum_not_reached(node, cluster):
+    key, remotes = local_key(node)
+    node.local_put(key, "v1", 1)
+    for url in remotes:
+        cluster[url].down = True
+    resp = node.app.test_client().get(f"/kv/{key}")
+    assert resp.status_code == 503
+    assert resp.get_json()["responses"] == 1
+
+
+def test_not_found(node, cluster):
+    key, _ = local_key(node)
+    assert node.app.test_client().get(f"/kv/{key}").status_code == 404
+
+
+def test_revocation_from_a_busy_fanout_pool(node, cluster, monkeypatch):
+    # A replica write running on the only fan-out thread must not wait for
+    # a revocation queued behind it on that same pool.
+    monkeypatch.setattr(node, "KV_LEASE_REVOKE_TIMEOUT", 2.0)
+    monkeypatch.setattr(node, "fanout_executor", ThreadPoolExecutor(max_workers=1))
+    key, _ = local_key(node)
+    holder = sorted(cluster)[0]
+    node.local_put(key, "v1", 1)
+    assert node.leases.grant(key, holder, 5.0) > 0
+
+    start = time.perf_counter()
+    assert node.fanout_executor.submit(node.replica_write, node.SELF_URL, key, "v2", 2).result()
+    assert time.perf_counter() - start < 1.0
+    assert ("POST", "/kv/cache/invalidate") in cluster[holder].calls
+    node.fanout_executor.shutdown()
@@ -0,0 +1,51 @@
+def linear_owner(ring, key_id):
+    """The first virtual node clockwise from key_id, found by scanning."""
+    for vnode in ring:
+        if vnode["id"] >= key_id:
+            return vnode
+    return ring[0]
+
+
+def test_bisect_lookup_matches_linear_scan(node):
+    ring, _ = node._ring_snapshot
+    assert len(ring) == 3 * node.VNODES
+    for i in range(2000):
+        key = f"key-{i}"
+        assert node.find_responsible_node(key) is linear_owner(ring, node.sha1_to_int(key))
+
+
+def test_lookup_wraps_around(node):
+    ring, tokens = node._ring_snapshot
+    key = next(f"key-{i}" for i in range(100000) if node.sha1_to_int(f"key-{i}") > tokens[-1])
+    assert node.find_responsible_node(key) is ring[0]
+
+
+def test_replicas_are_distinct_successors(node):
+    for i in range(500):
+        key = f"key-{i}"
+        replicas = node.find_replica_nodes(key)
+        assert len(replicas) == len(set(replicas)) == node.REPLICATION_FACTOR
+        assert replicas[0] == node.find_responsible_node(key)["url"]
+
+
+def test_replicas_capped_at_peer_count(node, monkeypatch):
+    peers = node.PEERS[:2]
+    ring = node.build_ring(peers)
+    monkeypatch.setattr(node, "_ring_snapshot", (ring, [n["id"] for n in ring]))
+    assert sorted(node.find_replica_nodes("a")) == peers
+
+
+def test_load_report(node):
+    ring, _ = node._ring_snapshot
+    report = node.ring_load_report(ring)
+    assert set(report) == set(node.PEERS)
+    assert all(entry["vnodes"] == node.VNODES for entry in report.values())
+    assert abs(sum(entry["ownership"] for entry in report.values()) - 1.0) < 1e-4
+    # With 64 virtual nodes each, no peer is far from a third of the ring.
+    assert all(0.2 < entry["ownership"] < 0.5 for entry in report.values())
+
+
+def test_ring_version_tracks_peers(node):
+    assert node.ring_version(["a", "b"]) == node.ring_version(["b", "a"])
+    assert node.ring_version(["a", "b"]) != node.ring_version(["a", "b", "c"])
+    assert node.ring_version(["a"], vnodes=8) != node.ring_version(["a"], vnodes=16)